@@ -1,8 +1,38 @@
+import os
+import importlib
+import threading
 import streamlit as st
 
-from backend.basic_chat.chat_app import chat_interface
-from backend.text_to_image.generate_image_app import generate_image_interface
-from backend.pdf_to_text.pdf_services_app import pdf_chat_interface
+from backend.metrics import start_metrics_server
+
+# Feature pages are imported only when selected, so starting the app (or
+# only chatting) does not pay for torch, diffusers or the PDF stack.
+FEATURES = {
+    "💬 Chat Assistant": ("backend.basic_chat.chat_app", "chat_interface"),
+    "🖼️ Text to Image": ("backend.text_to_image.generate_image_app", "generate_image_interface"),
+    # Future features here
+    "📄 PDF Chat": ("backend.pdf_to_text.pdf_services_app", "pdf_chat_interface"),
+    "📊 Diagnostics": ("backend.diagnostics_app", "diagnostics_interface"),
+    # "🎥 Video Generator",
+    # "🧠 Agents"
+}
+
+
+def load_feature(feature: str):
+    module_name, function_name = FEATURES[feature]
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def _warm_up_image_pipeline():
+    from backend.text_to_image.multimodels import get_pipeline_manager
+    get_pipeline_manager().warm_up()
+
+
+@st.cache_resource
+def start_image_warmup():
+    # Once per server process, in the background so the first page is not blocked
+    threading.Thread(target=_warm_up_image_pipeline, name="image-warmup-import", daemon=True).start()
+    return True
 
 
 def main():
@@ -12,6 +42,13 @@ def main():
         layout="wide"
     )
 
+    # Prometheus endpoint when METRICS_PORT is set (once per process)
+    start_metrics_server()
+
+    # Opt-in: load the image model at startup instead of when its page is first opened
+    if os.getenv("IMAGE_PIPELINE_WARMUP", "0") == "1":
+        start_image_warmup()
+
     # -------- Sidebar --------
     with st.sidebar:
         st.markdown("## 🤖 AI Khichuri")
@@ -19,27 +56,14 @@ def main():
 
         feature = st.radio(
             "Choose a feature",
-            [
-                "💬 Chat Assistant",
-                "🖼️ Text to Image",
-                # Future features here
-                "📄 PDF Chat",
-                # "🎥 Video Generator",
-                # "🧠 Agents"
-            ]
+            list(FEATURES)
         )
 
         st.divider()
         st.caption("More features coming soon 🚀")
 
     # -------- Main Content --------
-    if feature == "💬 Chat Assistant":
-        chat_interface(st)
-
-    elif feature == "🖼️ Text to Image":
-        generate_image_interface(st)
-    elif feature == "📄 PDF Chat":
-        pdf_chat_interface(st)
+    load_feature(feature)(st)
 
 
 if __name__ == "__main__":
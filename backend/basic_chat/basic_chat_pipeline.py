@@ -0,0 +1,531 @@
+"""
+UI-independent chat engine.
+
+ChatPipeline owns model selection (single provider, response cache and
+multi-provider routing), context building, invocation and persistence.
+The Streamlit page in chat_app.py is a thin client of it, and the batch
+entry point below drives it headlessly:
+
+    python -m backend.basic_chat.basic_chat_pipeline batch.jsonl \
+        --provider groq --concurrency 8 --output results.jsonl
+
+Each input line is a JSON object:
+
+    {"user_name": "alice", "message": "Hello!"}
+    {"user_name": "alice", "conversation_id": "<existing id>", "message": "..."}
+
+Requests without conversation_id share one new conversation per user.
+Requests of the same conversation run in order; different conversations
+run concurrently.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from pymongo.database import Database
+
+from backend.basic_chat.chat_model import get_chat_model, stream_response_from_model
+from backend.basic_chat.context_builder import (
+    build_context,
+    get_token_budget,
+    message_tokens,
+    summarize_messages,
+    SUMMARY_CHUNK_TOKENS,
+)
+from backend.basic_chat.history_management import (
+    get_mongodb_database,
+    create_user,
+    create_new_chat,
+    get_conversation_records,
+    get_conversation_window,
+    append_messages_to_conversation,
+)
+from backend.basic_chat.message_record import (
+    MessageRecord,
+    SYSTEM,
+    USER,
+    ASSISTANT,
+    message_id,
+    to_langchain_messages,
+)
+from backend.basic_chat.model_router import ModelRouter
+from backend.basic_chat.response_cache import CachedChatModel, get_response_cache
+from backend.metrics import measure
+
+load_dotenv()
+
+PROVIDER_MODELS = {
+    "groq": [
+        "llama-3.1-8b-instant",
+        "llama-3.1-70b-versatile",
+        "mixtral-8x7b-32768"
+    ],
+    "gemini": [
+        "gemini-2.5-flash",
+        "gemini-1.5-pro",
+        "gemini-1.0-pro"
+    ],
+    "huggingface": [
+        "openai/gpt-oss-20b",
+        "meta-llama/Llama-2-7b-chat-hf",
+        "tiiuae/falcon-7b-instruct"
+    ]
+}
+
+PROVIDER_KEY_MAP = {
+    "groq": "GROQ_API_KEY",
+    "gemini": "GEMINI_API_KEY",
+    "huggingface": "HF_TOKEN",
+}
+
+ROUTING_OPTIONS = ["single", "fallback", "hedged", "race"]
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant."
+
+# Messages loaded when a chat is opened, and per "show earlier" page
+HISTORY_WINDOW_SIZE = int(os.getenv("CHAT_HISTORY_WINDOW", "50"))
+
+# Rolling summaries per conversation: conversation_id -> (summary, seq of the first unsummarized message).
+# LRU-bounded; an evicted conversation starts a new summary at its loaded window.
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "1000"))
+_summaries: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+_summaries_lock = threading.Lock()
+
+
+def _get_summary(conversation_id: str) -> Optional[Tuple[str, int]]:
+    with _summaries_lock:
+        entry = _summaries.get(conversation_id)
+        if entry is not None:
+            _summaries.move_to_end(conversation_id)
+        return entry
+
+
+def _set_summary(conversation_id: str, entry: Tuple[str, int], replace: bool = True) -> None:
+    with _summaries_lock:
+        if replace or conversation_id not in _summaries:
+            _summaries[conversation_id] = entry
+        _summaries.move_to_end(conversation_id)
+        while len(_summaries) > SUMMARY_CACHE_SIZE:
+            _summaries.popitem(last=False)
+
+
+def get_api_key(provider: str) -> str:
+    """
+    API key of a provider from the environment ("" if not set).
+    """
+    env_key_name = PROVIDER_KEY_MAP.get(provider)
+    return os.getenv(env_key_name, "") if env_key_name else ""
+
+
+class ChatPipeline:
+    def __init__(
+        self,
+        db: Database,
+        provider: str = "groq",
+        model_name: str = "llama-3.1-8b-instant",
+        temperature: float = 0.3,
+        api_key: Optional[str] = None,
+        routing_mode: str = "single",
+        use_response_cache: bool = True,
+        summarize_history: bool = False,
+    ):
+        """
+        api_key: defaults to the provider key from the environment.
+        routing_mode: "single" or a ModelRouter mode; other providers with
+        a configured key are used as fallbacks with their default model.
+        """
+        if routing_mode not in ROUTING_OPTIONS:
+            raise ValueError(f"Unsupported routing mode: {routing_mode}")
+        self.db = db
+        self.provider = provider
+        self.model_name = model_name
+        self.temperature = temperature
+        self.api_key = get_api_key(provider) if api_key is None else api_key
+        self.routing_mode = routing_mode
+        self.use_response_cache = use_response_cache
+        self.summarize_history = summarize_history
+
+    # -------------------------------
+    # Model selection
+    # -------------------------------
+    def get_base_model(self):
+        return get_chat_model(
+            provider=self.provider,
+            api_key=self.api_key,
+            model_name=self.model_name,
+            temperature=self.temperature
+        )
+
+    def get_answer_model(self):
+        """
+        The model that answers: the selected one, optionally behind a
+        router across providers and the response cache.
+        """
+        model = self.get_base_model()
+
+        if self.routing_mode != "single":
+            # Selected model first, then the default model of every other configured provider
+            candidates = [(f"{self.provider}:{self.model_name}", model)]
+            for other, models in PROVIDER_MODELS.items():
+                other_key = get_api_key(other)
+                if other != self.provider and other_key:
+                    candidates.append((
+                        f"{other}:{models[0]}",
+                        get_chat_model(
+                            provider=other,
+                            api_key=other_key,
+                            model_name=models[0],
+                            temperature=self.temperature
+                        )
+                    ))
+            model = ModelRouter(candidates, mode=self.routing_mode)
+
+        if self.use_response_cache:
+            model = CachedChatModel(
+                model,
+                get_response_cache(),
+                {"provider": self.provider, "model_name": self.model_name, "temperature": self.temperature}
+            )
+        return model
+
+    # -------------------------------
+    # Conversations
+    # -------------------------------
+    def create_chat(self, user_name: str, title: str = "New Chat") -> Tuple[str, List]:
+        """
+        Create a conversation and return (conversation_id, messages).
+        """
+        conversation_id = create_new_chat(
+            user_name=user_name,
+            db=self.db,
+            title=title,
+            system_prompt=DEFAULT_SYSTEM_PROMPT
+        )
+        return conversation_id, [MessageRecord(SYSTEM, DEFAULT_SYSTEM_PROMPT, message_id(conversation_id, 0))]
+
+    def load_history(self, user_name: str, conversation_id: str) -> List[MessageRecord]:
+        return get_conversation_records(
+            user_name=user_name,
+            conversation_id=conversation_id,
+            db=self.db
+        )
+
+    def load_window(
+        self,
+        user_name: str,
+        conversation_id: str,
+        limit: int = HISTORY_WINDOW_SIZE
+    ) -> Tuple[List, int]:
+        """
+        The system prompt and the newest `limit` messages of a conversation.
+        Returns (messages, first_seq), where first_seq is the seq of
+        messages[1]; pass both to load_earlier and stream_reply.
+        """
+        window = get_conversation_window(user_name, conversation_id, self.db, limit=limit)
+        return window["messages"], window["first_seq"]
+
+    def load_earlier(
+        self,
+        user_name: str,
+        conversation_id: str,
+        messages: List,
+        first_seq: int,
+        limit: int = HISTORY_WINDOW_SIZE
+    ) -> int:
+        """
+        Insert up to `limit` older messages after the system prompt of a
+        windowed history, in place. Returns the new first_seq.
+        """
+        if first_seq <= 1:
+            return first_seq
+        window = get_conversation_window(
+            user_name, conversation_id, self.db, limit=limit, before_seq=first_seq
+        )
+        messages[1:1] = window["messages"]
+        return window["first_seq"]
+
+    def fill_context_window(
+        self,
+        user_name: str,
+        conversation_id: str,
+        messages: List,
+        first_seq: int
+    ) -> int:
+        """
+        Load older messages into a windowed history until it covers the
+        model's token budget, so the model sees the same recent context as
+        with the full history. Returns the new first_seq.
+
+        When summarizing, messages after the stored summary position are
+        loaded too (they still have to be folded in). A conversation
+        without a summary in this process starts its summary at the loaded
+        window, so the rest of the history is never read.
+        """
+        budget = get_token_budget(self.model_name)
+        summarized_upto = None
+        if self.summarize_history:
+            entry = _get_summary(conversation_id)
+            summarized_upto = entry[1] if entry else None
+
+        while first_seq > 1:
+            unsummarized = summarized_upto is not None and first_seq > summarized_upto
+            if not unsummarized and sum(message_tokens(msg) for msg in messages) >= budget:
+                break
+            previous = first_seq
+            first_seq = self.load_earlier(user_name, conversation_id, messages, first_seq)
+            if first_seq == previous:
+                break
+
+        if self.summarize_history and summarized_upto is None:
+            _set_summary(conversation_id, ("", first_seq), replace=False)
+        return first_seq
+
+    def build_context(self, conversation_id: str, messages: List, first_seq: int = 1) -> List:
+        """
+        Messages to send for this turn: the recent turns that fit the token
+        budget, plus the rolling summary of older ones when enabled.
+        `first_seq` is the seq of messages[1] when `messages` is a window.
+        Returns LangChain messages, ready for the model.
+        """
+        if not self.summarize_history:
+            return to_langchain_messages(build_context(messages, self.model_name)[0])
+
+        summary, summarized_upto = _get_summary(conversation_id) or ("", 1)
+
+        context, first_kept = build_context(messages, self.model_name, summary)
+        # Indexes in `messages` <-> seqs in the conversation
+        kept_seq = first_seq + first_kept - 1
+        if kept_seq > summarized_upto:
+            summary = summarize_messages(
+                self.get_base_model(),
+                summary,
+                messages[max(summarized_upto - first_seq + 1, 1):first_kept],
+                # Leave room for the prompt, the summary and the reply
+                chunk_tokens=min(SUMMARY_CHUNK_TOKENS, get_token_budget(self.model_name) // 2)
+            )
+            _set_summary(conversation_id, (summary, kept_seq))
+            context, first_kept = build_context(messages, self.model_name, summary)
+        return to_langchain_messages(context)
+
+    # -------------------------------
+    # Turns
+    # -------------------------------
+    def stream_reply(
+        self,
+        user_name: str,
+        conversation_id: str,
+        messages: List,
+        user_input: str,
+        stats: Optional[Dict] = None,
+        first_seq: int = 1
+    ) -> Iterator[str]:
+        """
+        Run one chat turn and stream the reply as text chunks.
+
+        `messages` is the conversation so far (MessageRecords) and is
+        extended in place with the user and assistant messages; both are
+        persisted once the stream completes. If the turn fails, they are
+        removed again and the exception is re-raised.
+        When `messages` is a window from load_window, pass its first_seq
+        (after fill_context_window).
+
+        `stats` receives the stream_response_from_model metrics plus
+        "cache_hit" and "provider" (the provider:model that answered) of
+        this turn.
+        """
+        stats = {} if stats is None else stats
+        seq = first_seq + len(messages) - 1
+        messages.append(MessageRecord(USER, user_input, message_id(conversation_id, seq)))
+
+        try:
+            with measure("chat.build_context"):
+                context = self.build_context(conversation_id, messages, first_seq)
+            model = self.get_answer_model()
+            yield from stream_response_from_model(model, context, stats)
+        except BaseException:
+            # Nothing was stored; keep the history in step with the store
+            messages.pop()
+            raise
+
+        # The cache and router are built per turn, so their state is this turn's
+        stats["cache_hit"] = isinstance(model, CachedChatModel) and model.last_hit
+        router = model.model if isinstance(model, CachedChatModel) else model
+        stats["provider"] = (
+            router.last_provider if isinstance(router, ModelRouter)
+            else f"{self.provider}:{self.model_name}"
+        )
+
+        messages.append(MessageRecord(ASSISTANT, stats["content"], message_id(conversation_id, seq + 1)))
+        try:
+            append_messages_to_conversation(
+                user_name=user_name,
+                conversation_id=conversation_id,
+                messages=messages[-2:],
+                start_seq=seq,
+                db=self.db
+            )
+        except BaseException:
+            del messages[-2:]
+            raise
+
+    def chat(
+        self,
+        user_name: str,
+        conversation_id: str,
+        user_input: str,
+        messages: Optional[List] = None
+    ) -> Tuple[str, Dict]:
+        """
+        Run one chat turn without streaming and return (reply, stats).
+        The history is loaded from the store when `messages` is None.
+        """
+        if messages is None:
+            messages = self.load_history(user_name, conversation_id)
+        stats = {}
+        for _ in self.stream_reply(user_name, conversation_id, messages, user_input, stats):
+            pass
+        return stats["content"], stats
+
+
+# -----------------------------
+# Batch entry point
+# -----------------------------
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def load_batch(path: str) -> List[Dict]:
+    requests = []
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            if not request.get("user_name") or not request.get("message"):
+                raise ValueError(f"Line {line_number}: user_name and message are required")
+            request["line"] = line_number
+            requests.append(request)
+    return requests
+
+
+def _run_conversation(pipeline: ChatPipeline, requests: List[Dict]) -> List[Dict]:
+    # Turns of one conversation must run in order on the same history
+    user_name = requests[0]["user_name"]
+    conversation_id = requests[0].get("conversation_id", "")
+    results = []
+
+    try:
+        if conversation_id:
+            messages = pipeline.load_history(user_name, conversation_id)
+        else:
+            create_user(user_name, pipeline.db)
+            conversation_id, messages = pipeline.create_chat(
+                user_name,
+                title=requests[0].get("title", "Batch Chat")
+            )
+    except Exception as exc:
+        return [{"line": r["line"], "user_name": user_name, "error": repr(exc)} for r in requests]
+
+    for request in requests:
+        result = {
+            "line": request["line"],
+            "user_name": user_name,
+            "conversation_id": conversation_id,
+            "message": request["message"],
+        }
+        start = time.perf_counter()
+        try:
+            reply, stats = pipeline.chat(user_name, conversation_id, request["message"], messages)
+            result["reply"] = reply
+            result["time_to_first_token"] = stats["time_to_first_token"]
+            result["provider"] = stats["provider"]
+            result["cache_hit"] = stats["cache_hit"]
+        except Exception as exc:
+            result["error"] = repr(exc)
+        result["latency_s"] = time.perf_counter() - start
+        results.append(result)
+    return results
+
+
+def run_batch(
+    pipeline: ChatPipeline,
+    requests: List[Dict],
+    concurrency: int = 4
+) -> Dict:
+    """
+    Process chat requests with at most `concurrency` conversations in flight.
+    Returns the per-request results and a report with throughput and
+    p50/p95 latency.
+    """
+    conversations: Dict[Tuple[str, str], List[Dict]] = {}
+    for request in requests:
+        key = (request["user_name"], request.get("conversation_id", ""))
+        conversations.setdefault(key, []).append(request)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        batches = executor.map(
+            lambda group: _run_conversation(pipeline, group),
+            conversations.values()
+        )
+        results = [result for batch in batches for result in batch]
+    elapsed = time.perf_counter() - start
+
+    results.sort(key=lambda result: result["line"])
+    latencies = [r["latency_s"] for r in results if "error" not in r]
+    report = {
+        "requests": len(results),
+        "succeeded": len(latencies),
+        "failed": len(results) - len(latencies),
+        "elapsed_s": elapsed,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_latency_s": percentile(latencies, 50),
+        "p95_latency_s": percentile(latencies, 95),
+    }
+    return {"results": results, "report": report}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run chat requests from a JSONL file")
+    parser.add_argument("path", help="JSONL file with user_name, message and optional conversation_id")
+    parser.add_argument("--provider", default="groq", choices=list(PROVIDER_MODELS))
+    parser.add_argument("--model", default="")
+    parser.add_argument("--temperature", type=float, default=0.3)
+    parser.add_argument("--routing", default="single", choices=ROUTING_OPTIONS)
+    parser.add_argument("--no-cache", action="store_true", help="Disable the response cache")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--output", default="", help="Write per-request results to this JSONL file")
+    args = parser.parse_args()
+
+    model_name = args.model or PROVIDER_MODELS[args.provider][0]
+    pipeline = ChatPipeline(
+        db=get_mongodb_database(),
+        provider=args.provider,
+        model_name=model_name,
+        temperature=args.temperature,
+        routing_mode=args.routing,
+        use_response_cache=not args.no_cache,
+    )
+
+    outcome = run_batch(pipeline, load_batch(args.path), args.concurrency)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            for result in outcome["results"]:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    print(json.dumps(outcome["report"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
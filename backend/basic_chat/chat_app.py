@@ -1,23 +1,38 @@
 import streamlit as st
-import os
 from dotenv import load_dotenv
 
-from langchain.messages import SystemMessage, HumanMessage, AIMessage
+from backend.basic_chat.message_record import USER, ASSISTANT
 from backend.basic_chat.history_management import (
-    get_mongodb_collection,
+    get_mongodb_database,
     create_user,
-    save_message_to_conversation,
-    get_chat_titles,
-    get_conversation_history,
+    get_chat_titles_page,
     update_title,
-    create_new_chat,
     get_current_chat_title,
     delete_conversation
 )
-from backend.basic_chat.chat_model import get_chat_model
+from backend.basic_chat.chat_model import message_text
+from backend.basic_chat.basic_chat_pipeline import (
+    ChatPipeline,
+    HISTORY_WINDOW_SIZE,
+    PROVIDER_MODELS,
+    PROVIDER_KEY_MAP,
+    ROUTING_OPTIONS,
+    get_api_key,
+)
 
 load_dotenv()
 
+CHAT_TITLES_PAGE_SIZE = 20
+
+
+def open_conversation(session_state, conversation_id: str, messages, first_seq: int = 1) -> None:
+    """
+    Make a (windowed) history the active chat and reset its display state.
+    """
+    session_state.conversation_id = conversation_id
+    session_state.messages = messages
+    session_state.first_seq = first_seq
+    session_state.visible_messages = HISTORY_WINDOW_SIZE
 
 
 def chat_interface(st):
@@ -27,7 +42,7 @@ def chat_interface(st):
     # -------------------------------
     # MongoDB
     # -------------------------------
-    collection = get_mongodb_collection()
+    db = get_mongodb_database()
 
     # -------------------------------
     # Sidebar – User Login
@@ -38,7 +53,7 @@ def chat_interface(st):
 
         if st.button("Login / Create"):
             if user_name:
-                create_user(user_name, collection)  # safe if exists
+                create_user(user_name, db)  # safe if exists
                 st.session_state.user_name = user_name
                 st.success(f"Logged in as {user_name}")
                 st.rerun()
@@ -52,61 +67,64 @@ def chat_interface(st):
     # -------------------------------
     # Provider & Model Selection
     # -------------------------------
-    provider_models = {
-        "groq": [
-            "llama-3.1-8b-instant",
-            "llama-3.1-70b-versatile",
-            "mixtral-8x7b-32768"
-        ],
-        "gemini": [
-            "gemini-2.5-flash",
-            "gemini-1.5-pro",
-            "gemini-1.0-pro"
-        ],
-        "huggingface": [
-            "openai/gpt-oss-20b",
-            "meta-llama/Llama-2-7b-chat-hf",
-            "tiiuae/falcon-7b-instruct"
-        ]
-    }
-
     with st.expander("🤖 Model Configuration"):
         col1, col2, col3 = st.columns(3)
 
         with col1:
-            provider = st.selectbox("Provider", list(provider_models.keys()))
+            provider = st.selectbox("Provider", list(PROVIDER_MODELS.keys()))
 
         with col2:
-            model_name = st.selectbox("Model", provider_models[provider])
+            model_name = st.selectbox("Model", PROVIDER_MODELS[provider])
 
         with col3:
             temperature = st.slider("Temperature", 0.0, 1.0, 0.3)
 
+        summarize_history = st.checkbox(
+            "Summarize older messages that no longer fit the context window",
+            value=False
+        )
+        use_response_cache = st.checkbox(
+            "Reuse cached answers for repeated questions",
+            value=True
+        )
+        routing_mode = st.selectbox(
+            "Routing",
+            ROUTING_OPTIONS,
+            help=(
+                "fallback: switch to another provider on errors or timeouts · "
+                "hedged: also ask another provider if the first is slow · "
+                "race: ask all providers, use the first answer"
+            )
+        )
+
     # -------------------------------
     # API Key (from .env)
     # -------------------------------
-    PROVIDER_KEY_MAP = {
-        "groq": "GROQ_API_KEY",
-        "gemini": "GEMINI_API_KEY",
-        "huggingface": "HF_TOKEN",
-    }
-
-    env_key_name = PROVIDER_KEY_MAP.get(provider)
-    api_key = os.getenv(env_key_name)
+    api_key = get_api_key(provider)
 
     if not api_key:
         st.error(
-            f"{env_key_name} not found in .env file. "
+            f"{PROVIDER_KEY_MAP[provider]} not found in .env file. "
             f"Please set it before continuing."
         )
         return
 
+    pipeline = ChatPipeline(
+        db=db,
+        provider=provider,
+        model_name=model_name,
+        temperature=temperature,
+        api_key=api_key,
+        routing_mode=routing_mode,
+        use_response_cache=use_response_cache,
+        summarize_history=summarize_history
+    )
+
     # -------------------------------
     # Conversation Setup
     # -------------------------------
     if "conversation_id" not in st.session_state:
-        st.session_state.conversation_id = ""
-        st.session_state.messages = []
+        open_conversation(st.session_state, "", [])
 
     # -------------------------------
     # Sidebar – Chat List
@@ -115,24 +133,30 @@ def chat_interface(st):
         st.header(f"💬 Chats : Logged in as {st.session_state.user_name}")
 
         if st.button("➕ New Chat", use_container_width=True):
-            conv_id = create_new_chat(
-                user_name=st.session_state.user_name,
-                collection=collection,
-                title="New Chat",
-                system_prompt="You are a helpful assistant."
-            )
-            st.session_state.conversation_id = conv_id
-            st.session_state.messages = [
-                SystemMessage(content="You are a helpful assistant.")
-            ]
+            conv_id, messages = pipeline.create_chat(st.session_state.user_name)
+            open_conversation(st.session_state, conv_id, messages)
             st.rerun()
 
         st.divider()
 
-        chat_titles = get_chat_titles(
-            st.session_state.user_name,
-            collection
-        )
+        # Titles are loaded page by page; "Load more" fetches the next page
+        if "chat_title_pages" not in st.session_state:
+            st.session_state.chat_title_pages = 1
+
+        chat_titles = []
+        cursor = ""
+        for _ in range(st.session_state.chat_title_pages):
+            page = get_chat_titles_page(
+                st.session_state.user_name,
+                db,
+                limit=CHAT_TITLES_PAGE_SIZE,
+                cursor=cursor
+            )
+            chat_titles.extend(page["items"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+
         st.subheader("Chats history")
         for chat in chat_titles:
             chat_id = chat["conversation_id"]
@@ -152,12 +176,12 @@ def chat_interface(st):
                     use_container_width=True,
                     type="primary" if is_active else "secondary"
                 ):
-                    st.session_state.conversation_id = chat_id
-                    st.session_state.messages = get_conversation_history(
-                        user_name=st.session_state.user_name,
-                        conversation_id=chat_id,
-                        collection=collection
+                    # Only the newest messages; older ones load on "show earlier"
+                    messages, first_seq = pipeline.load_window(
+                        st.session_state.user_name,
+                        chat_id
                     )
+                    open_conversation(st.session_state, chat_id, messages, first_seq)
                     st.rerun()
 
             # 🗑️ Delete button
@@ -166,7 +190,7 @@ def chat_interface(st):
                     delete_conversation(
                         user_name=st.session_state.user_name,
                         conversation_id=chat_id,
-                        collection=collection
+                        db=db
                     )
 
                     # If deleted chat was active → reset
@@ -176,13 +200,17 @@ def chat_interface(st):
 
                     st.rerun()
 
+        if cursor and st.button("Load more", use_container_width=True):
+            st.session_state.chat_title_pages += 1
+            st.rerun()
+
     # -------------------------------
     # Chat Title Edit
     # -------------------------------
     current_title = get_current_chat_title(
         st.session_state.user_name,
         st.session_state.conversation_id,
-        collection
+        db
     )
     st.session_state.current_title = current_title
 
@@ -200,7 +228,7 @@ def chat_interface(st):
                     user_name=st.session_state.user_name,
                     conversation_id=st.session_state.conversation_id,
                     title=new_title.strip(),
-                    collection=collection
+                    db=db
                 )
                 st.success("Title updated")
                 st.rerun()
@@ -209,13 +237,29 @@ def chat_interface(st):
     # -------------------------------
     # Display Chat History
     # -------------------------------
-    for msg in st.session_state.messages:
-        if isinstance(msg, HumanMessage):
-            with st.chat_message("user"):
-                st.markdown(msg.content)
-        elif isinstance(msg, AIMessage):
-            with st.chat_message("assistant"):
-                st.markdown(msg.content)
+    # Only the last visible_messages are rendered, so a rerun costs the
+    # same however long the conversation is. messages[0] is the system prompt.
+    messages = st.session_state.messages
+    first_visible = max(1, len(messages) - st.session_state.visible_messages)
+
+    if first_visible > 1 or st.session_state.first_seq > 1:
+        if st.button("⬆️ Show earlier messages", use_container_width=True):
+            st.session_state.visible_messages += HISTORY_WINDOW_SIZE
+            if st.session_state.visible_messages > len(messages) - 1:
+                st.session_state.first_seq = pipeline.load_earlier(
+                    st.session_state.user_name,
+                    st.session_state.conversation_id,
+                    messages,
+                    st.session_state.first_seq
+                )
+            st.rerun()
+
+    for index in range(first_visible, len(messages)):
+        msg = messages[index]
+        if msg.role not in (USER, ASSISTANT):
+            continue
+        with st.chat_message("user" if msg.role == USER else "assistant"):
+            st.markdown(message_text(msg))
 
     # -------------------------------
     # Chat Input
@@ -223,29 +267,42 @@ def chat_interface(st):
     user_input = st.chat_input("Type your message...")
 
     if user_input:
-        human_msg = HumanMessage(content=user_input)
-        st.session_state.messages.append(human_msg)
-
         with st.chat_message("user"):
             st.markdown(user_input)
 
-        model = get_chat_model(
-            provider=provider,
-            api_key=api_key,
-            model_name=model_name,
-            temperature=temperature
+        # The model gets the same context as with the full history
+        st.session_state.first_seq = pipeline.fill_context_window(
+            st.session_state.user_name,
+            st.session_state.conversation_id,
+            st.session_state.messages,
+            st.session_state.first_seq
         )
 
-        response = model.invoke(st.session_state.messages)
-        ai_msg = AIMessage(content=response.content)
-        st.session_state.messages.append(ai_msg)
-
+        # Tokens are rendered as they arrive; the pipeline stores the turn once complete
+        stats = {}
         with st.chat_message("assistant"):
-            st.markdown(response.content)
-
-        save_message_to_conversation(
-            user_name=st.session_state.user_name,
-            conversation_id=st.session_state.conversation_id,
-            messages=st.session_state.messages,
-            collection=collection
-        )
+            try:
+                st.write_stream(
+                    pipeline.stream_reply(
+                        st.session_state.user_name,
+                        st.session_state.conversation_id,
+                        st.session_state.messages,
+                        user_input,
+                        stats,
+                        st.session_state.first_seq
+                    )
+                )
+            except Exception as exc:
+                # stream_reply has already removed the unanswered message
+                st.error(f"No answer from the model: {exc}")
+                return
+            if stats["cache_hit"]:
+                st.caption(f"⚡ Cached answer · {stats['total_time'] * 1000:.0f} ms")
+            else:
+                caption = (
+                    f"⏱️ First token {stats['time_to_first_token']:.2f}s · "
+                    f"{stats['tokens_per_sec']:.1f} tokens/s"
+                )
+                if routing_mode != "single":
+                    caption += f" · answered by {stats['provider']}"
+                st.caption(caption)
@@ -1,11 +1,22 @@
 import os
-from langchain_groq import ChatGroq
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_huggingface import ChatHuggingFace
-from langchain_huggingface.llms import HuggingFaceEndpoint
+import time
+import asyncio
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
+
+from backend.basic_chat.model_router import get_router_loop
+from backend.metrics import instrument, record
 load_dotenv()
 
+# LRU registry of model clients, so each keeps its HTTP keep-alive pool
+CHAT_MODEL_CACHE_SIZE = int(os.getenv("CHAT_MODEL_CACHE_SIZE", "16"))
+_model_cache: "OrderedDict[Tuple, object]" = OrderedDict()
+_model_cache_lock = threading.Lock()
+
 
 def get_chat_model(
     provider: str = "groq",
@@ -13,9 +24,117 @@ def get_chat_model(
     model_name: str="llama-3.1-8b-instant",
     temperature: float = 0.3,
 ):
+    """
+    Return a chat model client for the given settings.
+    Clients are reused across calls, keyed by (provider, model_name,
+    temperature, api_key hash); the least recently used one is dropped when
+    more than CHAT_MODEL_CACHE_SIZE are cached, and its HTTP clients are
+    closed once no session uses it any more.
+    """
     provider = provider.lower()
+    key = (
+        provider,
+        model_name,
+        float(temperature),
+        hashlib.sha256(api_key.encode()).hexdigest()
+    )
+
+    with _model_cache_lock:
+        model = _model_cache.get(key)
+        if model is not None:
+            _model_cache.move_to_end(key)
+            return model
+
+    model = _build_chat_model(provider, api_key, model_name, temperature)
+
+    with _model_cache_lock:
+        # Another thread may have built the same client meanwhile
+        existing = _model_cache.get(key)
+        if existing is not None:
+            _model_cache.move_to_end(key)
+            close_chat_model(model)
+            return existing
+        _model_cache[key] = model
+        evicted = []
+        while len(_model_cache) > CHAT_MODEL_CACHE_SIZE:
+            evicted.append(_model_cache.popitem(last=False)[1])
+
+    for old_model in evicted:
+        # Another session may still be streaming from it: close the clients
+        # when the last reference goes away instead of now
+        weakref.finalize(old_model, _close_clients, *_http_clients(old_model))
+    return model
+
+
+def _http_clients(model) -> Tuple[List, List]:
+    """
+    (sync, async) HTTP clients of a model and of the llm it wraps.
+    """
+    sync_clients, async_clients = [], []
+    for owner in (model, getattr(model, "llm", None)):
+        for attr, clients in (
+            ("client", sync_clients),
+            ("http_client", sync_clients),
+            ("async_client", async_clients),
+            ("http_async_client", async_clients),
+        ):
+            client = getattr(owner, attr, None)
+            # Groq wraps its HTTP client in resource objects (client.chat.completions)
+            client = getattr(client, "_client", client)
+            if client is not None:
+                clients.append(client)
+    return sync_clients, async_clients
+
+
+def _close_clients(sync_clients: List, async_clients: List) -> None:
+    for client in sync_clients:
+        close = getattr(client, "close", None)
+        if callable(close):
+            try:
+                close()
+            except Exception:
+                pass
+    for client in async_clients:
+        close = getattr(client, "aclose", None) or getattr(client, "close", None)
+        if not callable(close):
+            continue
+        try:
+            closing = close()
+            if asyncio.iscoroutine(closing):
+                # Async pools belong to the router loop, which used them
+                asyncio.run_coroutine_threadsafe(closing, get_router_loop())
+        except Exception:
+            pass
+
 
+def close_chat_model(model) -> None:
+    """
+    Close the sync and async HTTP clients of a model, if it exposes them.
+    """
+    _close_clients(*_http_clients(model))
+
+
+def clear_chat_model_cache() -> None:
+    """
+    Close and forget every cached model client.
+    """
+    with _model_cache_lock:
+        models = list(_model_cache.values())
+        _model_cache.clear()
+    for model in models:
+        close_chat_model(model)
+
+
+def _build_chat_model(
+    provider: str,
+    api_key: str,
+    model_name: str,
+    temperature: float,
+):
+    # Provider SDKs are imported only for the provider in use; each one
+    # costs noticeable startup time.
     if provider == "groq":
+        from langchain_groq import ChatGroq
         return ChatGroq(
             api_key=api_key,
             model=model_name,
@@ -23,6 +142,7 @@ def get_chat_model(
         )
 
     elif provider == "gemini":
+        from langchain_google_genai import ChatGoogleGenerativeAI
         return ChatGoogleGenerativeAI(
             google_api_key=api_key,
             model=model_name,
@@ -30,6 +150,8 @@ def get_chat_model(
         )
 
     elif provider == "huggingface":
+        from langchain_huggingface import ChatHuggingFace
+        from langchain_huggingface.llms import HuggingFaceEndpoint
         llm = HuggingFaceEndpoint(
             repo_id=model_name,
             huggingfacehub_api_token=api_key,
@@ -39,6 +161,7 @@ def get_chat_model(
 
     else:
         raise ValueError("Unsupported provider")
+@instrument("llm.invoke", payload=lambda result: len(result[1]))
 def get_response_from_model(
         model,
         conversation
@@ -46,4 +169,73 @@ def get_response_from_model(
     
     response = model.invoke(conversation)
     conversation.append({"role": "assistant", "content": response.content})
-    return conversation, conversation[-1]["content"]
\ No newline at end of file
+    return conversation, conversation[-1]["content"]
+
+
+def message_text(message) -> str:
+    """
+    Text of a message or chunk. Gemini may return content as a list of
+    parts instead of a string.
+    """
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(
+        part if isinstance(part, str) else part.get("text", "")
+        for part in content
+    )
+
+
+def stream_response_from_model(
+    model,
+    conversation,
+    stats: Optional[Dict] = None
+) -> Iterator[str]:
+    """
+    Stream the model reply as text chunks.
+
+    Works for every provider of get_chat_model: models without native
+    streaming yield the whole reply as a single chunk.
+    When the stream is exhausted, `stats` holds:
+    content, time_to_first_token, total_time, tokens and tokens_per_sec.
+    Tokens come from the provider usage metadata when available,
+    otherwise one streamed chunk counts as one token.
+    Recorded as the "llm.stream" and "llm.first_token" metrics.
+    """
+    stats = {} if stats is None else stats
+    start = time.perf_counter()
+    first_token_at = None
+    chunks = 0
+    usage_tokens = 0
+    parts = []
+
+    try:
+        for chunk in model.stream(conversation):
+            text = message_text(chunk)
+            usage = getattr(chunk, "usage_metadata", None)
+            if usage:
+                usage_tokens += usage.get("output_tokens", 0)
+            if not text:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            chunks += 1
+            parts.append(text)
+            yield text
+    except Exception:
+        record("llm.stream", time.perf_counter() - start, error=True)
+        raise
+
+    end = time.perf_counter()
+    tokens = usage_tokens or chunks
+    # Single-chunk (non-streaming) replies fall back to the total time
+    generation_time = (end - (first_token_at or end)) or (end - start)
+    stats.update({
+        "content": "".join(parts),
+        "time_to_first_token": (first_token_at or end) - start,
+        "total_time": end - start,
+        "tokens": tokens,
+        "tokens_per_sec": tokens / generation_time if generation_time > 0 else 0.0,
+    })
+    record("llm.stream", stats["total_time"], payload_bytes=len(stats["content"]))
+    record("llm.first_token", stats["time_to_first_token"])
@@ -0,0 +1,151 @@
+"""
+Token-budgeted context window for chat requests.
+
+Sits between the stored history and model.invoke: the system prompt is
+always kept, then the most recent messages are added until the per-model
+token budget is used up. Older messages can be replaced by a rolling
+summary. Token counts are memoized per message content, so each turn only
+tokenizes the new messages.
+"""
+import os
+from functools import lru_cache
+from typing import List, Tuple
+
+from langchain.messages import SystemMessage, HumanMessage
+
+from backend.basic_chat.message_record import SYSTEM, USER, role_of
+
+DEFAULT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "4000"))
+
+# Prompt budget per model, well below the context limit to leave room for the reply
+MODEL_TOKEN_BUDGETS = {
+    "llama-3.1-8b-instant": 8000,
+    "llama-3.1-70b-versatile": 8000,
+    "mixtral-8x7b-32768": 24000,
+    "gemini-2.5-flash": 32000,
+    "gemini-1.5-pro": 32000,
+    "gemini-1.0-pro": 24000,
+    "openai/gpt-oss-20b": 8000,
+    "meta-llama/Llama-2-7b-chat-hf": 3000,
+    "tiiuae/falcon-7b-instruct": 1500,
+}
+
+# Role and separator tokens added by chat templates for every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Tokens of new messages per summarization call (prompt and summary come on top)
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "3000"))
+
+SUMMARY_PROMPT = (
+    "Update the running summary of a conversation with the new messages below. "
+    "Keep facts, names, decisions and open questions. Answer with the summary only, "
+    "in at most 200 words.\n\nCurrent summary:\n{summary}\n\nNew messages:\n{messages}"
+)
+
+
+def get_token_budget(model_name: str) -> int:
+    return MODEL_TOKEN_BUDGETS.get(model_name, DEFAULT_TOKEN_BUDGET)
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    # Loaded on first use: the BPE file costs startup time (or a download)
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=100_000)
+def count_tokens(text: str) -> int:
+    """
+    Number of tokens in `text` (tiktoken when installed, else ~4 chars per token).
+    """
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def message_tokens(message) -> int:
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    return count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def build_context(
+    messages: List,
+    model_name: str = "",
+    summary: str = "",
+    token_budget: int = 0
+) -> Tuple[List, int]:
+    """
+    Select the messages to send to the model.
+
+    Returns (context, first_kept) where first_kept is the index in
+    `messages` of the oldest non-system message included. Messages before
+    it were dropped (and are covered by `summary`, if one is given).
+    The latest message is always included, even if it exceeds the budget.
+    `messages` may be MessageRecords or LangChain messages; the summary is
+    added as a LangChain SystemMessage.
+    """
+    budget = token_budget or get_token_budget(model_name)
+    if not messages:
+        return [], 0
+
+    head = []
+    start = 0
+    if role_of(messages[0]) == SYSTEM:
+        head.append(messages[0])
+        start = 1
+    if summary:
+        head.append(SystemMessage(content=f"Summary of the earlier conversation: {summary}"))
+
+    remaining = budget - sum(message_tokens(msg) for msg in head)
+    first_kept = len(messages)
+    for index in range(len(messages) - 1, start - 1, -1):
+        cost = message_tokens(messages[index])
+        if cost > remaining and first_kept < len(messages):
+            break
+        remaining -= cost
+        first_kept = index
+
+    return head + messages[first_kept:], first_kept
+
+
+def _summary_line(message, chunk_tokens: int) -> str:
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    if count_tokens(content) > chunk_tokens:
+        # A single huge message is cut to fit one call (~4 chars per token)
+        content = content[:chunk_tokens * 4] + " [...]"
+    return f"{'User' if role_of(message) == USER else 'Assistant'}: {content}"
+
+
+def summarize_messages(model, summary: str, messages: List, chunk_tokens: int = 0) -> str:
+    """
+    Fold `messages` into the rolling `summary`.
+
+    Messages are sent in chunks of at most `chunk_tokens` tokens (default
+    SUMMARY_CHUNK_TOKENS), one model call per chunk, each folding its chunk
+    into the summary so far. A long backlog (e.g. the first summary of a
+    long chat) therefore never exceeds the model's context.
+    """
+    chunk_tokens = chunk_tokens or SUMMARY_CHUNK_TOKENS
+    chunk, used = [], 0
+    for message in messages:
+        if role_of(message) == SYSTEM:
+            continue
+        cost = min(message_tokens(message), chunk_tokens)
+        if chunk and used + cost > chunk_tokens:
+            summary = _fold_summary(model, summary, chunk)
+            chunk, used = [], 0
+        chunk.append(_summary_line(message, chunk_tokens))
+        used += cost
+    if chunk:
+        summary = _fold_summary(model, summary, chunk)
+    return summary
+
+
+def _fold_summary(model, summary: str, lines: List[str]) -> str:
+    prompt = SUMMARY_PROMPT.format(summary=summary or "(empty)", messages="\n".join(lines))
+    return model.invoke([HumanMessage(content=prompt)]).content
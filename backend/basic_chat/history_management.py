@@ -1,13 +1,61 @@
 from langchain.messages import HumanMessage, AIMessage, SystemMessage
 import os
-from pymongo import MongoClient
+from pymongo import ASCENDING, DESCENDING
 from pymongo.collection import Collection
+from pymongo.database import Database
+from pymongo.errors import BulkWriteError
 from dotenv import load_dotenv
+import time
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional
+
+from backend.basic_chat.message_record import (
+    MessageRecord,
+    ROLE_NAMES,
+    role_of,
+    records_from_documents,
+    to_langchain_messages,
+)
+from backend.basic_chat.mongo_client import get_mongo_client
+from backend.metrics import instrument, text_size
 
 load_dotenv()
 
+# Storage layout:
+#   users         {user_name, created_at}
+#   conversations {conversation_id, user_name, title, created_at, updated_at, message_count}
+#   messages      {conversation_id, seq, role, content, created_at}
+USERS = "users"
+CONVERSATIONS = "conversations"
+MESSAGES = "messages"
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class MessageConflictError(ValueError):
+    """
+    A different message is already stored at one of the seqs of an append.
+    """
+
+
+_indexed_databases = set()
+
+# In-process cache of chat title pages: user_name -> {(limit, cursor): (expires_at, page)}
+CHAT_TITLES_CACHE_TTL = float(os.getenv("CHAT_TITLES_CACHE_TTL", "30"))
+_chat_titles_cache: Dict[str, Dict] = {}
+
+
+def get_mongodb_database(database: str = "ai_khichuri") -> Database:
+    """
+    Return the chat database on the shared MongoDB client.
+    Indexes are created once per process.
+    """
+    db = get_mongo_client()[database]
+    if database not in _indexed_databases:
+        ensure_indexes(db)
+        _indexed_databases.add(database)
+    return db
+
 
 def get_mongodb_collection(
     database: str = "ai_khichuri",
@@ -15,31 +63,28 @@ def get_mongodb_collection(
 ) -> Collection:
     """
     Connect to MongoDB Atlas and return a collection object.
+    Only used for the legacy single-document layout (see migrate_history.py).
     """
-    uri = os.getenv("MONGODB_URI")
-    if not uri:
-        raise ValueError("MONGODB_URI not found in environment variables")
+    return get_mongo_client()[database][collection_name]
 
-    client = MongoClient(uri)
-    db = client[database]
-    collection = db[collection_name]
-    print("Connected to MongoDB Atlas ✅")
-    return collection
+
+def ensure_indexes(db: Database) -> None:
+    """
+    Create the indexes used by every chat query. Safe to call repeatedly.
+    """
+    db[USERS].create_index([("user_name", ASCENDING)], unique=True)
+    db[CONVERSATIONS].create_index([("conversation_id", ASCENDING)], unique=True)
+    db[CONVERSATIONS].create_index([("user_name", ASCENDING), ("updated_at", DESCENDING)])
+    db[MESSAGES].create_index([("conversation_id", ASCENDING), ("seq", ASCENDING)], unique=True)
 
 
 def convert_conversation_to_dict(conversation: List) -> List[Dict]:
     """
-    Convert LangChain message objects to MongoDB-storable dictionaries.
+    Convert MessageRecords (or LangChain message objects) to
+    MongoDB-storable dictionaries.
     """
     return [
-        {
-            "role": (
-                "system" if isinstance(msg, SystemMessage)
-                else "user" if isinstance(msg, HumanMessage)
-                else "assistant"
-            ),
-            "content": msg.content
-        }
+        {"role": ROLE_NAMES[role_of(msg)], "content": msg.content}
         for msg in conversation
     ]
 
@@ -65,252 +110,532 @@ def convert_dict_to_conversation(messages_dict: List[Dict]) -> List:
     return conversation
 
 
-def create_user(user_name: str, collection: Collection) -> bool:
+def _message_documents(conversation_id: str, messages: List, start_seq: int) -> List[Dict]:
+    now = datetime.utcnow()
+    documents = convert_conversation_to_dict(messages)
+    for offset, doc in enumerate(documents):
+        doc["conversation_id"] = conversation_id
+        doc["seq"] = start_seq + offset
+        doc["created_at"] = now
+    return documents
+
+
+@instrument("mongo.create_user")
+def create_user(user_name: str, db: Database) -> bool:
     """
     Create a new user document if it does not already exist.
     Returns True if created, False if already exists.
     """
-    if collection.find_one({"user_name": user_name}):
-        return False
-
-    collection.insert_one({
-        "user_name": user_name,
-        "created_at": datetime.utcnow(),
-        "conversations": []
-    })
-    return True
+    result = db[USERS].update_one(
+        {"user_name": user_name},
+        {"$setOnInsert": {"user_name": user_name, "created_at": datetime.utcnow()}},
+        upsert=True
+    )
+    return result.upserted_id is not None
 
 
+@instrument("mongo.create_new_chat")
 def create_new_chat(
     user_name: str,
-    collection: Collection,
+    db: Database,
     title: str = '',
     system_prompt: str = "You are a helpful assistant. Answer like a professional human being and precisely."
 ) -> str:
     """
     Create a new conversation for a user and return conversation_id.
     """
+    if not db[USERS].find_one({"user_name": user_name}, {"_id": 1}):
+        raise ValueError("User not found")
+
     if not title:
         title = f"Hello! Mr. {user_name}! How can I Help you? "
+    now = datetime.utcnow()
     conversation = {
         "conversation_id": os.urandom(16).hex(),
-        "title": title, 
-        "created_at": datetime.utcnow(),
-        "messages": [
-            {"role": "system", "content": system_prompt}
-        ]
+        "user_name": user_name,
+        "title": title,
+        "created_at": now,
+        "updated_at": now,
+        "message_count": 1
     }
 
-    result = collection.update_one(
-        {"user_name": user_name},
-        {"$push": {"conversations": conversation}}
-    )
-
-    if result.matched_count == 0:
-        raise ValueError("User not found")
+    db[CONVERSATIONS].insert_one(conversation)
+    db[MESSAGES].insert_one({
+        "conversation_id": conversation["conversation_id"],
+        "seq": 0,
+        "role": "system",
+        "content": system_prompt,
+        "created_at": now
+    })
+    invalidate_chat_titles(user_name)
 
     return conversation["conversation_id"]
 
+
+@instrument("mongo.update_system_prompt")
 def update_system_prompt(
     user_name: str,
     conversation_id: str,
     system_prompt: str,
-    collection: Collection
+    db: Database
 ) -> bool:
     """
     Update the system prompt for a conversation.
-    This updates the existing system message (index 0).
+    This updates the existing system message (seq 0).
     """
-    result = collection.update_one(
-        {
-            "user_name": user_name,
-            "conversations.conversation_id": conversation_id
-        },
-        {
-            "$set": {
-                "conversations.$.messages.0.content": system_prompt
-            }
-        }
+    if not db[CONVERSATIONS].find_one(
+        {"user_name": user_name, "conversation_id": conversation_id},
+        {"_id": 1}
+    ):
+        return False
+
+    result = db[MESSAGES].update_one(
+        {"conversation_id": conversation_id, "seq": 0},
+        {"$set": {"content": system_prompt}}
     )
 
     return result.modified_count == 1
 
 
+@instrument("mongo.save_message_to_conversation", payload_arg="messages")
 def save_message_to_conversation(
     user_name: str,
     conversation_id: str,
     messages: List,
-    collection: Collection
+    db: Database
 ) -> bool:
     """
     Replace the entire messages list of a conversation.
+    Prefer append_messages_to_conversation for regular chat turns.
+
+    Only rows that differ are written: new seqs are inserted, changed ones
+    overwritten in place, and the seqs past the new end deleted last, so a
+    reader (or a crash) between the writes never sees an empty or
+    truncated conversation.
     """
-    result = collection.update_one(
-        {
-            "user_name": user_name,
-            "conversations.conversation_id": conversation_id
-        },
-        {
-            "$set": {
-                "conversations.$.messages": convert_conversation_to_dict(messages)
+    if not db[CONVERSATIONS].find_one(
+        {"user_name": user_name, "conversation_id": conversation_id},
+        {"_id": 1}
+    ):
+        return False
+
+    stored = {
+        doc["seq"]: (doc["role"], doc["content"])
+        for doc in db[MESSAGES].find(
+            {"conversation_id": conversation_id},
+            {"_id": 0, "seq": 1, "role": 1, "content": 1}
+        )
+    }
+    new_documents = []
+    for doc in _message_documents(conversation_id, messages, 0):
+        if doc["seq"] not in stored:
+            new_documents.append(doc)
+        elif stored[doc["seq"]] != (doc["role"], doc["content"]):
+            db[MESSAGES].replace_one({"conversation_id": conversation_id, "seq": doc["seq"]}, doc)
+    if new_documents:
+        db[MESSAGES].insert_many(new_documents, ordered=False)
+    db[MESSAGES].delete_many({"conversation_id": conversation_id, "seq": {"$gte": len(messages)}})
+
+    db[CONVERSATIONS].update_one(
+        {"user_name": user_name, "conversation_id": conversation_id},
+        {"$set": {"updated_at": datetime.utcnow(), "message_count": len(messages)}}
+    )
+    invalidate_chat_titles(user_name)
+    return True
+
+
+@instrument("mongo.append_messages_to_conversation", payload_arg="messages")
+def append_messages_to_conversation(
+    user_name: str,
+    conversation_id: str,
+    messages: List,
+    start_seq: int,
+    db: Database
+) -> bool:
+    """
+    Append only the new messages of a turn to a conversation.
+
+    Every message is stored with a sequence number (its position in the
+    conversation), starting at `start_seq`. The unique (conversation_id, seq)
+    index rejects messages that are already stored, so retrying a turn never
+    duplicates messages. A seq that already holds a *different* message
+    (a stale history, e.g. the same chat open twice) raises
+    MessageConflictError instead of dropping the new message.
+    The conversation's message_count and updated_at are only moved forward
+    for messages that are actually stored, after the insert.
+    Returns True if any message was appended.
+    """
+    if not messages:
+        return False
+
+    if not db[CONVERSATIONS].find_one(
+        {"user_name": user_name, "conversation_id": conversation_id},
+        {"_id": 1}
+    ):
+        return False
+
+    documents = _message_documents(conversation_id, messages, start_seq)
+    rejected = set()
+    error = None
+    try:
+        db[MESSAGES].insert_many(documents, ordered=False)
+    except BulkWriteError as exc:
+        write_errors = exc.details.get("writeErrors", [])
+        rejected = {write_error["op"]["seq"] for write_error in write_errors}
+        if any(write_error.get("code") != DUPLICATE_KEY_ERROR for write_error in write_errors):
+            error = exc
+        else:
+            try:
+                _check_retried_messages(conversation_id, [write_error["op"] for write_error in write_errors], db)
+            except MessageConflictError as conflict:
+                error = conflict
+
+    # A retried turn's duplicates are the same messages, already stored
+    stored = [doc["seq"] for doc in documents if error is None or doc["seq"] not in rejected]
+    if stored:
+        db[CONVERSATIONS].update_one(
+            {"user_name": user_name, "conversation_id": conversation_id},
+            {
+                "$set": {"updated_at": datetime.utcnow()},
+                "$max": {"message_count": max(stored) + 1}
             }
-        }
+        )
+        invalidate_chat_titles(user_name)
+    if error is not None:
+        raise error
+    return len(documents) > len(rejected)
+
+
+def _check_retried_messages(conversation_id: str, documents: List[Dict], db: Database) -> None:
+    # Duplicate seqs are only a retry when the stored message is the same one
+    expected = {doc["seq"]: doc for doc in documents}
+    stored = db[MESSAGES].find(
+        {"conversation_id": conversation_id, "seq": {"$in": list(expected)}},
+        {"_id": 0, "seq": 1, "role": 1, "content": 1}
     )
+    for doc in stored:
+        new = expected[doc["seq"]]
+        if doc["role"] != new["role"] or doc["content"] != new["content"]:
+            raise MessageConflictError(
+                f"Conversation {conversation_id} already has a different message at seq {doc['seq']}"
+            )
 
-    return result.modified_count == 1
 
+@instrument("mongo.get_chat_titles")
 def get_chat_titles(
     user_name: str,
-    collection: Collection
+    db: Database
 ) -> List[Dict]:
     """
-    Returns a list of conversation IDs and titles for a user.
+    Returns a list of conversation IDs and titles for a user, newest first.
     Output format:
     [
         {"conversation_id": "...", "title": "..."},
         ...
     ]
     """
-    user_doc = collection.find_one(
+    cursor = db[CONVERSATIONS].find(
         {"user_name": user_name},
-        {"conversations.conversation_id": 1, "conversations.title": 1}
-    )
-
-    if not user_doc or "conversations" not in user_doc:
-        return []
+        {"_id": 0, "conversation_id": 1, "title": 1}
+    ).sort("updated_at", DESCENDING)
 
     return [
         {
             "conversation_id": conv.get("conversation_id", ""),
             "title": conv.get("title", "")
         }
-        for conv in user_doc["conversations"]
+        for conv in cursor
     ]
-def get_current_chat_title(user_name, conversation_id, collection):
-    doc = collection.find_one(
-        {
-            "user_name": user_name,
-            "conversations.conversation_id": conversation_id
-        },
-        {"conversations.$": 1}
+
+
+def _encode_cursor(conversation: Dict) -> str:
+    return f"{conversation['updated_at'].isoformat()}|{conversation['conversation_id']}"
+
+
+def _decode_cursor(cursor: str) -> Dict:
+    updated_at, conversation_id = cursor.split("|", 1)
+    updated_at = datetime.fromisoformat(updated_at)
+    return {
+        "$or": [
+            {"updated_at": {"$lt": updated_at}},
+            {"updated_at": updated_at, "conversation_id": {"$lt": conversation_id}}
+        ]
+    }
+
+
+@instrument("mongo.get_chat_titles_page")
+def get_chat_titles_page(
+    user_name: str,
+    db: Database,
+    limit: int = 20,
+    cursor: str = ""
+) -> Dict:
+    """
+    Returns one page of conversation titles for a user, newest first.
+    Pass the returned next_cursor to get the following page; it is empty
+    on the last page. Pages are cached in-process for CHAT_TITLES_CACHE_TTL
+    seconds and invalidated whenever the user's chats change.
+    Output format:
+    {
+        "items": [{"conversation_id": "...", "title": "..."}, ...],
+        "next_cursor": "..."
+    }
+    """
+    cache_key = (limit, cursor)
+    cached = _chat_titles_cache.get(user_name, {}).get(cache_key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    query = {"user_name": user_name}
+    if cursor:
+        query.update(_decode_cursor(cursor))
+
+    conversations = list(
+        db[CONVERSATIONS].find(
+            query,
+            {"_id": 0, "conversation_id": 1, "title": 1, "updated_at": 1}
+        )
+        .sort([("updated_at", DESCENDING), ("conversation_id", DESCENDING)])
+        .limit(limit + 1)
+    )
+
+    has_more = len(conversations) > limit
+    conversations = conversations[:limit]
+    page = {
+        "items": [
+            {
+                "conversation_id": conv.get("conversation_id", ""),
+                "title": conv.get("title", "")
+            }
+            for conv in conversations
+        ],
+        "next_cursor": _encode_cursor(conversations[-1]) if has_more else ""
+    }
+
+    _chat_titles_cache.setdefault(user_name, {})[cache_key] = (
+        time.monotonic() + CHAT_TITLES_CACHE_TTL,
+        page
     )
-    if doc and "conversations" in doc:
-        return doc["conversations"][0].get("title", "")
+    return page
+
+
+def invalidate_chat_titles(user_name: str) -> None:
+    """
+    Drop the cached title pages of a user.
+    """
+    _chat_titles_cache.pop(user_name, None)
+
+
+@instrument("mongo.get_current_chat_title")
+def get_current_chat_title(user_name, conversation_id, db):
+    doc = db[CONVERSATIONS].find_one(
+        {"user_name": user_name, "conversation_id": conversation_id},
+        {"_id": 0, "title": 1}
+    )
+    if doc:
+        return doc.get("title", "")
     return ""
 
+
+@instrument("mongo.update_title")
 def update_title(
     user_name: str,
     conversation_id: str,
     title: str,
-    collection: Collection
+    db: Database
 ) -> bool:
     """
     Update the title of a specific conversation.
     Returns True if updated successfully.
     """
-    result = collection.update_one(
-        {
-            "user_name": user_name,
-            "conversations.conversation_id": conversation_id
-        },
-        {
-            "$set": {"conversations.$.title": title}
-        }
+    result = db[CONVERSATIONS].update_one(
+        {"user_name": user_name, "conversation_id": conversation_id},
+        {"$set": {"title": title}}
     )
+    invalidate_chat_titles(user_name)
 
     return result.modified_count == 1
 
 
+def _conversation_records(user_name: str, conversation_id: str, db: Database) -> List[MessageRecord]:
+    if not db[CONVERSATIONS].find_one(
+        {"user_name": user_name, "conversation_id": conversation_id},
+        {"_id": 1}
+    ):
+        return []
 
-def get_conversation_history(
+    messages = db[MESSAGES].find(
+        {"conversation_id": conversation_id},
+        {"_id": 0, "seq": 1, "role": 1, "content": 1}
+    ).sort("seq", ASCENDING)
+
+    return records_from_documents(list(messages), conversation_id)
+
+
+@instrument("mongo.get_conversation_records", payload=text_size)
+def get_conversation_records(
     user_name: str,
     conversation_id: str,
-    collection: Collection
-) -> List:
-    user_doc = collection.find_one(
-        {
-            "user_name": user_name,
-            "conversations.conversation_id": conversation_id
-        },
-        {
-            "conversations.$": 1
-        }
-    )
+    db: Database
+) -> List[MessageRecord]:
+    """
+    Full conversation as MessageRecords (see message_record.py).
+    """
+    return _conversation_records(user_name, conversation_id, db)
 
-    if not user_doc or "conversations" not in user_doc:
-        return []
 
-    conversation = user_doc["conversations"][0]
-    messages = conversation.get("messages", [])
+@instrument("mongo.get_conversation_history", payload=text_size)
+def get_conversation_history(
+    user_name: str,
+    conversation_id: str,
+    db: Database
+) -> List:
+    """
+    Full conversation as LangChain message objects.
+    """
+    return to_langchain_messages(_conversation_records(user_name, conversation_id, db))
 
-    if not isinstance(messages, list):
-        return []
 
-    return convert_dict_to_conversation(messages)
+@instrument("mongo.get_conversation_window", payload=lambda window: text_size(window["messages"]))
+def get_conversation_window(
+    user_name: str,
+    conversation_id: str,
+    db: Database,
+    limit: int = 50,
+    before_seq: int = 0
+) -> Dict:
+    """
+    Load part of a conversation (as MessageRecords) instead of the whole
+    history.
+
+    Without before_seq: the system prompt followed by the newest `limit`
+    messages. With before_seq: the `limit` messages just before that seq
+    (no system prompt), to page back through older messages. Both read a
+    seq range of the (conversation_id, seq) index, so the cost does not
+    grow with the conversation length.
+    Output format:
+    {
+        "messages": [...],      # MessageRecords, oldest first
+        "first_seq": int,       # seq of the first non-system message
+        "has_earlier": bool     # older messages are still in the store
+    }
+    """
+    empty = {"messages": [], "first_seq": max(before_seq, 1), "has_earlier": False}
+    if not db[CONVERSATIONS].find_one(
+        {"user_name": user_name, "conversation_id": conversation_id},
+        {"_id": 1}
+    ):
+        return empty
+
+    seq_range = {"$gte": 1}
+    if before_seq:
+        seq_range["$lt"] = before_seq
+    documents = list(
+        db[MESSAGES].find(
+            {"conversation_id": conversation_id, "seq": seq_range},
+            {"_id": 0, "seq": 1, "role": 1, "content": 1}
+        )
+        .sort("seq", DESCENDING)
+        .limit(limit)
+    )
+    documents.reverse()
+
+    if not before_seq:
+        system = db[MESSAGES].find_one(
+            {"conversation_id": conversation_id, "seq": 0},
+            {"_id": 0, "seq": 1, "role": 1, "content": 1}
+        )
+        if system:
+            documents.insert(0, system)
+
+    first_seq = next((doc["seq"] for doc in documents if doc["seq"] > 0), empty["first_seq"])
+    return {
+        "messages": records_from_documents(documents, conversation_id),
+        "first_seq": first_seq,
+        "has_earlier": first_seq > 1,
+    }
 
 
+@instrument("mongo.delete_conversation")
 def delete_conversation(
     user_name: str,
     conversation_id: str,
-    collection: Collection
+    db: Database
 ) -> bool:
     """
-    Deletes a single conversation from a user's conversation list.
+    Deletes a single conversation and its messages.
     """
-    result = collection.update_one(
-        {"user_name": user_name},
-        {"$pull": {"conversations": {"conversation_id": conversation_id}}}
+    result = db[CONVERSATIONS].delete_one(
+        {"user_name": user_name, "conversation_id": conversation_id}
     )
+    if result.deleted_count == 0:
+        return False
+    invalidate_chat_titles(user_name)
 
-    return result.modified_count == 1
+    db[MESSAGES].delete_many({"conversation_id": conversation_id})
+    return True
 
 
+@instrument("mongo.delete_all_conversations")
 def delete_all_conversations(
     user_name: str,
-    collection: Collection
+    db: Database
 ) -> bool:
     """
     Deletes all conversations for a user.
     """
-    result = collection.update_one(
-        {"user_name": user_name},
-        {"$set": {"conversations": []}}
-    )
+    conversation_ids = [
+        conv["conversation_id"]
+        for conv in db[CONVERSATIONS].find({"user_name": user_name}, {"conversation_id": 1})
+    ]
+    if not conversation_ids:
+        return False
 
-    return result.modified_count == 1
+    db[MESSAGES].delete_many({"conversation_id": {"$in": conversation_ids}})
+    db[CONVERSATIONS].delete_many({"user_name": user_name})
+    invalidate_chat_titles(user_name)
+    return True
 
 
 # -----------------------------
 # Main function for testing
 # -----------------------------
-def main():
-    collection = get_mongodb_collection()
+def main(db: Optional[Database] = None):
+    db = get_mongodb_database() if db is None else db
 
     user_name = "test_user"
 
-    created = create_user(user_name, collection)
+    created = create_user(user_name, db)
     print("User created:", created)
 
     conversation_id = create_new_chat(
         user_name=user_name,
-        collection=collection,
+        db=db,
         title="Test Chat",
         system_prompt="You are a helpful assistant"
     )
     print("Conversation ID:", conversation_id)
 
+    # Full rewrite of the conversation (system prompt included)
+    messages = [
+        SystemMessage(content="You are a helpful assistant"),
+        HumanMessage(content="Hello!"),
+        AIMessage(content="Hi! How can I help you?"),
+    ]
     save_message_to_conversation(
         user_name,
         conversation_id,
-        {"role": "user", "content": "Hello!"},
-        collection
+        messages,
+        db
     )
 
-    save_message_to_conversation(
+    # Regular chat turn: only the new messages, after the stored ones
+    append_messages_to_conversation(
         user_name,
         conversation_id,
-        {"role": "assistant", "content": "Hi! How can I help you?"},
-        collection
+        [HumanMessage(content="What is MongoDB?"), AIMessage(content="A document database.")],
+        len(messages),
+        db
     )
 
     print("Messages saved successfully ✅")
@@ -318,16 +643,16 @@ def main():
     history = get_conversation_history(
         user_name="test_user",
         conversation_id=conversation_id,
-        collection=collection
+        db=db
     )
 
     print(history)
 
     # Delete single conversation
-    # delete_conversation(user_name, conversation_id, collection)
+    # delete_conversation(user_name, conversation_id, db)
 
     # Delete all conversations
-    # delete_all_conversations(user_name, collection)
+    # delete_all_conversations(user_name, db)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,118 @@
+"""
+Compact in-memory chat messages.
+
+Conversations are loaded, kept in the session and saved as MessageRecord
+objects (stable id, role code, content) instead of LangChain messages, so
+none of those steps builds and validates a pydantic object per message.
+LangChain messages are created only at the model boundary by
+to_langchain, memoized per message id, so a turn reuses the objects
+built for the previous turns.
+
+Ids are "<conversation_id>:<seq>", the position of the message in the
+stored conversation.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from langchain.messages import SystemMessage, HumanMessage, AIMessage
+
+# Role codes, in the order of ROLE_NAMES
+SYSTEM, USER, ASSISTANT = 0, 1, 2
+ROLE_NAMES = ("system", "user", "assistant")
+ROLE_CODES = {name: code for code, name in enumerate(ROLE_NAMES)}
+LANGCHAIN_TYPES = (SystemMessage, HumanMessage, AIMessage)
+
+# LangChain objects memoized per message id: id -> (content, message)
+MESSAGE_CACHE_SIZE = int(os.getenv("MESSAGE_CACHE_SIZE", "20000"))
+_langchain_cache: "OrderedDict[str, Tuple[object, object]]" = OrderedDict()
+_langchain_cache_lock = threading.Lock()
+
+
+def message_id(conversation_id: str, seq: int) -> str:
+    return f"{conversation_id}:{seq}"
+
+
+class MessageRecord:
+    __slots__ = ("id", "role", "content")
+
+    def __init__(self, role: int, content, id: str = ""):
+        self.role = role
+        self.content = content
+        self.id = id
+
+    @property
+    def role_name(self) -> str:
+        return ROLE_NAMES[self.role]
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, MessageRecord):
+            return NotImplemented
+        return self.id == other.id and self.role == other.role and self.content == other.content
+
+    def __repr__(self) -> str:
+        return f"MessageRecord({self.role_name}, {self.content!r:.40}, id={self.id!r})"
+
+
+def role_of(message) -> int:
+    """
+    Role code of a MessageRecord or a LangChain message.
+    """
+    if isinstance(message, MessageRecord):
+        return message.role
+    if isinstance(message, SystemMessage):
+        return SYSTEM
+    if isinstance(message, HumanMessage):
+        return USER
+    return ASSISTANT
+
+
+def records_from_documents(documents: List[Dict], conversation_id: str) -> List[MessageRecord]:
+    """
+    Records of stored message documents ({seq, role, content}); unknown
+    roles are skipped.
+    """
+    return [
+        MessageRecord(ROLE_CODES[doc["role"]], doc["content"], message_id(conversation_id, doc["seq"]))
+        for doc in documents
+        if doc["role"] in ROLE_CODES
+    ]
+
+
+def to_langchain(message):
+    """
+    LangChain message of a record (LangChain messages pass through).
+    Built once per id and content, then reused.
+    """
+    if not isinstance(message, MessageRecord):
+        return message
+    if not message.id:
+        return LANGCHAIN_TYPES[message.role](content=message.content)
+
+    with _langchain_cache_lock:
+        cached = _langchain_cache.get(message.id)
+        # The same id gets new content when a conversation is rewritten
+        if (
+            cached is not None
+            and cached[0] == message.content
+            and type(cached[1]) is LANGCHAIN_TYPES[message.role]
+        ):
+            _langchain_cache.move_to_end(message.id)
+            return cached[1]
+
+    converted = LANGCHAIN_TYPES[message.role](content=message.content)
+    with _langchain_cache_lock:
+        _langchain_cache[message.id] = (message.content, converted)
+        while len(_langchain_cache) > MESSAGE_CACHE_SIZE:
+            _langchain_cache.popitem(last=False)
+    return converted
+
+
+def to_langchain_messages(messages: List) -> List:
+    return [to_langchain(message) for message in messages]
+
+
+def clear_langchain_cache() -> None:
+    with _langchain_cache_lock:
+        _langchain_cache.clear()
@@ -0,0 +1,121 @@
+"""
+One-shot migration from the legacy single-document layout
+
+    history {user_name, created_at, conversations: [{..., messages: [...]}]}
+
+to the normalized users / conversations / messages collections.
+
+The migration is idempotent: every write is an upsert keyed on the unique
+indexes, so it can be re-run safely after an interruption.
+
+    python -m backend.basic_chat.migrate_history [--drop-legacy]
+"""
+import argparse
+from datetime import datetime
+from typing import Dict
+
+from pymongo import UpdateOne
+from pymongo.collection import Collection
+from pymongo.database import Database
+
+from backend.basic_chat.history_management import (
+    get_mongodb_database,
+    get_mongodb_collection,
+    ensure_indexes,
+    USERS,
+    CONVERSATIONS,
+    MESSAGES,
+)
+
+
+def migrate_user_document(user_doc: Dict, db: Database) -> Dict:
+    """
+    Copy one legacy user document into the normalized collections.
+    Returns the number of conversations and messages written.
+    """
+    user_name = user_doc["user_name"]
+    created_at = user_doc.get("created_at") or datetime.utcnow()
+
+    db[USERS].update_one(
+        {"user_name": user_name},
+        {"$setOnInsert": {"user_name": user_name, "created_at": created_at}},
+        upsert=True
+    )
+
+    conversations = user_doc.get("conversations") or []
+    message_count = 0
+    for conv in conversations:
+        conversation_id = conv["conversation_id"]
+        conv_created_at = conv.get("created_at") or created_at
+        messages = conv.get("messages") or []
+
+        db[CONVERSATIONS].update_one(
+            {"conversation_id": conversation_id},
+            {
+                "$set": {
+                    "user_name": user_name,
+                    "title": conv.get("title", ""),
+                    "created_at": conv_created_at,
+                    "updated_at": conv_created_at,
+                    "message_count": len(messages)
+                }
+            },
+            upsert=True
+        )
+
+        operations = [
+            UpdateOne(
+                {"conversation_id": conversation_id, "seq": msg.get("seq", seq)},
+                {
+                    "$set": {
+                        "role": msg["role"],
+                        "content": msg["content"],
+                        "created_at": conv_created_at
+                    }
+                },
+                upsert=True
+            )
+            for seq, msg in enumerate(messages)
+        ]
+        if operations:
+            db[MESSAGES].bulk_write(operations, ordered=False)
+        message_count += len(operations)
+
+    return {"conversations": len(conversations), "messages": message_count}
+
+
+def migrate(legacy: Collection, db: Database, drop_legacy: bool = False) -> Dict:
+    """
+    Migrate every legacy user document. Returns totals.
+    """
+    ensure_indexes(db)
+    totals = {"users": 0, "conversations": 0, "messages": 0}
+
+    for user_doc in legacy.find({}):
+        counts = migrate_user_document(user_doc, db)
+        totals["users"] += 1
+        totals["conversations"] += counts["conversations"]
+        totals["messages"] += counts["messages"]
+        print(f"Migrated {user_doc['user_name']}: {counts}")
+
+    if drop_legacy:
+        legacy.drop()
+
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate chat history to the normalized layout")
+    parser.add_argument("--database", default="ai_khichuri")
+    parser.add_argument("--legacy-collection", default="history")
+    parser.add_argument("--drop-legacy", action="store_true", help="Drop the legacy collection afterwards")
+    args = parser.parse_args()
+
+    legacy = get_mongodb_collection(args.database, args.legacy_collection)
+    db = get_mongodb_database(args.database)
+    totals = migrate(legacy, db, drop_legacy=args.drop_legacy)
+    print("Migration finished ✅", totals)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Async multi-provider routing on top of chat_model.
+
+A ModelRouter holds several (name, model) candidates, e.g.
+("groq:llama-3.1-8b-instant", get_chat_model("groq", ...)), and answers a
+request with one of three strategies:
+
+- "fallback": try candidates one after another, moving on after an error
+  or a timeout.
+- "hedged":   start the best candidate; if it has not answered within
+  `hedge_delay` seconds (or fails), also start the next one. The first good
+  response wins and the others are cancelled.
+- "race":     start every candidate at once, first good response wins.
+
+Candidates are ranked by their recent latency. A per-provider circuit
+breaker skips providers that keep failing until `reset_timeout` has passed.
+Health is tracked process-wide, so it survives Streamlit reruns.
+
+The sync `invoke`/`stream` run on one long-lived event loop in a background
+thread. Provider clients are memoized (see chat_model), and their async
+connection pools stay bound to the loop they were first used on, so a fresh
+loop per call (asyncio.run) would break them from the second call on.
+"""
+import asyncio
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from langchain.messages import AIMessage, AIMessageChunk
+
+ROUTING_MODES = ("fallback", "hedged", "race")
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures;
+    open -> half_open after `reset_timeout` seconds (calls allowed again);
+    half_open -> closed on success, back to open on failure.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        return self.state != "open"
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class ProviderHealth:
+    """
+    Circuit breaker plus latency statistics of one candidate.
+    """
+
+    def __init__(self, smoothing: float = 0.3):
+        self.breaker = CircuitBreaker()
+        self.smoothing = smoothing
+        self.latency: Optional[float] = None
+        self.successes = 0
+        self.failures = 0
+
+    def record_success(self, latency: float) -> None:
+        self.successes += 1
+        self.breaker.record_success()
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency = self.smoothing * latency + (1 - self.smoothing) * self.latency
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.breaker.record_failure()
+
+    def snapshot(self) -> Dict:
+        return {
+            "state": self.breaker.state,
+            "latency_s": self.latency,
+            "successes": self.successes,
+            "failures": self.failures,
+        }
+
+
+_health: Dict[str, ProviderHealth] = {}
+_health_lock = threading.Lock()
+
+
+def get_provider_health(name: str) -> ProviderHealth:
+    with _health_lock:
+        if name not in _health:
+            _health[name] = ProviderHealth()
+        return _health[name]
+
+
+def provider_health_report() -> Dict[str, Dict]:
+    with _health_lock:
+        return {name: health.snapshot() for name, health in _health.items()}
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def get_router_loop() -> asyncio.AbstractEventLoop:
+    """
+    Process-wide event loop, running in a daemon thread, that sync callers
+    submit routed requests to.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="model-router", daemon=True).start()
+        return _loop
+
+
+class ModelRouter:
+    def __init__(
+        self,
+        candidates: List[Tuple[str, object]],
+        mode: str = "fallback",
+        timeout: float = 30.0,
+        hedge_delay: float = 2.0,
+    ):
+        """
+        candidates: (name, model) pairs in order of preference; models need ainvoke.
+        timeout: seconds before a single call counts as failed.
+        hedge_delay: seconds to wait before starting the next candidate in "hedged" mode.
+        """
+        if mode not in ROUTING_MODES:
+            raise ValueError(f"Unsupported routing mode: {mode}")
+        if not candidates:
+            raise ValueError("At least one candidate model is required")
+        self.candidates = dict(candidates)
+        self.preference = [name for name, _ in candidates]
+        self.mode = mode
+        self.timeout = timeout
+        self.hedge_delay = hedge_delay
+        self.last_provider = ""
+
+    def ranked(self) -> List[str]:
+        """
+        Candidates whose circuit is not open, fastest first. Candidates
+        without latency data are ranked as if they took `hedge_delay`
+        seconds; ties keep the preference order.
+        """
+        available = [name for name in self.preference if get_provider_health(name).breaker.allow()]
+
+        def sort_key(name):
+            latency = get_provider_health(name).latency
+            return (latency if latency is not None else self.hedge_delay, self.preference.index(name))
+
+        return sorted(available, key=sort_key)
+
+    async def _call(self, name: str, messages: List) -> AIMessage:
+        health = get_provider_health(name)
+        start = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                self.candidates[name].ainvoke(messages),
+                timeout=self.timeout
+            )
+            if not response.content:
+                raise ValueError(f"{name} returned an empty response")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            health.record_failure()
+            raise
+        health.record_success(time.perf_counter() - start)
+        return response
+
+    async def ainvoke(self, messages: List) -> AIMessage:
+        """
+        Route one request according to the router mode.
+        """
+        order = self.ranked()
+        if not order:
+            raise RuntimeError("All providers are unavailable (circuit breakers open)")
+
+        if self.mode == "race":
+            hedge_delay = 0.0
+        elif self.mode == "hedged":
+            hedge_delay = self.hedge_delay
+        else:
+            hedge_delay = None
+
+        pending: Dict[asyncio.Task, str] = {}
+        errors: Dict[str, str] = {}
+        next_index = 0
+
+        def launch():
+            nonlocal next_index
+            name = order[next_index]
+            next_index += 1
+            pending[asyncio.ensure_future(self._call(name, messages))] = name
+
+        launch()
+        try:
+            while pending:
+                while hedge_delay == 0.0 and next_index < len(order):
+                    launch()
+                can_hedge = hedge_delay is not None and next_index < len(order)
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=hedge_delay if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    launch()
+                    continue
+                for task in done:
+                    name = pending.pop(task)
+                    if task.exception() is None:
+                        self.last_provider = name
+                        return task.result()
+                    errors[name] = repr(task.exception())
+                if next_index < len(order) and (hedge_delay is not None or not pending):
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise RuntimeError(f"All providers failed: {errors}")
+
+    def invoke(self, messages: List, **kwargs) -> AIMessage:
+        return asyncio.run_coroutine_threadsafe(self.ainvoke(messages), get_router_loop()).result()
+
+    def stream(self, messages: List, **kwargs) -> Iterator[AIMessageChunk]:
+        # Routed responses are not streamed: the winner is only known at the end
+        yield AIMessageChunk(content=self.invoke(messages).content)
@@ -0,0 +1,130 @@
+"""
+Process-wide MongoClient registry.
+
+MongoClient is thread-safe and owns its own connection pool, so one client
+per (uri, options) is shared by every Streamlit rerun and session instead of
+opening a new pool (and repeating the TLS/SRV handshake) on each call.
+Clients are created lazily (connect=False): the first query opens the pool.
+
+Pool settings are read from the environment:
+
+    MONGODB_MAX_POOL_SIZE                 (default 20)
+    MONGODB_MIN_POOL_SIZE                 (default 0)
+    MONGODB_MAX_IDLE_TIME_MS              (default 300000)
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS   (default 5000)
+    MONGODB_CONNECT_TIMEOUT_MS            (default 10000)
+    MONGODB_SOCKET_TIMEOUT_MS             (default: no timeout)
+    MONGODB_READ_PREFERENCE               (default "primary")
+"""
+import atexit
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+load_dotenv()
+
+_lock = threading.Lock()
+_clients: Dict[Tuple, MongoClient] = {}
+_client_info: Dict[Tuple, Dict] = {}
+
+
+def _env_int(name: str, default: Optional[int]) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def get_client_options() -> Dict:
+    """
+    Pool, timeout and read preference options for new clients.
+    """
+    return {
+        "maxPoolSize": _env_int("MONGODB_MAX_POOL_SIZE", 20),
+        "minPoolSize": _env_int("MONGODB_MIN_POOL_SIZE", 0),
+        "maxIdleTimeMS": _env_int("MONGODB_MAX_IDLE_TIME_MS", 300_000),
+        "serverSelectionTimeoutMS": _env_int("MONGODB_SERVER_SELECTION_TIMEOUT_MS", 5_000),
+        "connectTimeoutMS": _env_int("MONGODB_CONNECT_TIMEOUT_MS", 10_000),
+        "socketTimeoutMS": _env_int("MONGODB_SOCKET_TIMEOUT_MS", None),
+        "readPreference": os.getenv("MONGODB_READ_PREFERENCE", "primary"),
+    }
+
+
+def _mask_uri(uri: str) -> str:
+    return re.sub(r"//[^@/]+@", "//***@", uri)
+
+
+def get_mongo_client(uri: str = "", **overrides) -> MongoClient:
+    """
+    Return the shared client for `uri` (MONGODB_URI by default).
+    Keyword arguments override the environment options.
+    """
+    uri = uri or os.getenv("MONGODB_URI", "")
+    if not uri:
+        raise ValueError("MONGODB_URI not found in environment variables")
+
+    options = get_client_options()
+    options.update(overrides)
+    options = {name: value for name, value in options.items() if value is not None}
+    key = (uri, tuple(sorted(options.items())))
+
+    # The counter is updated under the lock too: close_all_clients may
+    # clear the registry at any time
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = MongoClient(uri, connect=False, appname="ai-khichuri", **options)
+            _clients[key] = client
+            _client_info[key] = {
+                "uri": _mask_uri(uri),
+                "options": options,
+                "created_at": time.time(),
+                "requests": 0,
+            }
+            print("MongoDB client created ✅")
+        _client_info[key]["requests"] += 1
+    return client
+
+
+def client_health(uri: str = "") -> Dict:
+    """
+    Ping the shared client and report round-trip latency.
+    """
+    start = time.perf_counter()
+    try:
+        get_mongo_client(uri).admin.command("ping")
+        return {"ok": True, "latency_ms": (time.perf_counter() - start) * 1000}
+    except Exception as exc:
+        return {"ok": False, "error": str(exc), "latency_ms": (time.perf_counter() - start) * 1000}
+
+
+def client_stats() -> List[Dict]:
+    """
+    Describe every registered client: masked uri, options, age, number of
+    times it was handed out and the servers it is connected to.
+    """
+    with _lock:
+        clients = [(client, dict(_client_info[key])) for key, client in _clients.items()]
+    stats = []
+    for client, info in clients:
+        info["age_s"] = time.time() - info.pop("created_at")
+        info["nodes"] = sorted(f"{host}:{port}" for host, port in client.nodes)
+        stats.append(info)
+    return stats
+
+
+def close_all_clients() -> None:
+    """
+    Close every registered client. Registered to run at interpreter exit.
+    """
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+        _client_info.clear()
+
+
+atexit.register(close_all_clients)
@@ -0,0 +1,483 @@
+"""
+Response cache for chat models returned by get_chat_model.
+
+Two lookup modes:
+- exact: key = hash of the normalized message list + provider/model/temperature
+- semantic (optional): the last user message is embedded with a local model
+  and compared against earlier questions asked with the same model params
+  and the same preceding conversation; a cosine similarity above
+  `similarity_threshold` is a hit.
+
+Entries expire after `ttl` seconds and the least recently used ones are
+evicted beyond `max_entries`. Storage is pluggable: InMemoryBackend,
+SQLiteBackend or MongoBackend.
+
+Configured from the environment by get_response_cache():
+
+    RESPONSE_CACHE_BACKEND               memory | sqlite | mongo (default memory)
+    RESPONSE_CACHE_PATH                  SQLite file (default response_cache.sqlite3)
+    RESPONSE_CACHE_TTL                   seconds (default 86400)
+    RESPONSE_CACHE_MAX_ENTRIES           (default 10000)
+    RESPONSE_CACHE_SIMILARITY_THRESHOLD  0 disables semantic mode (default 0)
+    RESPONSE_CACHE_EMBEDDING_MODEL       sentence-transformers model
+                                         (default all-MiniLM-L6-v2)
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage
+
+from backend.basic_chat.chat_model import message_text
+
+
+# -----------------------------
+# Keys
+# -----------------------------
+def _role(message) -> str:
+    if isinstance(message, SystemMessage):
+        return "system"
+    if isinstance(message, HumanMessage):
+        return "user"
+    return "assistant"
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", str(text)).strip().lower()
+
+
+def normalize_messages(messages: List) -> List[Tuple[str, str]]:
+    return [(_role(msg), normalize_text(msg.content)) for msg in messages]
+
+
+def _hash(value) -> str:
+    return hashlib.sha256(json.dumps(value, ensure_ascii=False).encode()).hexdigest()
+
+
+def exact_key(messages: List, params: Dict) -> str:
+    return _hash([sorted(params.items()), normalize_messages(messages)])
+
+
+def context_key(messages: List, params: Dict) -> str:
+    """
+    Groups semantic entries: same params and same conversation before the
+    last message.
+    """
+    return _hash([sorted(params.items()), normalize_messages(messages[:-1])])
+
+
+# -----------------------------
+# Storage backends
+# -----------------------------
+class InMemoryBackend:
+    """
+    Process-local LRU dictionary.
+    """
+
+    def __init__(self, max_entries: int = 10_000, ttl: float = 86_400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry["created_at"] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: Dict) -> List[str]:
+        """
+        Store an entry; returns the keys evicted to stay within max_entries.
+        """
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[0])
+            return evicted
+
+    def entries(self) -> Iterator[Tuple[str, Dict]]:
+        with self._lock:
+            items = list(self._entries.items())
+        now = time.time()
+        return iter([(key, entry) for key, entry in items if now - entry["created_at"] <= self.ttl])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """
+    Entries persisted in a local SQLite file, shared by every process on the host.
+    """
+
+    def __init__(self, path: str = "response_cache.sqlite3", max_entries: int = 10_000, ttl: float = 86_400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, group_key TEXT, response TEXT, embedding TEXT,"
+            " created_at REAL, last_access REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._conn.commit()
+
+    def _row_to_entry(self, row) -> Dict:
+        return {
+            "group_key": row[1],
+            "response": row[2],
+            "embedding": json.loads(row[3]) if row[3] else None,
+            "created_at": row[4],
+        }
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT key, group_key, response, embedding, created_at FROM responses"
+                " WHERE key = ? AND created_at >= ?",
+                (key, time.time() - self.ttl)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return self._row_to_entry(row)
+
+    def set(self, key: str, entry: Dict) -> List[str]:
+        now = time.time()
+        embedding = json.dumps(entry["embedding"]) if entry.get("embedding") is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, entry.get("group_key"), entry["response"], embedding, entry["created_at"], now)
+            )
+            self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            evicted = [
+                row[0] for row in self._conn.execute(
+                    "SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?",
+                    (self.max_entries,)
+                )
+            ]
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", [(k,) for k in evicted])
+            self._conn.commit()
+            return evicted
+
+    def entries(self) -> Iterator[Tuple[str, Dict]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, group_key, response, embedding, created_at FROM responses"
+                " WHERE created_at >= ?",
+                (time.time() - self.ttl,)
+            ).fetchall()
+        return iter([(row[0], self._row_to_entry(row)) for row in rows])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class MongoBackend:
+    """
+    Entries shared across hosts in a MongoDB collection. Expiry uses a TTL
+    index on created_at.
+    """
+
+    def __init__(self, collection, max_entries: int = 10_000, ttl: float = 86_400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.collection = collection
+        collection.create_index("created_at", expireAfterSeconds=int(ttl))
+        collection.create_index("last_access")
+
+    def get(self, key: str) -> Optional[Dict]:
+        from datetime import datetime, timedelta
+        doc = self.collection.find_one_and_update(
+            {"_id": key, "created_at": {"$gte": datetime.utcnow() - timedelta(seconds=self.ttl)}},
+            {"$set": {"last_access": datetime.utcnow()}},
+            {"_id": 0, "last_access": 0}
+        )
+        if doc is None:
+            return None
+        doc["created_at"] = doc["created_at"].timestamp()
+        return doc
+
+    def set(self, key: str, entry: Dict) -> List[str]:
+        from datetime import datetime
+        doc = dict(entry)
+        doc["created_at"] = datetime.utcfromtimestamp(entry["created_at"])
+        doc["last_access"] = datetime.utcnow()
+        self.collection.replace_one({"_id": key}, doc, upsert=True)
+
+        overflow = self.collection.estimated_document_count() - self.max_entries
+        if overflow <= 0:
+            return []
+        evicted = [
+            doc["_id"] for doc in
+            self.collection.find({}, {"_id": 1}).sort("last_access", 1).limit(overflow)
+        ]
+        self.collection.delete_many({"_id": {"$in": evicted}})
+        return evicted
+
+    def entries(self) -> Iterator[Tuple[str, Dict]]:
+        for doc in self.collection.find({"embedding": {"$ne": None}}, {"last_access": 0}):
+            key = doc.pop("_id")
+            doc["created_at"] = doc["created_at"].timestamp()
+            yield key, doc
+
+    def __len__(self) -> int:
+        return self.collection.estimated_document_count()
+
+
+# -----------------------------
+# Semantic index
+# -----------------------------
+class VectorIndex:
+    """
+    In-memory matrix of normalized embeddings, searched per group.
+    Each group's matrix has spare rows and doubles when full, so adding n
+    embeddings costs O(n) copies. Shared by every session thread, so all
+    access goes through a lock.
+    """
+
+    def __init__(self):
+        import numpy as np
+        self._np = np
+        self._groups: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def _normalized(self, embedding: List[float]):
+        np = self._np
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def add(self, group_key: str, key: str, embedding: List[float]) -> None:
+        np = self._np
+        vector = self._normalized(embedding)
+        with self._lock:
+            group = self._groups.get(group_key)
+            if group is None:
+                group = self._groups[group_key] = {"keys": [], "matrix": np.empty((4, vector.shape[0]), np.float32)}
+            size = len(group["keys"])
+            if size == len(group["matrix"]):
+                matrix = np.empty((size * 2, vector.shape[0]), np.float32)
+                matrix[:size] = group["matrix"]
+                group["matrix"] = matrix
+            group["matrix"][size] = vector
+            group["keys"].append(key)
+
+    def remove(self, keys: List[str]) -> None:
+        removed = set(keys)
+        with self._lock:
+            for group_key, group in list(self._groups.items()):
+                keep = [i for i, key in enumerate(group["keys"]) if key not in removed]
+                if len(keep) == len(group["keys"]):
+                    continue
+                if not keep:
+                    del self._groups[group_key]
+                    continue
+                # Compact in place; fancy indexing copies before assigning
+                group["matrix"][:len(keep)] = group["matrix"][keep]
+                group["keys"] = [group["keys"][i] for i in keep]
+
+    def search(self, group_key: str, embedding: List[float]) -> Tuple[Optional[str], float]:
+        vector = self._normalized(embedding)
+        with self._lock:
+            group = self._groups.get(group_key)
+            if not group:
+                return None, 0.0
+            scores = group["matrix"][:len(group["keys"])] @ vector
+            best = int(scores.argmax())
+            return group["keys"][best], float(scores[best])
+
+
+def load_embedding_function(model_name: str = "all-MiniLM-L6-v2") -> Callable[[str], List[float]]:
+    """
+    Local CPU sentence embedding model (requires sentence-transformers).
+    """
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name, device="cpu")
+    return lambda text: model.encode(text, normalize_embeddings=True).tolist()
+
+
+# -----------------------------
+# Cache
+# -----------------------------
+class ResponseCache:
+    def __init__(
+        self,
+        backend=None,
+        embed_fn: Optional[Callable[[str], List[float]]] = None,
+        similarity_threshold: float = 0.0
+    ):
+        """
+        backend: storage backend (InMemoryBackend by default).
+        embed_fn / similarity_threshold: enable semantic lookups when both are set.
+        """
+        self.backend = backend or InMemoryBackend()
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self.semantic = bool(embed_fn and similarity_threshold > 0)
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+        self._stats_lock = threading.Lock()
+        self._index = None
+        if self.semantic:
+            self._index = VectorIndex()
+            for key, entry in self.backend.entries():
+                if entry.get("embedding") is not None:
+                    self._index.add(entry["group_key"], key, entry["embedding"])
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def lookup(self, messages: List, params: Dict) -> Optional[str]:
+        """
+        Return the cached response for this request, or None.
+        """
+        entry = self.backend.get(exact_key(messages, params))
+        if entry is not None:
+            self._count("exact_hits")
+            return entry["response"]
+
+        if self.semantic and messages:
+            embedding = self.embed_fn(normalize_text(messages[-1].content))
+            key, score = self._index.search(context_key(messages, params), embedding)
+            if key is not None and score >= self.similarity_threshold:
+                entry = self.backend.get(key)
+                if entry is not None:
+                    self._count("semantic_hits")
+                    return entry["response"]
+
+        self._count("misses")
+        return None
+
+    def store(self, messages: List, params: Dict, response: str) -> None:
+        key = exact_key(messages, params)
+        entry = {
+            "group_key": context_key(messages, params),
+            "response": response,
+            "embedding": None,
+            "created_at": time.time(),
+        }
+        if self.semantic and messages:
+            entry["embedding"] = self.embed_fn(normalize_text(messages[-1].content))
+
+        evicted = self.backend.set(key, entry)
+        if self._index is not None:
+            self._index.remove(evicted + [key])
+            if entry["embedding"] is not None:
+                self._index.add(entry["group_key"], key, entry["embedding"])
+
+    def metrics(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+        hits = stats["exact_hits"] + stats["semantic_hits"]
+        stats["lookups"] = lookups
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        stats["entries"] = len(self.backend)
+        return stats
+
+
+class CachedChatModel:
+    """
+    Wraps a chat model so invoke/stream consult the cache first.
+    Hits return immediately; misses call the model and store the reply,
+    keyed on the provider that actually answered when the model is a
+    ModelRouter that fell back.
+    """
+
+    def __init__(self, model, cache: ResponseCache, params: Dict):
+        self.model = model
+        self.cache = cache
+        self.params = params
+        self.last_hit = False
+
+    def invoke(self, messages: List, **kwargs) -> AIMessage:
+        cached = self.cache.lookup(messages, self.params)
+        self.last_hit = cached is not None
+        if cached is not None:
+            return AIMessage(content=cached)
+        response = self.model.invoke(messages, **kwargs)
+        self._store(messages, message_text(response))
+        return response
+
+    def stream(self, messages: List, **kwargs) -> Iterator:
+        cached = self.cache.lookup(messages, self.params)
+        self.last_hit = cached is not None
+        if cached is not None:
+            yield AIMessageChunk(content=cached)
+            return
+        parts = []
+        for chunk in self.model.stream(messages, **kwargs):
+            # Gemini streams lists of parts instead of strings
+            parts.append(message_text(chunk))
+            yield chunk
+        self._store(messages, "".join(parts))
+
+    def _store(self, messages: List, text: str) -> None:
+        # An empty reply would be served as a (wrong) hit from now on
+        if not text:
+            return
+        params = self.params
+        # A fallback answer must not be cached under the selected model
+        answered = getattr(self.model, "last_provider", "")
+        if answered:
+            provider, _, model_name = answered.partition(":")
+            params = dict(params, provider=provider, model_name=model_name)
+        self.cache.store(messages, params, text)
+
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Process-wide cache configured from RESPONSE_CACHE_* environment variables.
+    """
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is not None:
+            return _response_cache
+
+        ttl = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+        max_entries = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+        backend_name = os.getenv("RESPONSE_CACHE_BACKEND", "memory").lower()
+
+        if backend_name == "sqlite":
+            path = os.getenv("RESPONSE_CACHE_PATH", "response_cache.sqlite3")
+            backend = SQLiteBackend(path, max_entries=max_entries, ttl=ttl)
+        elif backend_name == "mongo":
+            from backend.basic_chat.history_management import get_mongodb_database
+            backend = MongoBackend(get_mongodb_database()["response_cache"], max_entries=max_entries, ttl=ttl)
+        elif backend_name == "memory":
+            backend = InMemoryBackend(max_entries=max_entries, ttl=ttl)
+        else:
+            raise ValueError(f"Unsupported response cache backend: {backend_name}")
+
+        threshold = float(os.getenv("RESPONSE_CACHE_SIMILARITY_THRESHOLD", "0"))
+        embed_fn = None
+        if threshold > 0:
+            embed_fn = load_embedding_function(
+                os.getenv("RESPONSE_CACHE_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+            )
+
+        _response_cache = ResponseCache(backend, embed_fn, threshold)
+        return _response_cache
@@ -0,0 +1,89 @@
+import sys
+
+from backend.metrics import ENABLED, export_prometheus, reset, snapshot
+
+# Operation name prefix -> component shown in the breakdown
+COMPONENTS = {
+    "llm": "LLM",
+    "chat": "Chat pipeline",
+    "mongo": "MongoDB",
+    "image": "Prompt rewrite / image store",
+    "diffusion": "Diffusion",
+}
+
+
+def component_breakdown(rows):
+    totals = {}
+    for row in rows:
+        component = COMPONENTS.get(row["operation"].split(".")[0], "Other")
+        totals[component] = totals.get(component, 0.0) + row["total_s"]
+    return totals
+
+
+def diagnostics_interface(st):
+    st.title("📊 Diagnostics")
+    st.caption("Where the time goes in this server process since it started (or since the last reset)")
+
+    if not ENABLED:
+        st.info("Metrics are disabled. Set METRICS_ENABLED=1 and restart the app to record them.")
+        return
+
+    rows = snapshot()
+    if not rows:
+        st.info("Nothing recorded yet. Use the chat or image features, then come back.")
+    else:
+        totals = component_breakdown(rows)
+        st.subheader("Time per component")
+        st.bar_chart(totals)
+        bottleneck = max(totals, key=totals.get)
+        st.caption(f"Most time is spent in: **{bottleneck}** ({totals[bottleneck]:.1f}s)")
+
+        st.subheader("Operations")
+        st.dataframe(
+            [
+                {
+                    "operation": row["operation"],
+                    "calls": row["count"],
+                    "errors": row["errors"],
+                    "error rate": f"{row['error_rate']:.1%}",
+                    "total s": round(row["total_s"], 3),
+                    "mean ms": round(row["mean_s"] * 1000, 1),
+                    "p50 ms": round(row["p50_s"] * 1000, 1),
+                    "p95 ms": round(row["p95_s"] * 1000, 1),
+                    "p99 ms": round(row["p99_s"] * 1000, 1),
+                    "mean payload": None if row["mean_payload"] is None else round(row["mean_payload"]),
+                }
+                for row in rows
+            ],
+            use_container_width=True
+        )
+
+    # Component state, only for features already loaded in this process
+    if "backend.basic_chat.model_router" in sys.modules:
+        from backend.basic_chat.model_router import provider_health_report
+        with st.expander("LLM provider health"):
+            st.json(provider_health_report())
+    if "backend.basic_chat.response_cache" in sys.modules:
+        from backend.basic_chat.response_cache import get_response_cache
+        with st.expander("Response cache"):
+            st.json(get_response_cache().metrics())
+    if "backend.basic_chat.mongo_client" in sys.modules:
+        from backend.basic_chat.mongo_client import client_stats
+        with st.expander("MongoDB clients"):
+            st.json(client_stats())
+    if "backend.text_to_image.multimodels" in sys.modules:
+        from backend.text_to_image.multimodels import get_generation_worker, get_pipeline_manager
+        with st.expander("Image generation"):
+            st.json({
+                "pipeline": get_pipeline_manager().metrics(),
+                "worker": get_generation_worker().metrics(),
+            })
+
+    with st.expander("Prometheus export"):
+        text = export_prometheus()
+        st.code(text, language="text")
+        st.download_button("Download metrics.txt", text, file_name="metrics.txt")
+
+    if st.button("Reset metrics"):
+        reset()
+        st.rerun()
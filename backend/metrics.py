@@ -0,0 +1,288 @@
+"""
+Lightweight instrumentation for the hot paths (LLM calls, Mongo, prompt
+rewriting, diffusion).
+
+Every operation gets a latency histogram, a call count, an error count
+and, when a size is known, a payload-size histogram:
+
+    @instrument("mongo.get_conversation_history", payload=text_size)
+    def get_conversation_history(...): ...
+
+    with measure("diffusion.generate") as m:
+        result = pipeline(prompts)
+        m.payload(len(prompts))
+
+`export_prometheus()` renders everything in the Prometheus text format
+(served on METRICS_PORT when it is set) and the "📊 Diagnostics" page of
+app.py shows it in the UI.
+
+    METRICS_ENABLED   0 disables recording (default 1). Decorators then
+                      return the function unchanged and `measure` is a
+                      shared no-op, so the cost is a function call.
+    METRICS_PORT      serve /metrics over HTTP on this port (default off)
+"""
+import functools
+import inspect
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional
+
+ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# Upper bounds of the histogram buckets (Prometheus "le")
+LATENCY_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+PAYLOAD_BUCKETS = [64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216]
+
+
+class Histogram:
+    def __init__(self, bounds: List[float]):
+        self.bounds = bounds
+        # One count per bucket plus +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate by linear interpolation inside the bucket, like
+        Prometheus histogram_quantile.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.bounds[-1]
+
+
+class OperationStats:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.payload = Histogram(PAYLOAD_BUCKETS)
+        self.errors = 0
+
+
+_operations: Dict[str, OperationStats] = {}
+_lock = threading.Lock()
+
+
+def record(operation: str, seconds: float, error: bool = False, payload_bytes: Optional[int] = None) -> None:
+    if not ENABLED:
+        return
+    with _lock:
+        stats = _operations.get(operation)
+        if stats is None:
+            stats = _operations[operation] = OperationStats()
+        stats.latency.observe(seconds)
+        if error:
+            stats.errors += 1
+        if payload_bytes is not None:
+            stats.payload.observe(payload_bytes)
+
+
+class _Measurement:
+    __slots__ = ("operation", "start", "size")
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.size: Optional[int] = None
+
+    def payload(self, size: int) -> None:
+        self.size = size
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        record(self.operation, time.perf_counter() - self.start, exc_type is not None, self.size)
+        return False
+
+
+class _NoopMeasurement:
+    def payload(self, size: int) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+_NOOP = _NoopMeasurement()
+
+
+def measure(operation: str):
+    """
+    Context manager that records the duration (and errors) of its block.
+    Call `.payload(size)` on it to record a payload size.
+    """
+    if not ENABLED:
+        return _NOOP
+    return _Measurement(operation)
+
+
+def instrument(operation: str, payload: Optional[Callable] = None, payload_arg: str = ""):
+    """
+    Decorator recording every call of a function as `operation`.
+    payload: called with the return value to get its size.
+    payload_arg: name of an argument whose text_size is the payload instead
+    (e.g. the messages of a write).
+    """
+    def decorator(function):
+        if not ENABLED:
+            return function
+        signature = inspect.signature(function) if payload_arg else None
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            except BaseException:
+                record(operation, time.perf_counter() - start, error=True)
+                raise
+            size = None
+            try:
+                if payload_arg:
+                    size = text_size(signature.bind_partial(*args, **kwargs).arguments.get(payload_arg, ""))
+                elif payload is not None:
+                    size = payload(result)
+            except Exception:
+                size = None
+            record(operation, time.perf_counter() - start, payload_bytes=size)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def text_size(value) -> int:
+    """
+    Approximate payload size of a message, a list of messages or a string.
+    """
+    if isinstance(value, (list, tuple)):
+        return sum(text_size(item) for item in value)
+    if isinstance(value, dict):
+        return len(str(value.get("content", "")))
+    content = getattr(value, "content", value)
+    return len(content) if isinstance(content, (str, bytes)) else len(str(content))
+
+
+# -------------------------------
+# Reports
+# -------------------------------
+def snapshot() -> List[Dict]:
+    """
+    One summary row per operation, slowest total time first.
+    """
+    with _lock:
+        rows = []
+        for operation, stats in _operations.items():
+            latency = stats.latency
+            rows.append({
+                "operation": operation,
+                "count": latency.count,
+                "errors": stats.errors,
+                "error_rate": stats.errors / latency.count if latency.count else 0.0,
+                "total_s": latency.total,
+                "mean_s": latency.total / latency.count if latency.count else 0.0,
+                "p50_s": latency.quantile(0.5),
+                "p95_s": latency.quantile(0.95),
+                "p99_s": latency.quantile(0.99),
+                "mean_payload": stats.payload.total / stats.payload.count if stats.payload.count else None,
+            })
+    return sorted(rows, key=lambda row: -row["total_s"])
+
+
+def reset() -> None:
+    with _lock:
+        _operations.clear()
+
+
+def _histogram_lines(name: str, operation: str, histogram: Histogram) -> List[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.bounds + [float("inf")], histogram.counts):
+        cumulative += count
+        le = "+Inf" if bound == float("inf") else repr(float(bound))
+        lines.append(f'{name}_bucket{{operation="{operation}",le="{le}"}} {cumulative}')
+    lines.append(f'{name}_sum{{operation="{operation}"}} {histogram.total}')
+    lines.append(f'{name}_count{{operation="{operation}"}} {histogram.count}')
+    return lines
+
+
+def export_prometheus() -> str:
+    lines = [
+        "# HELP app_operation_duration_seconds Duration of instrumented operations.",
+        "# TYPE app_operation_duration_seconds histogram",
+    ]
+    with _lock:
+        operations = sorted(_operations.items())
+        for operation, stats in operations:
+            lines += _histogram_lines("app_operation_duration_seconds", operation, stats.latency)
+        lines += [
+            "# HELP app_operation_errors_total Failed calls of instrumented operations.",
+            "# TYPE app_operation_errors_total counter",
+        ]
+        for operation, stats in operations:
+            lines.append(f'app_operation_errors_total{{operation="{operation}"}} {stats.errors}')
+        lines += [
+            "# HELP app_operation_payload_bytes Payload size of instrumented operations.",
+            "# TYPE app_operation_payload_bytes histogram",
+        ]
+        for operation, stats in operations:
+            if stats.payload.count:
+                lines += _histogram_lines("app_operation_payload_bytes", operation, stats.payload)
+    return "\n".join(lines) + "\n"
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = 0):
+    """
+    Serve export_prometheus() on `port` (default METRICS_PORT) once per process.
+    """
+    global _server
+    port = port or int(os.getenv("METRICS_PORT", "0"))
+    if not port:
+        return None
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") not in ("", "/metrics"):
+                self.send_error(404)
+                return
+            body = export_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+            print(f"✅ Metrics served on :{port}/metrics")
+        return _server
@@ -0,0 +1,270 @@
+"""
+Incremental, resumable PDF ingestion.
+
+Uploads are stored by content (`<PDF_DATA_DIR>/inputs/<sha256>.pdf`), so the
+same file uploaded under another name is recognised instead of processed
+again. A SQLite manifest records every document and, per page, the page
+hash and how its text was obtained:
+
+    documents   sha256, name, path, page_count, status (ingesting/complete)
+    pages       document sha256, page, page hash, method, chars
+
+Extracted text (native or OCR) is cached on disk per page hash under
+`<PDF_DATA_DIR>/pages/`. Documents already complete in the manifest are
+skipped by the CLI, and re-ingesting one reads every page back from the
+cache by its stored hash, without a process pool or re-hashing. After a
+crash, only the pages not yet recorded are hashed and extracted; a new
+version of a document in which a few pages changed only extracts the pages
+whose hash has no cached text.
+
+    python -m backend.pdf_to_text.ingestion corpus/*.pdf --workers 4
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+from backend.pdf_to_text.ocr import ocr_image_file
+from backend.pdf_to_text.pdf_services import extract_pages, file_sha256, get_data_dir
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp"}
+
+
+class IngestionManifest:
+    def __init__(self, db_path: str = ""):
+        self.db_path = db_path or os.path.join(get_data_dir(), "manifest.sqlite3")
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " sha256 TEXT PRIMARY KEY, name TEXT, path TEXT, page_count INTEGER,"
+                " status TEXT, created_at REAL, updated_at REAL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                " sha256 TEXT, page INTEGER, page_hash TEXT, method TEXT, chars INTEGER,"
+                " PRIMARY KEY (sha256, page))"
+            )
+
+    def get_document(self, sha256: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM documents WHERE sha256 = ?", (sha256,)).fetchone()
+        return dict(row) if row else None
+
+    def is_complete(self, sha256: str) -> bool:
+        document = self.get_document(sha256)
+        return bool(document) and document["status"] == "complete"
+
+    def start_document(self, sha256: str, name: str, path: str) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO documents VALUES (?, ?, ?, NULL, 'ingesting', ?, ?)"
+                " ON CONFLICT(sha256) DO UPDATE SET name = excluded.name, path = excluded.path,"
+                " status = CASE status WHEN 'complete' THEN 'complete' ELSE 'ingesting' END,"
+                " updated_at = excluded.updated_at",
+                (sha256, name, path, now, now)
+            )
+
+    def record_page(self, sha256: str, result: Dict) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+                (sha256, result["page"], result["page_hash"], result["method"], len(result["text"]))
+            )
+
+    def complete_document(self, sha256: str, page_count: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE documents SET status = 'complete', page_count = ?, updated_at = ? WHERE sha256 = ?",
+                (page_count, time.time(), sha256)
+            )
+
+    def pages(self, sha256: str) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM pages WHERE sha256 = ? ORDER BY page", (sha256,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def documents(self) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM documents ORDER BY updated_at DESC").fetchall()
+        return [dict(row) for row in rows]
+
+
+_manifest: Optional[IngestionManifest] = None
+_manifest_lock = threading.Lock()
+
+
+def get_manifest() -> IngestionManifest:
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = IngestionManifest()
+        return _manifest
+
+
+def get_input_dir() -> str:
+    return os.path.join(get_data_dir(), "inputs")
+
+
+def get_page_cache_dir() -> str:
+    return os.path.join(get_data_dir(), "pages")
+
+
+def _copy(source, path: str) -> None:
+    # Copy in chunks instead of holding a second copy of the file
+    with open(path, "wb") as f:
+        for chunk in iter(lambda: source.read(1 << 20), b""):
+            f.write(chunk)
+
+
+def store_input(source, name: str = "") -> Dict:
+    """
+    Copy a file (path or binary file object) into the content-addressed
+    input folder. Returns {"sha256", "path", "name"}.
+    """
+    input_dir = get_input_dir()
+    os.makedirs(input_dir, exist_ok=True)
+    tmp_path = os.path.join(input_dir, f".upload-{os.getpid()}-{threading.get_ident()}.tmp")
+    if isinstance(source, str):
+        name = name or os.path.basename(source)
+        with open(source, "rb") as f:
+            _copy(f, tmp_path)
+    else:
+        _copy(source, tmp_path)
+
+    sha256 = file_sha256(tmp_path)
+    extension = os.path.splitext(name)[1].lower() or ".pdf"
+    path = os.path.join(input_dir, f"{sha256}{extension}")
+    if os.path.exists(path):
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, path)
+    return {"sha256": sha256, "path": path, "name": name or os.path.basename(path)}
+
+
+def ingest_document(
+    path: str,
+    sha256: str = "",
+    name: str = "",
+    manifest: Optional[IngestionManifest] = None,
+    stats: Optional[Dict] = None,
+    **options
+) -> Iterator[Dict]:
+    """
+    Yield the pages of a document (see extract_pages), recording each one
+    in the manifest and caching its text per page hash. Pages with cached
+    text are not extracted again, and pages already in the manifest are
+    read from the cache by their stored hash. `options` go to extract_pages.
+    """
+    manifest = manifest or get_manifest()
+    sha256 = sha256 or file_sha256(path)
+    stats = {} if stats is None else stats
+    manifest.start_document(sha256, name or os.path.basename(path), path)
+    known_hashes = {page["page"]: page["page_hash"] for page in manifest.pages(sha256) if page["page_hash"]}
+
+    for result in extract_pages(
+        path, cache_dir=get_page_cache_dir(), stats=stats, known_hashes=known_hashes, **options
+    ):
+        if known_hashes.get(result["page"]) != result["page_hash"]:
+            manifest.record_page(sha256, result)
+        yield result
+    manifest.complete_document(sha256, stats["pages"])
+
+
+def ingest_image(
+    path: str,
+    sha256: str = "",
+    name: str = "",
+    manifest: Optional[IngestionManifest] = None,
+    stats: Optional[Dict] = None
+) -> Iterator[Dict]:
+    """
+    OCR an uploaded image as a one-page document (same results and
+    manifest records as ingest_document). Without the OCR packages or the
+    tesseract binary the page is recorded empty, with method "none" and
+    the reason in "error", and the document is not marked complete.
+    """
+    manifest = manifest or get_manifest()
+    sha256 = sha256 or file_sha256(path)
+    stats = {} if stats is None else stats
+    manifest.start_document(sha256, name or os.path.basename(path), path)
+
+    start = time.perf_counter()
+    try:
+        ocr = ocr_image_file(path)
+    except (ImportError, OSError, RuntimeError) as exc:
+        ocr = {
+            "text": "",
+            "cached": False,
+            "seconds": time.perf_counter() - start,
+            "error": f"OCR unavailable ({exc}); install pypdfium2, pytesseract, Pillow and tesseract",
+        }
+    result = {
+        "page": 0,
+        "text": ocr["text"],
+        "method": "ocr" if ocr["text"].strip() else "none",
+        "page_hash": sha256,
+        "cached": ocr["cached"],
+        "seconds": ocr["seconds"],
+    }
+    if "error" in ocr:
+        result["error"] = ocr["error"]
+    elapsed = time.perf_counter() - start
+    stats.update({
+        "pages": 1, "total_pages": 1, "cached": int(result["cached"]),
+        "text": 0, "ocr": int(result["method"] == "ocr"), "none": int(result["method"] == "none"),
+        "elapsed_s": elapsed, "pages_per_sec": 1 / elapsed if elapsed else 0.0,
+    })
+    manifest.record_page(sha256, result)
+    yield result
+    # Left incomplete without OCR, so it is retried once OCR is installed
+    if "error" not in result:
+        manifest.complete_document(sha256, 1)
+
+
+def ingest(path: str, sha256: str = "", name: str = "", **options) -> Iterator[Dict]:
+    """
+    ingest_image for image files, ingest_document otherwise.
+    """
+    extension = os.path.splitext(name or path)[1].lower()
+    if extension in IMAGE_EXTENSIONS:
+        options.pop("workers", None)
+        options.pop("ocr", None)
+        return ingest_image(path, sha256, name, **options)
+    return ingest_document(path, sha256, name, **options)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest PDFs and images, extracting only new or changed pages")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--no-ocr", action="store_true", help="Use the text layer only")
+    args = parser.parse_args()
+
+    manifest = get_manifest()
+    for path in args.paths:
+        stored = store_input(path)
+        if manifest.is_complete(stored["sha256"]):
+            print(f"✅ {stored['name']}: already ingested, skipped")
+            continue
+        stats = {}
+        for _ in ingest(stored["path"], stored["sha256"], stored["name"], stats=stats,
+                        workers=args.workers, ocr=not args.no_ocr):
+            pass
+        print(
+            f"✅ {stored['name']}: {stats['pages']} pages, {stats['cached']} from cache, "
+            f"{stats['pages'] - stats['cached']} extracted ({stats.get('pages_per_sec', 0):.1f} pages/sec)"
+        )
+
+
+if __name__ == "__main__":
+    main()
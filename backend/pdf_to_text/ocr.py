@@ -0,0 +1,289 @@
+"""
+OCR for scanned PDF pages and uploaded images.
+
+    rasterize -> grayscale -> deskew -> Otsu binarization -> tesseract
+
+Pages are rendered at an adaptive DPI: enough pixels on the long side for
+tesseract (`OCR_TARGET_PIXELS`), clamped to [OCR_MIN_DPI, OCR_MAX_DPI], so
+small pages are not under-sampled and posters are not rendered at 300 DPI.
+Preprocessing is vectorized NumPy (the deskew search scores candidate
+angles on a downsampled copy). Results are cached on disk by the hash of
+the preprocessed image and the OCR settings.
+
+`OcrPool` runs recognition in a process pool sized to the available cores
+with a per-page timeout; pdf_services calls `ocr_pdf_page` directly since
+its page workers already are a process pool.
+
+Requires the optional `pypdfium2` (rendering), `pytesseract` and `Pillow`
+packages and the tesseract binary.
+
+    OCR_LANG            tesseract language (default eng)
+    OCR_PAGE_TIMEOUT    seconds per page (default 60)
+    OCR_CACHE_DIR       result cache (default <PDF_DATA_DIR>/ocr)
+"""
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from collections import deque
+from typing import Deque, Dict, Iterable, Iterator, Optional
+
+import numpy as np
+
+from backend.pdf_to_text.pdf_services import get_data_dir
+
+OCR_TARGET_PIXELS = 3000
+OCR_MIN_DPI = 150
+OCR_MAX_DPI = 400
+MAX_SKEW_DEGREES = 5.0
+SKEW_STEP_DEGREES = 0.5
+# Long side of the copy used to estimate skew
+SKEW_SAMPLE_PIXELS = 800
+
+
+def available_cores() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def get_ocr_lang() -> str:
+    return os.getenv("OCR_LANG", "eng")
+
+
+def get_page_timeout() -> float:
+    return float(os.getenv("OCR_PAGE_TIMEOUT", "60"))
+
+
+def get_cache_dir() -> str:
+    return os.getenv("OCR_CACHE_DIR", os.path.join(get_data_dir(), "ocr"))
+
+
+# -------------------------------
+# Rasterization
+# -------------------------------
+def choose_dpi(width_pt: float, height_pt: float, target_pixels: int = OCR_TARGET_PIXELS) -> int:
+    """
+    DPI that renders the long side of a page (size in points) at about
+    `target_pixels`, clamped to [OCR_MIN_DPI, OCR_MAX_DPI].
+    """
+    long_side_inches = max(width_pt, height_pt) / 72 or 1.0
+    return int(min(OCR_MAX_DPI, max(OCR_MIN_DPI, target_pixels / long_side_inches)))
+
+
+def rasterize_page(path: str, page_number: int, dpi: int = 0) -> np.ndarray:
+    """
+    Render one PDF page to an RGB array, at an adaptive DPI unless `dpi` is given.
+    """
+    import pypdfium2
+
+    document = pypdfium2.PdfDocument(path)
+    try:
+        page = document[page_number]
+        dpi = dpi or choose_dpi(*page.get_size())
+        return np.asarray(page.render(scale=dpi / 72).to_pil().convert("RGB"))
+    finally:
+        document.close()
+
+
+def load_image(path: str) -> np.ndarray:
+    from PIL import Image
+
+    with Image.open(path) as image:
+        # Scale small scans up to the OCR resolution, like PDF pages
+        scale = OCR_TARGET_PIXELS / max(image.size)
+        if scale > 1:
+            image = image.resize((round(image.width * scale), round(image.height * scale)))
+        return np.asarray(image.convert("RGB"))
+
+
+# -------------------------------
+# Preprocessing
+# -------------------------------
+def to_grayscale(image: np.ndarray) -> np.ndarray:
+    if image.ndim == 2:
+        return image.astype(np.uint8)
+    weights = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    return (image[..., :3].astype(np.float32) @ weights).clip(0, 255).astype(np.uint8)
+
+
+def otsu_threshold(gray: np.ndarray) -> int:
+    """
+    Threshold that maximizes the between-class variance of the histogram.
+    """
+    histogram = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    weight_dark = np.cumsum(histogram)
+    weight_light = weight_dark[-1] - weight_dark
+    sum_dark = np.cumsum(histogram * levels)
+    mean_dark = sum_dark / np.maximum(weight_dark, 1)
+    mean_light = (sum_dark[-1] - sum_dark) / np.maximum(weight_light, 1)
+    between = weight_dark * weight_light * (mean_dark - mean_light) ** 2
+    return int(between.argmax())
+
+
+def binarize(gray: np.ndarray, threshold: Optional[int] = None) -> np.ndarray:
+    threshold = otsu_threshold(gray) if threshold is None else threshold
+    return np.where(gray > threshold, 255, 0).astype(np.uint8)
+
+
+def _rotate(gray: np.ndarray, angle: float) -> np.ndarray:
+    from PIL import Image
+
+    return np.asarray(Image.fromarray(gray).rotate(angle, resample=Image.BILINEAR, expand=False, fillcolor=255))
+
+
+def estimate_skew(gray: np.ndarray) -> float:
+    """
+    Skew angle in degrees: the rotation whose row profile of ink is the
+    sharpest (text lines become peaks, gaps between them zeros).
+    """
+    step = max(1, max(gray.shape) // SKEW_SAMPLE_PIXELS)
+    sample = gray[::step, ::step]
+    sample = np.where(sample > otsu_threshold(sample), 255, 0).astype(np.uint8)
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-MAX_SKEW_DEGREES, MAX_SKEW_DEGREES + 1e-9, SKEW_STEP_DEGREES):
+        ink = (_rotate(sample, float(angle)) < 128).sum(axis=1).astype(np.float64)
+        score = float(np.square(np.diff(ink)).sum())
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def preprocess(image: np.ndarray) -> np.ndarray:
+    """
+    Grayscale, deskewed, binarized copy of an image for tesseract.
+    """
+    gray = to_grayscale(image)
+    angle = estimate_skew(gray)
+    if angle:
+        gray = _rotate(gray, angle)
+    return binarize(gray)
+
+
+# -------------------------------
+# Recognition
+# -------------------------------
+def _cache_key(binary: np.ndarray, lang: str) -> str:
+    digest = hashlib.sha256()
+    digest.update(f"{binary.shape}|{lang}".encode())
+    digest.update(np.packbits(binary > 127).tobytes())
+    return digest.hexdigest()
+
+
+def recognize(image: np.ndarray, lang: str = "", timeout: float = 0, cache_dir: Optional[str] = None) -> Dict:
+    """
+    Preprocess and OCR an RGB or grayscale array.
+    Returns {"text", "cached", "seconds"}; results are cached in `cache_dir`
+    ("" disables the cache, None uses get_cache_dir()).
+    """
+    import pytesseract
+    from PIL import Image
+
+    start = time.perf_counter()
+    lang = lang or get_ocr_lang()
+    binary = preprocess(image)
+    cache_dir = get_cache_dir() if cache_dir is None else cache_dir
+    cache_path = ""
+    if cache_dir:
+        key = _cache_key(binary, lang)
+        cache_path = os.path.join(cache_dir, key[:2], f"{key}.txt")
+        if os.path.exists(cache_path):
+            with open(cache_path, encoding="utf-8") as f:
+                return {"text": f.read(), "cached": True, "seconds": time.perf_counter() - start}
+
+    # pytesseract kills the tesseract process when the timeout expires
+    text = pytesseract.image_to_string(Image.fromarray(binary), lang=lang, timeout=timeout or get_page_timeout())
+    if cache_path:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, cache_path)
+    return {"text": text, "cached": False, "seconds": time.perf_counter() - start}
+
+
+def ocr_pdf_page(path: str, page_number: int, dpi: int = 0, timeout: float = 0) -> Dict:
+    result = recognize(rasterize_page(path, page_number, dpi), timeout=timeout)
+    result["page"] = page_number
+    return result
+
+
+def ocr_image_file(path: str, timeout: float = 0) -> Dict:
+    return recognize(load_image(path), timeout=timeout)
+
+
+def _run_task(task) -> Dict:
+    kind, path, page_number, timeout = task
+    try:
+        if kind == "pdf":
+            return ocr_pdf_page(path, page_number, timeout=timeout)
+        return dict(ocr_image_file(path, timeout=timeout), page=page_number)
+    except (ImportError, RuntimeError, OSError) as exc:
+        # RuntimeError when the timeout kills tesseract; TesseractNotFoundError
+        # (an OSError) when the binary is missing
+        return {"page": page_number, "text": "", "cached": False, "error": str(exc)}
+
+
+class OcrPool:
+    def __init__(self, workers: int = 0, page_timeout: float = 0, window: int = 0):
+        """
+        workers: processes (default: available cores).
+        page_timeout: seconds per page before giving up on it (default OCR_PAGE_TIMEOUT).
+        window: tasks in flight (default 2 per worker), bounding memory.
+        """
+        self.workers = workers or available_cores()
+        self.page_timeout = page_timeout or get_page_timeout()
+        self.window = window or self.workers * 2
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def close(self) -> None:
+        self._executor.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _map(self, tasks: Iterable, stats: Optional[Dict]) -> Iterator[Dict]:
+        stats = {} if stats is None else stats
+        stats.update({"pages": 0, "cached": 0, "failed": 0})
+        start = time.perf_counter()
+        in_flight: Deque = deque()
+        tasks = iter(tasks)
+        exhausted = False
+        while True:
+            while not exhausted and len(in_flight) < self.window:
+                task = next(tasks, None)
+                if task is None:
+                    exhausted = True
+                    break
+                in_flight.append((task, self._executor.submit(_run_task, task)))
+            if not in_flight:
+                break
+            task, future = in_flight.popleft()
+            try:
+                # Backstop for pages that hang before tesseract starts
+                result = future.result(timeout=self.page_timeout * 2)
+            except TimeoutError:
+                future.cancel()
+                result = {"page": task[2], "text": "", "cached": False, "error": "timeout"}
+            stats["pages"] += 1
+            stats["cached"] += result.get("cached", False)
+            stats["failed"] += "error" in result
+            stats["elapsed_s"] = time.perf_counter() - start
+            stats["pages_per_sec"] = stats["pages"] / stats["elapsed_s"] if stats["elapsed_s"] else 0.0
+            yield result
+
+    def ocr_pdf(self, path: str, page_numbers: Iterable[int], stats: Optional[Dict] = None) -> Iterator[Dict]:
+        """
+        OCR pages of a PDF; results are yielded in the order of `page_numbers`.
+        """
+        return self._map((("pdf", path, page, self.page_timeout) for page in page_numbers), stats)
+
+    def ocr_images(self, paths: Iterable[str], stats: Optional[Dict] = None) -> Iterator[Dict]:
+        """
+        OCR image files; result "page" is the position in `paths`.
+        """
+        return self._map((("image", path, i, self.page_timeout) for i, path in enumerate(paths)), stats)
@@ -0,0 +1,372 @@
+"""
+Retrieval for PDF Chat: chunking, local embeddings and an on-disk index.
+
+Extracted pages are split into overlapping chunks and embedded in batches
+with a local CPU sentence-transformers model. Vectors are written to a
+memory-mapped NumPy matrix per document, keyed by the SHA-256 of the PDF:
+
+    <root>/<sha256>/vectors.npy     float32 (chunks x dim), normalized
+    <root>/<sha256>/chunks.jsonl    {"page", "text"} per row of the matrix
+    <root>/<sha256>/meta.json       embedding model, dim, chunk count
+    <root>/<sha256>/faiss.index     optional HNSW index (faiss installed)
+
+A document whose index already exists is never extracted or embedded
+again. Chunk embeddings are also cached by (model, chunk text) in
+`<root>/embeddings.sqlite3`, so a new version of a document only embeds
+the chunks that changed. Queries embed the question and return the top-k
+chunks, which `answer_question` passes to get_chat_model as context.
+
+    PDF_INDEX_DIR              index root (default <PDF_DATA_DIR>/index)
+    PDF_EMBEDDING_MODEL        sentence-transformers model (default all-MiniLM-L6-v2)
+    PDF_EMBEDDING_BATCH_SIZE   chunks per embedding call (default 64)
+    PDF_INDEX_FAISS            1 = also build an HNSW index when faiss is installed
+"""
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain.messages import HumanMessage, SystemMessage
+
+from backend.basic_chat.chat_model import get_chat_model
+from backend.pdf_to_text.pdf_services import get_data_dir
+
+load_dotenv()
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+DEFAULT_TOP_K = 5
+
+ANSWER_PARAMS = {
+    "provider": "groq",
+    "model_name": "llama-3.1-8b-instant",
+    "temperature": 0.2,
+}
+
+ANSWER_PROMPT = """
+            Answer the question using only the excerpts from the document below.
+            If the excerpts do not contain the answer, say that you could not find it.
+            Mention the page numbers you used.
+        """
+
+
+# -------------------------------
+# Chunking
+# -------------------------------
+def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """
+    Split text into chunks of about `chunk_size` characters overlapping by
+    `overlap`, preferring to cut at whitespace.
+    """
+    if overlap >= chunk_size:
+        raise ValueError("overlap must be smaller than chunk_size")
+    text = " ".join(text.split())
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + chunk_size)
+        if end < len(text):
+            cut = text.rfind(" ", start + chunk_size // 2, end)
+            end = cut if cut > 0 else end
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return [chunk for chunk in chunks if chunk]
+
+
+def chunk_pages(pages: Iterable[Dict], **options) -> Iterator[Dict]:
+    """
+    Chunks of extracted pages (see pdf_services.extract_pages), tagged
+    with their 1-based page number.
+    """
+    for page in pages:
+        for chunk in chunk_text(page["text"], **options):
+            yield {"page": page["page"] + 1, "text": chunk}
+
+
+# -------------------------------
+# Embeddings
+# -------------------------------
+def load_batch_embedder(model_name: str = "all-MiniLM-L6-v2") -> Callable[[List[str]], np.ndarray]:
+    """
+    Local CPU embedding model (requires sentence-transformers) that embeds
+    a list of texts into a normalized float32 matrix.
+    """
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name, device="cpu")
+
+    def embed(texts: List[str]) -> np.ndarray:
+        return model.encode(
+            texts,
+            batch_size=len(texts),
+            normalize_embeddings=True,
+            convert_to_numpy=True
+        ).astype(np.float32)
+
+    embed.model_name = model_name
+    return embed
+
+
+class CachedEmbedder:
+    """
+    Batch embedder that only embeds texts it has not seen before with the
+    same model; vectors are kept in SQLite.
+    """
+
+    def __init__(self, embed: Callable[[List[str]], np.ndarray], db_path: str):
+        self.embed = embed
+        self.model_name = getattr(embed, "model_name", "")
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+        self._conn.commit()
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode()).hexdigest()
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        keys = [self._key(text) for text in texts]
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({', '.join('?' * len(keys))})",
+                keys
+            ).fetchall()
+        found = {key: np.frombuffer(vector, dtype=np.float32) for key, vector in rows}
+
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        if missing:
+            vectors = self.embed([texts[i] for i in missing])
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+                    [(keys[i], vector.astype(np.float32).tobytes()) for i, vector in zip(missing, vectors)]
+                )
+            for i, vector in zip(missing, vectors):
+                found[keys[i]] = vector
+        self.stats["hits"] += len(keys) - len(missing)
+        self.stats["misses"] += len(missing)
+        return np.stack([found[key] for key in keys]).astype(np.float32)
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder() -> Callable[[List[str]], np.ndarray]:
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            _embedder = CachedEmbedder(
+                load_batch_embedder(os.getenv("PDF_EMBEDDING_MODEL", "all-MiniLM-L6-v2")),
+                os.path.join(get_document_index().root_dir, "embeddings.sqlite3")
+            )
+        return _embedder
+
+
+def _batches(items: Iterable[Dict], size: int) -> Iterator[List[Dict]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# -------------------------------
+# Index
+# -------------------------------
+class DocumentIndex:
+    def __init__(self, root_dir: str = "", use_faiss: Optional[bool] = None):
+        self.root_dir = root_dir or os.getenv("PDF_INDEX_DIR", os.path.join(get_data_dir(), "index"))
+        if use_faiss is None:
+            use_faiss = os.getenv("PDF_INDEX_FAISS", "0") == "1"
+        self.use_faiss = use_faiss
+        os.makedirs(self.root_dir, exist_ok=True)
+        # doc hash -> loaded (matrix, chunks, faiss index)
+        self._loaded: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def document_dir(self, doc_hash: str) -> str:
+        return os.path.join(self.root_dir, doc_hash)
+
+    def has(self, doc_hash: str) -> bool:
+        # meta.json is written last, so its presence marks a complete index
+        return os.path.exists(os.path.join(self.document_dir(doc_hash), "meta.json"))
+
+    def build(
+        self,
+        doc_hash: str,
+        chunks: Iterable[Dict],
+        embed: Callable[[List[str]], np.ndarray],
+        batch_size: int = 64,
+        stats: Optional[Dict] = None
+    ) -> Dict:
+        """
+        Embed `chunks` batch by batch and write the index of a document.
+        Vectors are appended to a growing .npy file, so only one batch is
+        held in memory. Returns the document metadata.
+        """
+        stats = {} if stats is None else stats
+        stats.update({"chunks": 0, "embed_s": 0.0})
+        target = self.document_dir(doc_hash)
+        tmp_dir = f"{target}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        raw_path = os.path.join(tmp_dir, "vectors.f32")
+        dim = 0
+        with open(raw_path, "wb") as raw, open(os.path.join(tmp_dir, "chunks.jsonl"), "w", encoding="utf-8") as rows:
+            for batch in _batches(chunks, batch_size):
+                start = time.perf_counter()
+                vectors = embed([chunk["text"] for chunk in batch])
+                stats["embed_s"] += time.perf_counter() - start
+                dim = vectors.shape[1]
+                raw.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+                for chunk in batch:
+                    rows.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+                stats["chunks"] += len(batch)
+
+        count = stats["chunks"]
+        vectors_path = os.path.join(tmp_dir, "vectors.npy")
+        matrix = np.lib.format.open_memmap(vectors_path, mode="w+", dtype=np.float32, shape=(count, dim))
+        if count:
+            matrix[:] = np.memmap(raw_path, dtype=np.float32, mode="r", shape=(count, dim))
+        matrix.flush()
+        del matrix
+        os.remove(raw_path)
+
+        if self.use_faiss and count:
+            self._build_faiss(vectors_path, os.path.join(tmp_dir, "faiss.index"))
+
+        meta = {
+            "doc_hash": doc_hash,
+            "embedding_model": getattr(embed, "model_name", ""),
+            "dim": dim,
+            "chunks": count,
+            "created_at": time.time(),
+        }
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp_dir, target)
+        with self._lock:
+            self._loaded.pop(doc_hash, None)
+        return meta
+
+    def _build_faiss(self, vectors_path: str, index_path: str) -> None:
+        try:
+            import faiss
+        except ImportError:
+            print("faiss is not installed, using brute-force search")
+            return
+        matrix = np.load(vectors_path, mmap_mode="r")
+        index = faiss.IndexHNSWFlat(matrix.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+        index.add(np.ascontiguousarray(matrix))
+        faiss.write_index(index, index_path)
+
+    def _load(self, doc_hash: str) -> Dict:
+        with self._lock:
+            loaded = self._loaded.get(doc_hash)
+            if loaded is None:
+                directory = self.document_dir(doc_hash)
+                with open(os.path.join(directory, "chunks.jsonl"), encoding="utf-8") as f:
+                    chunks = [json.loads(line) for line in f]
+                loaded = {
+                    "matrix": np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r"),
+                    "chunks": chunks,
+                    "faiss": None,
+                }
+                faiss_path = os.path.join(directory, "faiss.index")
+                if self.use_faiss and os.path.exists(faiss_path):
+                    import faiss
+                    loaded["faiss"] = faiss.read_index(faiss_path)
+                self._loaded[doc_hash] = loaded
+            return loaded
+
+    def search(self, doc_hash: str, query_vector: np.ndarray, k: int = DEFAULT_TOP_K) -> List[Dict]:
+        """
+        Top-k chunks by cosine similarity, best first, with a "score" each.
+        """
+        loaded = self._load(doc_hash)
+        matrix = loaded["matrix"]
+        if not len(matrix):
+            return []
+        query_vector = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+        k = min(k, len(matrix))
+
+        if loaded["faiss"] is not None:
+            scores, ids = loaded["faiss"].search(query_vector[None, :], k)
+            ranked = [(int(i), float(s)) for i, s in zip(ids[0], scores[0]) if i >= 0]
+        else:
+            scores = matrix @ query_vector
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            ranked = [(int(i), float(scores[i])) for i in top]
+
+        return [dict(loaded["chunks"][i], score=score) for i, score in ranked]
+
+
+_document_index: Optional[DocumentIndex] = None
+_document_index_lock = threading.Lock()
+
+
+def get_document_index() -> DocumentIndex:
+    global _document_index
+    with _document_index_lock:
+        if _document_index is None:
+            _document_index = DocumentIndex()
+        return _document_index
+
+
+# -------------------------------
+# Pipeline
+# -------------------------------
+def index_pages(doc_hash: str, pages: Iterable[Dict], stats: Optional[Dict] = None) -> Dict:
+    """
+    Chunk, embed and index extracted pages of a document.
+    """
+    return get_document_index().build(
+        doc_hash,
+        chunk_pages(pages),
+        get_embedder(),
+        batch_size=int(os.getenv("PDF_EMBEDDING_BATCH_SIZE", "64")),
+        stats=stats
+    )
+
+
+def retrieve(doc_hash: str, question: str, k: int = DEFAULT_TOP_K) -> List[Dict]:
+    query_vector = get_embedder()([question])[0]
+    return get_document_index().search(doc_hash, query_vector, k)
+
+
+def answer_question(doc_hash: str, question: str, k: int = DEFAULT_TOP_K) -> Dict:
+    """
+    Answer a question about an indexed document.
+    Returns {"answer", "sources"} where sources are the retrieved chunks.
+    """
+    sources = retrieve(doc_hash, question, k)
+    excerpts = "\n\n".join(f"[Page {chunk['page']}]\n{chunk['text']}" for chunk in sources)
+    llm = get_chat_model(
+        provider=ANSWER_PARAMS["provider"],
+        api_key=os.getenv("GROQ_API_KEY", ""),
+        model_name=ANSWER_PARAMS["model_name"],
+        temperature=ANSWER_PARAMS["temperature"],
+    )
+    response = llm.invoke([
+        SystemMessage(content=ANSWER_PROMPT),
+        HumanMessage(content=f"Excerpts:\n{excerpts}\n\nQuestion: {question}")
+    ])
+    return {"answer": response.content, "sources": sources}
@@ -0,0 +1,324 @@
+"""
+Streaming PDF text extraction.
+
+`extract_pages` is a generator that yields one result per page, in page
+order, while a process pool works ahead on the following pages. Each
+worker memory-maps the file instead of reading it into RAM, uses the
+native text layer when the page has one and falls back to OCR only for
+pages without text. At most `window` pages are in flight or waiting to be
+yielded, so memory stays bounded on 1,000-page documents.
+
+With a `cache_dir`, every page is fingerprinted (content stream plus the
+data of the images and forms it draws) and its extracted text is stored
+under that hash, so unchanged pages are never extracted or OCRed twice,
+in this document or any other. Callers that already know the hashes of
+some pages (see ingestion.py) pass them as `known_hashes`: those pages are
+read back from the cache without opening or hashing them again.
+
+    python -m backend.pdf_to_text.pdf_services input.pdf --output input.txt --workers 4
+
+OCR (see ocr.py) needs the optional `pypdfium2`, `pytesseract` and
+`Pillow` packages and the tesseract binary; without them, pages without
+text come back empty with method "none".
+"""
+import argparse
+import hashlib
+import json
+import logging
+import mmap
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from collections import deque
+from typing import Deque, Dict, Iterator, Optional
+
+from pypdf import PdfReader
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATA_DIR = os.path.join("backend", "pdf_to_text", "data")
+
+# Pages with fewer characters than this in their text layer are OCRed
+MIN_TEXT_CHARS = 20
+
+# Per-process state of pool workers: the open file, its mapping and reader.
+# Only pool processes use it; in-process extraction opens its own document.
+_worker_state: Dict = {}
+
+
+def get_data_dir() -> str:
+    return os.getenv("PDF_DATA_DIR", DEFAULT_DATA_DIR)
+
+
+# -------------------------------
+# Worker side
+# -------------------------------
+def _open_document(path: str) -> Dict:
+    f = open(path, "rb")
+    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return {"path": path, "file": f, "mmap": mapped, "reader": PdfReader(mapped)}
+
+
+def _close_document(document: Dict) -> None:
+    document["mmap"].close()
+    document["file"].close()
+
+
+def _init_worker(path: str) -> None:
+    _worker_state.update(_open_document(path))
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def page_hash(page) -> str:
+    """
+    Fingerprint of what a page draws: its content stream and the data of
+    the XObjects (images, forms) it references.
+    """
+    digest = hashlib.sha256()
+    contents = page.get_contents()
+    if contents is not None:
+        digest.update(contents.get_data())
+    resources = page.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources is not None else None
+    if xobjects is not None:
+        for name, xobject in sorted(xobjects.get_object().items()):
+            digest.update(name.encode())
+            digest.update(xobject.get_object().get_data())
+    return digest.hexdigest()
+
+
+def _cache_path(cache_dir: str, fingerprint: str, ocr: bool) -> str:
+    # Text-only results must not be reused when OCR is requested later
+    return os.path.join(cache_dir, fingerprint[:2], f"{fingerprint}-{'ocr' if ocr else 'text'}.json")
+
+
+def _read_cached_page(path: str) -> Optional[Dict]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cached_page(path: str, entry: Dict) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _cached_result(cache_dir: str, page_number: int, fingerprint: str, ocr: bool, start: float) -> Optional[Dict]:
+    cached = _read_cached_page(_cache_path(cache_dir, fingerprint, ocr))
+    if cached is None:
+        return None
+    return dict(
+        cached,
+        page=page_number,
+        page_hash=fingerprint,
+        cached=True,
+        seconds=time.perf_counter() - start
+    )
+
+
+def count_pages(path: str) -> int:
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return len(PdfReader(mapped).pages)
+
+
+def ocr_page(path: str, page_number: int) -> Optional[str]:
+    """
+    OCR one page (adaptive DPI, deskew, binarization; see ocr.py).
+    Returns None when the OCR packages or the tesseract binary are not
+    installed, or OCR failed.
+    """
+    try:
+        from backend.pdf_to_text.ocr import ocr_pdf_page
+        return ocr_pdf_page(path, page_number)["text"]
+    except ImportError:
+        return None
+    except (RuntimeError, OSError) as exc:
+        # RuntimeError when the page timeout expires; TesseractNotFoundError
+        # (an OSError) when the tesseract binary is missing
+        logger.warning("OCR failed on page %d: %s", page_number + 1, exc)
+        return None
+
+
+def extract_page(
+    page_number: int,
+    ocr: bool = True,
+    min_chars: int = MIN_TEXT_CHARS,
+    cache_dir: str = "",
+    document: Optional[Dict] = None
+) -> Dict:
+    """
+    Extract one page of `document` (see _open_document); pool workers
+    leave it out and use the document of their process (see _init_worker).
+    """
+    start = time.perf_counter()
+    document = _worker_state if document is None else document
+    page = document["reader"].pages[page_number]
+    fingerprint = page_hash(page) if cache_dir else ""
+    if fingerprint:
+        cached = _cached_result(cache_dir, page_number, fingerprint, ocr, start)
+        if cached is not None:
+            return cached
+
+    text = page.extract_text() or ""
+    method = "text" if text.strip() else "none"
+    if len(text.strip()) < min_chars and ocr:
+        ocr_text = ocr_page(document["path"], page_number) or ""
+        if len(ocr_text.strip()) > len(text.strip()):
+            text, method = ocr_text, "ocr"
+    if fingerprint:
+        _write_cached_page(_cache_path(cache_dir, fingerprint, ocr), {"text": text, "method": method})
+    return {
+        "page": page_number,
+        "text": text,
+        "method": method,
+        "page_hash": fingerprint,
+        "cached": False,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+# -------------------------------
+# Streaming API
+# -------------------------------
+def extract_pages(
+    path: str,
+    workers: int = 0,
+    window: int = 0,
+    ocr: bool = True,
+    min_chars: int = MIN_TEXT_CHARS,
+    cache_dir: str = "",
+    stats: Optional[Dict] = None,
+    known_hashes: Optional[Dict[int, str]] = None
+) -> Iterator[Dict]:
+    """
+    Yield {"page", "text", "method", "page_hash", "cached", "seconds"} for
+    every page in order.
+
+    workers: pool size (default: CPU count; 1 runs in this process).
+    window: pages submitted ahead of the one being yielded (default 4 per worker).
+    cache_dir: per-page text cache keyed by page hash ("" disables it).
+    known_hashes: page number -> page hash of pages extracted before; the
+    ones still in the cache are yielded from it without being re-hashed.
+    stats: filled with pages, pages_per_sec, elapsed_s, cached and the
+    count per method.
+    """
+    if not os.path.exists(path):
+        raise ValueError(f"File not found: {path}")
+    stats = {} if stats is None else stats
+    workers = workers or os.cpu_count() or 1
+    window = window or workers * 4
+    total = count_pages(path)
+    known_hashes = known_hashes if cache_dir and known_hashes else {}
+    stats.update({"pages": 0, "total_pages": total, "cached": 0, "text": 0, "ocr": 0, "none": 0})
+    start = time.perf_counter()
+
+    def record(result: Dict) -> Dict:
+        stats["pages"] += 1
+        stats[result["method"]] += 1
+        stats["cached"] += result["cached"]
+        stats["elapsed_s"] = time.perf_counter() - start
+        stats["pages_per_sec"] = stats["pages"] / stats["elapsed_s"] if stats["elapsed_s"] else 0.0
+        return result
+
+    def cached_result(page_number: int) -> Optional[Dict]:
+        fingerprint = known_hashes.get(page_number)
+        if not fingerprint:
+            return None
+        return _cached_result(cache_dir, page_number, fingerprint, ocr, time.perf_counter())
+
+    # Only pages without cached text need a worker
+    missing = sum(
+        1 for page_number in range(total)
+        if page_number not in known_hashes
+        or not os.path.exists(_cache_path(cache_dir, known_hashes[page_number], ocr))
+    )
+
+    if workers == 1 or missing <= 1:
+        # Opened per call: sessions extracting on other threads have their own
+        document = None
+        try:
+            for page_number in range(total):
+                result = cached_result(page_number)
+                if result is None:
+                    if document is None:
+                        document = _open_document(path)
+                    result = extract_page(page_number, ocr, min_chars, cache_dir, document)
+                yield record(result)
+        finally:
+            if document is not None:
+                _close_document(document)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=min(workers, missing),
+        initializer=_init_worker,
+        initargs=(path,)
+    ) as executor:
+        in_flight: Deque[Future] = deque()
+        next_page = 0
+        try:
+            while next_page < total or in_flight:
+                while next_page < total and len(in_flight) < window:
+                    result = cached_result(next_page)
+                    if result is None:
+                        future = executor.submit(extract_page, next_page, ocr, min_chars, cache_dir)
+                    else:
+                        future = Future()
+                        future.set_result(result)
+                    in_flight.append(future)
+                    next_page += 1
+                yield record(in_flight.popleft().result())
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+
+def extract_text(path: str, output_path: str = "", **options) -> Dict:
+    """
+    Extract a whole PDF, writing pages to `output_path` as they arrive
+    (separated by form feeds). Returns the extraction stats.
+    """
+    stats = {}
+    output = open(output_path, "w", encoding="utf-8") if output_path else None
+    try:
+        for result in extract_pages(path, stats=stats, **options):
+            if output is not None:
+                if result["page"]:
+                    output.write("\f")
+                output.write(result["text"])
+    finally:
+        if output is not None:
+            output.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract text from a PDF page by page")
+    parser.add_argument("path")
+    parser.add_argument("--output", default="", help="Text file to write")
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--no-ocr", action="store_true", help="Use the text layer only")
+    args = parser.parse_args()
+
+    stats = extract_text(args.path, args.output, workers=args.workers, ocr=not args.no_ocr)
+    print(
+        f"✅ {stats['pages']} pages in {stats.get('elapsed_s', 0):.1f}s "
+        f"({stats.get('pages_per_sec', 0):.1f} pages/sec; "
+        f"text {stats['text']}, ocr {stats['ocr']}, empty {stats['none']})"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,108 @@
+import os
+from typing import Dict
+
+from backend.pdf_to_text.ingestion import IMAGE_EXTENSIONS, get_manifest, ingest, store_input
+from backend.pdf_to_text.pdf_services import get_data_dir
+from backend.pdf_to_text.pdf_retrieval import (
+    get_document_index,
+    index_pages,
+    answer_question,
+)
+
+OUTPUT_DIR = os.path.join(get_data_dir(), "outputs")
+
+# Pages shown in the preview; the full text goes to the output file
+PREVIEW_PAGES = 5
+
+
+def extract_and_index(st, stored: Dict, use_ocr: bool):
+    """
+    Stream the pages of a PDF (or the OCR of an image) into the text file,
+    the preview and the index.
+    Pages extracted before (in this or another document) come from the cache.
+    """
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    doc_hash = stored["sha256"]
+    output_path = os.path.join(OUTPUT_DIR, f"{doc_hash}.txt")
+
+    progress = st.progress(0.0, text="Extracting...")
+    preview = []
+    stats = {}
+    index_stats = {}
+
+    def pages(output):
+        for result in ingest(stored["path"], doc_hash, stored["name"], stats=stats, ocr=use_ocr):
+            if result["page"]:
+                output.write("\f")
+            output.write(result["text"])
+            if result.get("error"):
+                st.warning(result["error"])
+            if len(preview) < PREVIEW_PAGES:
+                preview.append(result)
+            progress.progress(
+                stats["pages"] / stats["total_pages"],
+                text=f"Page {stats['pages']}/{stats['total_pages']} · {stats['pages_per_sec']:.1f} pages/sec"
+            )
+            yield result
+
+    with open(output_path, "w", encoding="utf-8") as output:
+        index_pages(doc_hash, pages(output), stats=index_stats)
+
+    st.success(
+        f"Extracted {stats['pages']} pages in {stats.get('elapsed_s', 0):.1f}s "
+        f"({stats.get('pages_per_sec', 0):.1f} pages/sec) — cached: {stats['cached']}, "
+        f"text layer: {stats['text']}, OCR: {stats['ocr']}, empty: {stats['none']}. "
+        f"Indexed {index_stats['chunks']} chunks (embedding {index_stats['embed_s']:.1f}s)."
+    )
+    st.caption(f"Saved to {output_path}")
+    for result in preview:
+        with st.expander(f"Page {result['page'] + 1} ({result['method']})"):
+            st.text(result["text"])
+
+
 def pdf_chat_interface(st):
     st.title("PDF Chat")
-    
\ No newline at end of file
+
+    if "pdf_doc_hash" not in st.session_state:
+        st.session_state.pdf_doc_hash = ""
+        st.session_state.pdf_doc_name = ""
+        st.session_state.pdf_messages = []
+
+    uploaded_file = st.file_uploader(
+        "Upload a PDF or an image",
+        type=["pdf"] + [extension.lstrip(".") for extension in sorted(IMAGE_EXTENSIONS)]
+    )
+    use_ocr = st.checkbox("OCR pages without a text layer", value=True)
+    if uploaded_file is not None and st.button("Process file"):
+        stored = store_input(uploaded_file, uploaded_file.name)
+        doc_hash = stored["sha256"]
+        if get_manifest().is_complete(doc_hash) and get_document_index().has(doc_hash):
+            st.info("This file is already indexed, skipping extraction and embedding.")
+        else:
+            extract_and_index(st, stored, use_ocr)
+        st.session_state.pdf_doc_hash = doc_hash
+        st.session_state.pdf_doc_name = uploaded_file.name
+        st.session_state.pdf_messages = []
+
+    if not st.session_state.pdf_doc_hash:
+        return
+
+    st.subheader(f"Ask about {st.session_state.pdf_doc_name}")
+    for message in st.session_state.pdf_messages:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+
+    question = st.chat_input("Ask a question about the PDF...")
+    if question:
+        st.session_state.pdf_messages.append({"role": "user", "content": question})
+        with st.chat_message("user"):
+            st.markdown(question)
+        with st.chat_message("assistant"):
+            with st.spinner("Searching the document..."):
+                result = answer_question(st.session_state.pdf_doc_hash, question)
+            st.markdown(result["answer"])
+            with st.expander("Sources"):
+                for chunk in result["sources"]:
+                    st.caption(f"Page {chunk['page']} · score {chunk['score']:.2f}")
+                    st.text(chunk["text"])
+        st.session_state.pdf_messages.append({"role": "assistant", "content": result["answer"]})
@@ -1,29 +1,11 @@
 import streamlit as st
-import json
-import os
+import time
+import random
 
-from backend.text_to_image.multimodels import get_model_pipeline, generate_image
+from backend.text_to_image.image_store import get_image_store
+from backend.text_to_image.multimodels import get_pipeline_manager, get_generation_worker, submit_generation
 
-# ---- Metadata file path ----
-METADATA_PATH = "backend/text_to_image/outputs/generated_image_metadata.json"
-# output_image_dir = "/Users/mdarifulislamshakil/MyProjects/ai-khichuri/backend/text_to_image/outputs/generated_images"
-
-
-# ---- Helper functions ----
-def load_image_history():
-    if os.path.exists(METADATA_PATH):
-        try:
-            with open(METADATA_PATH, "r") as f:
-                return json.load(f)
-        except Exception:
-            return []
-    return []
-
-
-def save_image_history(images):
-    os.makedirs(os.path.dirname(METADATA_PATH), exist_ok=True)
-    with open(METADATA_PATH, "w") as f:
-        json.dump(images, f, indent=2)
+GALLERY_PAGE_SIZE = 12
 
 
 # ---- Main UI ----
@@ -32,11 +14,22 @@ def generate_image_interface(st):
     st.caption("Generate realistic images from text prompts")
 
     # ---- Session State Init (ONLY ONCE) ----
-    if "images" not in st.session_state:
-        st.session_state.images = load_image_history()
-        print("images loaded : ", len(st.session_state.images))
-    if "pipeline" not in st.session_state:
-        st.session_state.pipeline = get_model_pipeline()
+    store = get_image_store()
+    if "gallery_cursors" not in st.session_state:
+        # before_id of every page visited so far; the last one is the current page
+        st.session_state.gallery_cursors = [None]
+    if "image_jobs" not in st.session_state:
+        st.session_state.image_jobs = []
+
+    # The pipeline is shared by all sessions and loaded once per process,
+    # starting the first time this page is opened
+    manager = get_pipeline_manager()
+    manager.warm_up()
+    metrics = manager.metrics()
+    if manager.is_ready():
+        st.caption(f"Model on {metrics['device']} ({metrics['dtype']}) · loaded in {metrics['load_time_s']:.1f}s")
+    else:
+        st.caption(f"Model loading on {metrics['device'] or 'the detected device'}...")
 
     # ---- Input Section ----
     with st.form("image_generation_form", clear_on_submit=True):
@@ -44,43 +37,111 @@ def generate_image_interface(st):
             "Enter your image prompt",
             placeholder="e.g., A man riding a horse on the sea shore"
         )
+        with st.expander("⚙️ Generation settings"):
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                steps = st.slider("Steps", 5, 50, 30)
+            with col2:
+                size = st.selectbox("Size", [512, 384, 256, 768])
+            with col3:
+                seed = st.number_input("Seed (empty = from prompt)", min_value=0, value=None, step=1)
         submit = st.form_submit_button("🎨 Generate Image")
 
+    params = {
+        "num_inference_steps": steps,
+        "height": size,
+        "width": size,
+        "seed": None if seed is None else int(seed),
+    }
+
     # ---- Image Generation ----
     if submit:
         if not query.strip():
             st.warning("Please enter a prompt.")
         else:
-            with st.spinner("Generating image..."):
-               st.session_state.images = generate_image(query, st.session_state.pipeline)
+            with st.spinner("Refining prompt..."):
+                job = submit_generation(query, **params)
+            st.session_state.image_jobs.append(job.id)
 
+    # ---- Queued jobs (polled until done) ----
+    worker = get_generation_worker()
+    pending = []
+    for job_id in st.session_state.image_jobs:
+        job = worker.get_job(job_id)
+        if job is None:
+            continue
+        if job.status == "done":
+            # Jump back to the first page to show the new image
+            st.session_state.gallery_cursors = [None]
             st.success("Image generated successfully!")
+        elif job.status == "failed":
+            st.error(f"Image generation failed: {job.error}")
+        else:
+            pending.append(job_id)
+            st.info(f"⏳ {job.metadata.get('query', job.prompt)} — {job.status} "
+                    f"({worker.queue_length()} in queue)")
+    st.session_state.image_jobs = pending
 
     st.divider()
 
-    # ---- Image History ----
-    if st.session_state.images:
+    # ---- Image History (newest first, one page of thumbnails at a time) ----
+    images, next_before_id = store.list_page(
+        limit=GALLERY_PAGE_SIZE,
+        before_id=st.session_state.gallery_cursors[-1]
+    )
+
+    if images:
         st.subheader("🖼️ Generated Images")
 
-        for idx, item in enumerate(reversed(st.session_state.images), start=1):
+        for item in images:
+            idx = item["id"]
             with st.container():
                 st.markdown(f"**Prompt {idx}:** {item['query']}")
                 st.markdown(f"**Refined Prompt {idx}:** {item['refined_query']}")
-                st.image(item["path"], width=300)  # ✅ Smaller image
+                thumbnail = store.ensure_thumbnail(item)
+                if thumbnail:
+                    st.image(thumbnail, width=300)  # ✅ Smaller image
+                else:
+                    st.warning("Image file not found.")
                 col1,col2 = st.columns(2)
                 with col1:
-                    st.download_button(
-                        label="Download Image",
-                        data=item["path"],
-                        file_name=f"image_{idx}.png",
-                        mime="image/png"
-                    )
+                    # The original is only read from disk once the user asks for it
+                    if st.session_state.get("download_image_id") == idx and thumbnail:
+                        with open(item["path"], "rb") as f:
+                            st.download_button(
+                                label="Download Image",
+                                data=f,
+                                file_name=f"image_{idx}.jpg",
+                                mime="image/jpeg",
+                                key=f"download_{idx}"
+                            )
+                    elif st.button("Prepare download", key=f"prepare_download_{idx}", disabled=not thumbnail):
+                        st.session_state.download_image_id = idx
+                        st.rerun()
                 with col2:
                     re_generate = st.button("Re-Generate", key=f"re_generate_{idx}")
                     if re_generate:
-                        with st.spinner("Re-generating image..."):
-                            st.session_state.images = generate_image(item["query"], st.session_state.pipeline)
-                            st.rerun()
+                        with st.spinner("Refining prompt..."):
+                            # A fresh seed, or the identical request would return the stored image
+                            job = submit_generation(item["query"], **dict(params, seed=random.randrange(2**32)))
+                        st.session_state.image_jobs.append(job.id)
+                        st.rerun()
                 st.divider()
+
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            if len(st.session_state.gallery_cursors) > 1 and st.button("⬅️ Newer"):
+                st.session_state.gallery_cursors.pop()
+                st.rerun()
+        with col2:
+            st.caption(f"Page {len(st.session_state.gallery_cursors)} · {store.count()} images")
+        with col3:
+            if next_before_id is not None and st.button("Older ➡️"):
+                st.session_state.gallery_cursors.append(next_before_id)
+                st.rerun()
     else:
         st.info("No images generated yet.")
+
+    if st.session_state.image_jobs:
+        time.sleep(1)
+        st.rerun()
@@ -0,0 +1,239 @@
+"""
+Queued, micro-batched image generation.
+
+Requests are submitted from any Streamlit session and return a
+GenerationJob handle right away. One background worker owns the diffusion
+pipeline: it takes the oldest pending job, gathers other pending jobs with
+the same steps/size (up to `max_batch_size`, waiting at most `max_wait`
+seconds for more to arrive) and renders them in a single
+`pipeline([...])` call, so concurrent users share a batch instead of
+contending for the model.
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+from backend.metrics import measure
+
+
+class GenerationJob:
+    def __init__(
+        self,
+        prompt: str,
+        num_inference_steps: int = 30,
+        height: int = 512,
+        width: int = 512,
+        seed: Optional[int] = None,
+        guidance_scale: float = 7.5,
+        metadata: Optional[Dict] = None,
+    ):
+        self.id = os.urandom(8).hex()
+        self.prompt = prompt
+        self.num_inference_steps = num_inference_steps
+        self.height = height
+        self.width = width
+        self.seed = seed if seed is not None else random.randrange(2**32)
+        self.guidance_scale = guidance_scale
+        self.metadata = metadata or {}
+        self.status = "queued"
+        self.image = None
+        self.result = None
+        self.error: Optional[str] = None
+        self.batch_size = 0
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._done = threading.Event()
+
+    @property
+    def batch_key(self):
+        # Only jobs with the same shape and schedule can share a pipeline call
+        return (self.num_inference_steps, self.height, self.width, self.guidance_scale)
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def _finish(self, status: str) -> None:
+        self.status = status
+        self.finished_at = time.time()
+        self._done.set()
+
+
+class ImageGenerationWorker:
+    def __init__(
+        self,
+        pipeline_factory: Callable,
+        max_batch_size: int = 4,
+        max_wait: float = 0.2,
+        on_complete: Optional[Callable[[GenerationJob], object]] = None,
+        max_finished_jobs: int = 1000,
+    ):
+        """
+        pipeline_factory: returns the diffusion pipeline (called in the worker thread).
+        on_complete: called with each finished job; its return value is stored
+        in job.result (e.g. the saved image record) and job.image is released
+        afterwards, so retained job handles do not keep full-size images
+        alive. Without on_complete, job.image keeps the PIL image.
+        """
+        self.pipeline_factory = pipeline_factory
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.on_complete = on_complete
+        self.max_finished_jobs = max_finished_jobs
+        self._pending: Deque[GenerationJob] = deque()
+        self._jobs: Dict[str, GenerationJob] = {}
+        self._finished: Deque[str] = deque()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.stats = {"batches": 0, "images": 0, "failed": 0, "busy_s": 0.0}
+
+    # -------------------------------
+    # Public API
+    # -------------------------------
+    def start(self) -> None:
+        with self._condition:
+            if self._thread is None:
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="image-generation", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, prompt: str, **params) -> GenerationJob:
+        """
+        Queue a prompt; params are GenerationJob arguments
+        (num_inference_steps, height, width, seed, guidance_scale, metadata).
+        """
+        return self.submit_job(GenerationJob(prompt, **params))
+
+    def submit_job(self, job: GenerationJob) -> GenerationJob:
+        with self._condition:
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            self._condition.notify()
+        self.start()
+        return job
+
+    def add_completed(self, job: GenerationJob, result) -> GenerationJob:
+        """
+        Register a job that was answered without generating (e.g. from a
+        cache), so the UI can poll it like any other job.
+        """
+        job.result = result
+        with self._condition:
+            self._jobs[job.id] = job
+        self._record_finished(job, "done")
+        return job
+
+    def get_job(self, job_id: str) -> Optional[GenerationJob]:
+        return self._jobs.get(job_id)
+
+    def queue_length(self) -> int:
+        return len(self._pending)
+
+    def metrics(self) -> Dict:
+        stats = dict(self.stats)
+        stats["queued"] = self.queue_length()
+        stats["avg_batch_size"] = stats["images"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    # -------------------------------
+    # Worker loop
+    # -------------------------------
+    def _next_batch(self) -> List[GenerationJob]:
+        with self._condition:
+            while not self._pending and not self._stopping:
+                self._condition.wait()
+            if self._stopping:
+                return []
+
+            first = self._pending.popleft()
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                compatible = [job for job in self._pending if job.batch_key == first.batch_key]
+                for job in compatible[:self.max_batch_size - len(batch)]:
+                    self._pending.remove(job)
+                    batch.append(job)
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.max_batch_size or remaining <= 0 or self._stopping:
+                    break
+                self._condition.wait(remaining)
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            self._generate(batch)
+
+    def _generate(self, batch: List[GenerationJob]) -> None:
+        first = batch[0]
+        start = time.perf_counter()
+        for job in batch:
+            job.status = "running"
+            job.started_at = time.time()
+            job.batch_size = len(batch)
+
+        try:
+            import torch
+            pipeline = self.pipeline_factory()
+            # CPU generators give the same image for a seed on every device
+            generators = [torch.Generator(device="cpu").manual_seed(job.seed) for job in batch]
+            with measure("diffusion.generate") as measurement:
+                measurement.payload(first.height * first.width * 3 * len(batch))
+                result = pipeline(
+                    [job.prompt for job in batch],
+                    num_inference_steps=first.num_inference_steps,
+                    height=first.height,
+                    width=first.width,
+                    guidance_scale=first.guidance_scale,
+                    generator=generators,
+                )
+            for job, image in zip(batch, result.images):
+                job.image = image
+        except Exception as exc:
+            for job in batch:
+                job.error = repr(exc)
+                self._record_finished(job, "failed")
+            self.stats["failed"] += len(batch)
+            return
+        finally:
+            self.stats["busy_s"] += time.perf_counter() - start
+
+        self.stats["batches"] += 1
+        self.stats["images"] += len(batch)
+        for job in batch:
+            status = "done"
+            try:
+                if self.on_complete is not None:
+                    job.result = self.on_complete(job)
+            except Exception as exc:
+                job.error = repr(exc)
+                status = "failed"
+            if self.on_complete is not None:
+                # Persisted (or failed); job.result keeps the stored record
+                job.image = None
+            self._record_finished(job, status)
+
+    def _record_finished(self, job: GenerationJob, status: str) -> None:
+        job._finish(status)
+        with self._condition:
+            self._finished.append(job.id)
+            # Keep handles of recent jobs only
+            while len(self._finished) > self.max_finished_jobs:
+                self._jobs.pop(self._finished.popleft(), None)
@@ -0,0 +1,403 @@
+"""
+Append-only metadata store for generated images.
+
+One SQLite database under the output root directory replaces the
+rewrite-everything generated_image_metadata.json: each image is a single
+INSERT (O(1) no matter how many images exist), SQLite locking makes
+concurrent appends from several sessions or processes safe, and indexes
+serve lookups by prompt and time and the paginated gallery.
+
+The root directory is IMAGE_OUTPUT_DIR (default backend/text_to_image/outputs):
+
+    <root>/images.sqlite3       metadata
+    <root>/generated_images/    image files
+    <root>/thumbnails/          WebP thumbnails, content-addressed by the
+                                SHA-256 of the original image file
+
+Every generated image also stores a `cache_key`, the hash of everything
+that determines its pixels (model id, refined prompt, seed, steps, guidance
+and size), so an identical request is served from disk. Disk usage is kept
+under IMAGE_CACHE_MAX_BYTES by deleting the least recently used images; the
+total is a counter row kept up to date by triggers, so checking it on every
+save is O(1) and the LRU scan (on the last_accessed index) runs only when
+the store is over the limit.
+
+Existing JSON metadata files are imported with `migrate_json`, or:
+
+    python -m backend.text_to_image.image_store path/to/generated_image_metadata.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_OUTPUT_DIR = "backend/text_to_image/outputs"
+LEGACY_METADATA_FILE = "generated_image_metadata.json"
+
+COLUMNS = [
+    "path", "query", "refined_query", "created_at",
+    "seed", "num_inference_steps", "height", "width", "guidance_scale",
+    "sha256", "thumbnail_path", "cache_key", "size_bytes", "last_accessed",
+]
+
+# Columns added after the first schema version: name -> SQL type
+ADDED_COLUMNS = {
+    "sha256": "TEXT",
+    "thumbnail_path": "TEXT",
+    "cache_key": "TEXT",
+    "size_bytes": "INTEGER",
+    "last_accessed": "REAL",
+}
+
+DEFAULT_CACHE_MAX_BYTES = 5 * 1024 ** 3
+
+THUMBNAIL_SIZE = 256
+
+
+def get_output_root() -> str:
+    return os.getenv("IMAGE_OUTPUT_DIR", DEFAULT_OUTPUT_DIR)
+
+
+def generation_key(
+    model_id: str,
+    refined_prompt: str,
+    seed: int,
+    num_inference_steps: int,
+    guidance_scale: float,
+    height: int,
+    width: int
+) -> str:
+    """
+    Hash of every input that determines a generated image.
+    """
+    payload = json.dumps([
+        model_id, refined_prompt, int(seed), int(num_inference_steps),
+        float(guidance_scale), int(height), int(width)
+    ])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ImageMetadataStore:
+    def __init__(self, root_dir: str = ""):
+        self.root_dir = root_dir or get_output_root()
+        self.images_dir = os.path.join(self.root_dir, "generated_images")
+        self.thumbnails_dir = os.path.join(self.root_dir, "thumbnails")
+        os.makedirs(self.images_dir, exist_ok=True)
+        os.makedirs(self.thumbnails_dir, exist_ok=True)
+        self.db_path = os.path.join(self.root_dir, "images.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._create_schema()
+
+    def _create_schema(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS images ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " path TEXT NOT NULL UNIQUE,"
+                " query TEXT, refined_query TEXT, created_at REAL,"
+                " seed INTEGER, num_inference_steps INTEGER, height INTEGER, width INTEGER,"
+                " guidance_scale REAL)"
+            )
+            existing = {row[1] for row in self._conn.execute("PRAGMA table_info(images)")}
+            for column, column_type in ADDED_COLUMNS.items():
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE images ADD COLUMN {column} {column_type}")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS images_query ON images (query)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS images_refined_query ON images (refined_query)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS images_created_at ON images (created_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS images_cache_key ON images (cache_key)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS images_last_accessed ON images (last_accessed)")
+            # Eviction orders by last_accessed alone so the index serves it
+            self._conn.execute("UPDATE images SET last_accessed = created_at WHERE last_accessed IS NULL")
+            self._create_size_counter()
+
+    def _create_size_counter(self) -> None:
+        # Running total of size_bytes, maintained by SQLite itself so every
+        # process writing to the store sees the same value
+        self._conn.execute("CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value INTEGER)")
+        self._conn.execute(
+            "INSERT OR IGNORE INTO store_meta (key, value)"
+            " SELECT 'total_bytes', COALESCE(SUM(size_bytes), 0) FROM images"
+        )
+        self._conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS images_size_insert AFTER INSERT ON images BEGIN"
+            " UPDATE store_meta SET value = value + COALESCE(NEW.size_bytes, 0) WHERE key = 'total_bytes'; END"
+        )
+        self._conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS images_size_delete AFTER DELETE ON images BEGIN"
+            " UPDATE store_meta SET value = value - COALESCE(OLD.size_bytes, 0) WHERE key = 'total_bytes'; END"
+        )
+        self._conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS images_size_update AFTER UPDATE OF size_bytes ON images BEGIN"
+            " UPDATE store_meta SET value = value - COALESCE(OLD.size_bytes, 0) + COALESCE(NEW.size_bytes, 0)"
+            " WHERE key = 'total_bytes'; END"
+        )
+
+    def new_image_path(self, extension: str = "jpg") -> str:
+        return os.path.join(self.images_dir, f"{os.urandom(16).hex()}.{extension}")
+
+    # -------------------------------
+    # Thumbnails
+    # -------------------------------
+    def thumbnail_path_for(self, sha256: str) -> str:
+        return os.path.join(self.thumbnails_dir, sha256[:2], f"{sha256}.webp")
+
+    def create_thumbnail(self, image, sha256: str) -> str:
+        """
+        Write the WebP thumbnail of a PIL image once; identical images share it.
+        """
+        path = self.thumbnail_path_for(sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            thumbnail = image.convert("RGB")
+            thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            # Write to a temporary name first so readers never see a partial file
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            thumbnail.save(tmp_path, format="WEBP", quality=80)
+            os.replace(tmp_path, path)
+        return path
+
+    def ensure_thumbnail(self, record: Dict) -> Optional[str]:
+        """
+        Thumbnail of a record, created on first use for records saved before
+        thumbnails existed. Returns None if the original image is missing.
+        """
+        if record.get("thumbnail_path") and os.path.exists(record["thumbnail_path"]):
+            return record["thumbnail_path"]
+        if not os.path.exists(record["path"]):
+            return None
+
+        from PIL import Image
+        sha256 = file_sha256(record["path"])
+        with Image.open(record["path"]) as image:
+            thumbnail_path = self.create_thumbnail(image, sha256)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE images SET sha256 = ?, thumbnail_path = ? WHERE id = ?",
+                (sha256, thumbnail_path, record["id"])
+            )
+        record["sha256"] = sha256
+        record["thumbnail_path"] = thumbnail_path
+        return thumbnail_path
+
+    # -------------------------------
+    # Writes
+    # -------------------------------
+    def append(self, record: Dict) -> Dict:
+        """
+        Insert one image record and return it with its id.
+        """
+        record = dict(record)
+        record.setdefault("created_at", time.time())
+        record.setdefault("last_accessed", record["created_at"])
+        if record.get("size_bytes") is None and os.path.exists(record["path"]):
+            record["size_bytes"] = os.path.getsize(record["path"])
+        values = [record.get(column) for column in COLUMNS]
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                f"INSERT INTO images ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                values
+            )
+        record["id"] = cursor.lastrowid
+        return record
+
+    def migrate_json(self, json_path: str) -> int:
+        """
+        Import a legacy JSON metadata file. Already imported paths are
+        skipped, so this is safe to re-run. Returns the number of new records.
+        """
+        if not os.path.exists(json_path):
+            return 0
+        with open(json_path, "r") as f:
+            try:
+                items = json.load(f)
+            except json.JSONDecodeError:
+                return 0
+
+        created_at = os.path.getmtime(json_path)
+        rows = [
+            [item.get("path"), item.get("query"), item.get("refined_query"), item.get("created_at", created_at),
+             item.get("seed"), item.get("num_inference_steps"), item.get("height"), item.get("width"),
+             item.get("guidance_scale"), None, None, None,
+             os.path.getsize(item["path"]) if os.path.exists(item["path"]) else None,
+             item.get("created_at", created_at)]
+            for item in items
+            if item.get("path")
+        ]
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                f"INSERT OR IGNORE INTO images ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                rows
+            )
+            return self._conn.total_changes - before
+
+    def total_bytes(self) -> int:
+        """
+        Size of the stored originals, from the trigger-maintained counter.
+        """
+        with self._lock:
+            return self._conn.execute("SELECT value FROM store_meta WHERE key = 'total_bytes'").fetchone()[0]
+
+    def evict_to_fit(self, max_bytes: int, keep_id: Optional[int] = None) -> int:
+        """
+        Delete the least recently used images (files, thumbnails and records)
+        until the stored originals use at most `max_bytes`. Returns the number
+        of images removed. Cheap when under the limit (one counter read).
+        `keep_id` (the image just saved) is never evicted, even when it alone
+        is larger than the cap.
+        """
+        total = self.total_bytes()
+        if total <= max_bytes:
+            return 0
+        with self._lock:
+            candidates = self._conn.execute(
+                "SELECT id, path, sha256, thumbnail_path, size_bytes FROM images"
+                " ORDER BY last_accessed ASC"
+            )
+            victims = []
+            for row in candidates:
+                if total <= max_bytes:
+                    break
+                if row["id"] == keep_id:
+                    continue
+                victims.append(dict(row))
+                total -= row["size_bytes"] or 0
+
+        removed = 0
+        for victim in victims:
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM images WHERE id = ?", (victim["id"],))
+                shared = victim["sha256"] and self._conn.execute(
+                    "SELECT 1 FROM images WHERE sha256 = ? LIMIT 1", (victim["sha256"],)
+                ).fetchone()
+            for path in (victim["path"], None if shared else victim["thumbnail_path"]):
+                if path and os.path.exists(path):
+                    os.remove(path)
+            removed += 1
+        return removed
+
+    # -------------------------------
+    # Reads
+    # -------------------------------
+    def find_by_cache_key(self, cache_key: str) -> Optional[Dict]:
+        """
+        Stored image for a generation key, marked as recently used.
+        Records whose file has disappeared are ignored.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM images WHERE cache_key = ? ORDER BY id DESC LIMIT 1",
+                (cache_key,)
+            ).fetchone()
+        if row is None or not os.path.exists(row["path"]):
+            return None
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE images SET last_accessed = ? WHERE id = ?",
+                (time.time(), row["id"])
+            )
+        return dict(row)
+
+    def get(self, image_id: int) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM images WHERE id = ?", (image_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list_page(self, limit: int = 12, before_id: Optional[int] = None) -> Tuple[List[Dict], Optional[int]]:
+        """
+        Newest images first. Returns (items, next_before_id); pass
+        next_before_id to get the following page, it is None on the last one.
+        """
+        query = "SELECT * FROM images"
+        params: list = []
+        if before_id is not None:
+            query += " WHERE id < ?"
+            params.append(before_id)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit + 1)
+        with self._lock:
+            rows = [dict(row) for row in self._conn.execute(query, params)]
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return rows, (rows[-1]["id"] if has_more else None)
+
+    def find_by_prompt(self, prompt: str, limit: int = 20) -> List[Dict]:
+        """
+        Images whose original or refined prompt equals `prompt`, newest first.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM images WHERE query = ? UNION SELECT * FROM images WHERE refined_query = ?"
+                " ORDER BY id DESC LIMIT ?",
+                (prompt, prompt, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def find_between(self, start: float, end: float, limit: int = 100) -> List[Dict]:
+        """
+        Images created between two unix timestamps, newest first.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM images WHERE created_at BETWEEN ? AND ? ORDER BY created_at DESC LIMIT ?",
+                (start, end, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+_image_store: Optional[ImageMetadataStore] = None
+_image_store_lock = threading.Lock()
+
+
+def get_image_store() -> ImageMetadataStore:
+    """
+    Process-wide store under IMAGE_OUTPUT_DIR. A legacy JSON metadata file
+    in that directory is imported once and renamed to *.migrated.
+    """
+    global _image_store
+    with _image_store_lock:
+        if _image_store is None:
+            store = ImageMetadataStore()
+            legacy_path = os.path.join(store.root_dir, LEGACY_METADATA_FILE)
+            if os.path.exists(legacy_path):
+                imported = store.migrate_json(legacy_path)
+                os.replace(legacy_path, legacy_path + ".migrated")
+                print(f"Imported {imported} image records from {legacy_path} ✅")
+            _image_store = store
+        return _image_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import JSON image metadata into the SQLite store")
+    parser.add_argument("paths", nargs="+", help="generated_image_metadata.json files")
+    parser.add_argument("--root", default="", help="Output root directory (default IMAGE_OUTPUT_DIR)")
+    args = parser.parse_args()
+
+    store = ImageMetadataStore(args.root)
+    for path in args.paths:
+        print(f"{path}: {store.migrate_json(path)} records imported")
+    print(f"{store.count()} images in {store.db_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,88 +1,293 @@
 import os
-import torch
-import json
-from langchain_groq import ChatGroq
-from diffusers import DiffusionPipeline
+import time
+import hashlib
+import threading
+from typing import Dict, Optional
 from dotenv import load_dotenv
-from transformers import pipeline
+
+from backend.text_to_image.generation_queue import GenerationJob, ImageGenerationWorker
+from backend.text_to_image.image_store import (
+    get_image_store,
+    file_sha256,
+    generation_key,
+    DEFAULT_CACHE_MAX_BYTES,
+)
+from backend.text_to_image.prompt_rewrite import query_rewrite, get_rewrite_service, get_rewrite_timeout
+from backend.metrics import instrument, measure
 load_dotenv()
-def get_model_pipeline(device: str = "mps"):
 
-    # "cuda" or switch to "mps" for apple devices 
-    pipe = DiffusionPipeline.from_pretrained("stable-diffusion-v1-5/stable-diffusion-v1-5", dtype=torch.bfloat16, device_map = device)
-    return pipe
+MODEL_ID = os.getenv("IMAGE_MODEL_ID", "stable-diffusion-v1-5/stable-diffusion-v1-5")
 
-from langchain.messages import HumanMessage
 
-def query_rewrite(query: str) -> str:
+# torch and diffusers are imported only when the pipeline is loaded, so
+# importing this module (e.g. for the gallery) stays cheap.
+def detect_device() -> str:
     """
-    Takes a raw user query and rewrites it into a detailed prompt suitable
-    for generating a realistic image from a text-to-image model.
+    IMAGE_DEVICE if set, else the best available of cuda, mps, cpu.
     """
-    # Load your Groq API key
-    GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-    
-    # Initialize the Groq chat model
-    llm = ChatGroq(
-        api_key=GROQ_API_KEY,
-        model="llama-3.1-8b-instant",
-        temperature=0.6
-    )
-    
-    # Instruction for the LLM to rewrite the query
-    prompt = f"""
-            You are a professional prompt engineer for text-to-image models.
-            Rewrite the user query into a concise, keyword-focused image-generation prompt.
-            Use short, clear phrases separated by commas.
-            Include only essential visual keywords such as subject, action, setting, lighting, style, and realism.
-            Avoid storytelling, explanations, or unnecessary adjectives.
-            Limit the output to 20–25 words (maximum 70 tokens).
-            Output ONLY the rewritten prompt.
-
-            User query: "{query}"
+    device = os.getenv("IMAGE_DEVICE", "")
+    if device:
+        return device
+    import torch
+    if torch.cuda.is_available():
+        return "cuda"
+    if getattr(torch.backends, "mps", None) and torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def dtype_for_device(device: str):
+    import torch
+    if device.startswith("cuda"):
+        return torch.float16
+    if device == "mps":
+        return torch.bfloat16
+    # Half precision is slow or unsupported for most CPU kernels
+    return torch.float32
+
+
+class PipelineManager:
+    """
+    Loads the diffusion pipeline once per process and shares it between
+    all sessions. `warm_up()` starts loading in a background thread;
+    `get()` waits for it (or loads synchronously if nothing started it).
+    The device is detected when loading starts, not on construction.
+    """
+
+    def __init__(self, model_id: str = MODEL_ID, device: str = ""):
+        self.model_id = model_id
+        self.device = device or os.getenv("IMAGE_DEVICE", "")
+        self.dtype = None
+        self._pipe = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._metrics = {
+            "state": "not_loaded",
+            "model_id": model_id,
+            "device": self.device,
+            "dtype": "",
+            "load_time_s": None,
+            "warmup_started_at": None,
+            "requests": 0,
+        }
+
+    def resolve_device(self) -> str:
+        if not self.device:
+            self.device = detect_device()
+        if self.dtype is None:
+            self.dtype = dtype_for_device(self.device)
+            self._metrics["device"] = self.device
+            self._metrics["dtype"] = str(self.dtype).replace("torch.", "")
+        return self.device
+
+    def _load(self):
+        self._metrics["state"] = "loading"
+        start = time.perf_counter()
+        try:
+            from diffusers import DiffusionPipeline
+            self.resolve_device()
+            pipe = DiffusionPipeline.from_pretrained(self.model_id, torch_dtype=self.dtype)
+            pipe = pipe.to(self.device)
+            if self.device == "cpu":
+                self._optimize_for_cpu(pipe)
+            pipe.set_progress_bar_config(disable=True)
+        except BaseException as exc:
+            self._metrics["state"] = "failed"
+            self._metrics["error"] = repr(exc)
+            raise
+        self._metrics["load_time_s"] = time.perf_counter() - start
+        self._metrics["state"] = "ready"
+        self._pipe = pipe
+        print(f"Diffusion pipeline loaded on {self.device} in {self._metrics['load_time_s']:.1f}s ✅")
+
+    def _optimize_for_cpu(self, pipe) -> None:
+        import torch
+        pipe.enable_attention_slicing()
+        for name in ("unet", "vae"):
+            module = getattr(pipe, name, None)
+            if module is not None:
+                module.to(memory_format=torch.channels_last)
+        torch.set_num_threads(os.cpu_count() or 1)
+        if os.getenv("IMAGE_TORCH_COMPILE", "0") == "1" and hasattr(torch, "compile"):
+            pipe.unet = torch.compile(pipe.unet)
+
+    def warm_up(self) -> None:
         """
+        Start loading in the background. Safe to call on every rerun.
+        """
+        with self._lock:
+            if self._pipe is not None or self._thread is not None:
+                return
+            self._metrics["warmup_started_at"] = time.time()
+            self._thread = threading.Thread(target=self._warm_up, name="diffusion-warmup", daemon=True)
+            self._thread.start()
 
-    # Get the rewritten query from the model
-    response = llm.invoke([HumanMessage(content=prompt)])
-    
-    # Extract text from the response
-    rewritten_query = response.content
-    
-    return rewritten_query
-def load_history(history_path: str):
-    if os.path.exists(history_path):
+    def _warm_up(self) -> None:
         try:
-            with open(history_path, "r") as f:
-                return json.load(f)
-        except Exception:
-            return []
-    return []
+            with self._lock:
+                if self._pipe is None:
+                    self._load()
+        except BaseException as exc:
+            print(f"Diffusion pipeline warm-up failed: {exc}")
 
-def save_history(history, history_path: str):
-    os.makedirs(os.path.dirname(history_path), exist_ok=True)
-    with open(history_path, "w") as f:
-        json.dump(history, f, indent=2)
+    def get(self):
+        """
+        Return the shared pipeline, loading it if needed.
+        """
+        self._metrics["requests"] += 1
+        if self._pipe is not None:
+            return self._pipe
+        with self._lock:
+            if self._pipe is None:
+                self._load()
+        return self._pipe
 
-def generate_image(query, pipeline):
-    
-    rewritten_query = query_rewrite(query)
-    result = pipeline(rewritten_query)
+    def is_ready(self) -> bool:
+        return self._pipe is not None
 
-    # For Stable Diffusion / Diffusers pipelines
-    image = result.images[0]
-    image_path = f"/Users/mdarifulislamshakil/MyProjects/ai-khichuri/backend/text_to_image/outputs/generated_images/{os.urandom(16).hex()}.jpg"
-    history_path = "/Users/mdarifulislamshakil/MyProjects/ai-khichuri/backend/text_to_image/outputs/generated_image_metadata.json"
+    def metrics(self) -> Dict:
+        return dict(self._metrics)
+
+
+_pipeline_manager: Optional[PipelineManager] = None
+_pipeline_manager_lock = threading.Lock()
+
+
+def get_pipeline_manager() -> PipelineManager:
+    global _pipeline_manager
+    with _pipeline_manager_lock:
+        if _pipeline_manager is None:
+            _pipeline_manager = PipelineManager()
+        return _pipeline_manager
+
+
+def get_model_pipeline(device: str = ""):
+    """
+    Return the process-wide diffusion pipeline.
+    Passing a device other than the detected one loads a separate, unshared pipeline.
+    """
+    manager = get_pipeline_manager()
+    if device and device != manager.resolve_device():
+        return PipelineManager(device=device).get()
+    return manager.get()
+
+@instrument("image.save")
+def save_generated_image(image, query: str, rewritten_query: str, params: Optional[Dict] = None) -> Dict:
+    """
+    Save the image and its thumbnail under the output root and append its
+    metadata record.
+    """
+    store = get_image_store()
+    image_path = store.new_image_path()
     image.save(image_path)
+    sha256 = file_sha256(image_path)
     new_object = {
         "path": image_path,
         "query": query,
-        "refined_query" : rewritten_query
+        "refined_query" : rewritten_query,
+        "sha256": sha256,
+        "thumbnail_path": store.create_thumbnail(image, sha256)
     }
-    history = load_history(history_path)
-    history.append(new_object)
-    save_history(history, history_path)
+    if params:
+        new_object.update(params)
+    record = store.append(new_object)
+    store.evict_to_fit(int(os.getenv("IMAGE_CACHE_MAX_BYTES", DEFAULT_CACHE_MAX_BYTES)), keep_id=record["id"])
+    return record
+
+def generate_image(query, pipeline):
     
-    return history
+    rewritten_query = get_rewrite_service().rewrite(query)
+    with measure("diffusion.generate"):
+        result = pipeline(rewritten_query)
+
+    # For Stable Diffusion / Diffusers pipelines
+    image = result.images[0]
+    return save_generated_image(image, query, rewritten_query)
+
+
+# -------------------------------
+# Queued generation
+# -------------------------------
+_generation_worker: Optional[ImageGenerationWorker] = None
+_generation_worker_lock = threading.Lock()
+
+
+def _save_job(job: GenerationJob):
+    return save_generated_image(
+        job.image,
+        job.metadata.get("query", job.prompt),
+        job.prompt,
+        {
+            "seed": job.seed,
+            "num_inference_steps": job.num_inference_steps,
+            "height": job.height,
+            "width": job.width,
+            "guidance_scale": job.guidance_scale,
+            "cache_key": job.metadata.get("cache_key"),
+        }
+    )
+
+
+def default_seed(prompt: str) -> int:
+    """
+    Seed derived from the prompt, so the same prompt gives the same image.
+    """
+    return int(hashlib.sha256(prompt.encode()).hexdigest()[:8], 16)
+
+
+def get_generation_worker() -> ImageGenerationWorker:
+    """
+    Process-wide worker that micro-batches queued prompts on the shared pipeline.
+    Batch size and wait time come from IMAGE_MAX_BATCH_SIZE and IMAGE_MAX_BATCH_WAIT.
+    """
+    global _generation_worker
+    with _generation_worker_lock:
+        if _generation_worker is None:
+            _generation_worker = ImageGenerationWorker(
+                pipeline_factory=get_pipeline_manager().get,
+                max_batch_size=int(os.getenv("IMAGE_MAX_BATCH_SIZE", "4")),
+                max_wait=float(os.getenv("IMAGE_MAX_BATCH_WAIT", "0.2")),
+                on_complete=_save_job,
+            )
+        return _generation_worker
+
+
+def submit_generation(query: str, **params) -> GenerationJob:
+    """
+    Rewrite the query and queue it for generation. Returns a job handle the
+    UI can poll; when it is done, job.result holds the saved image record.
+    params: num_inference_steps, height, width, seed, guidance_scale.
+    Without a seed (None), one is derived from the refined prompt; 0 is a
+    valid seed. A request identical to an earlier one returns the stored
+    image without generating, so pass a new seed to get a new image.
+    """
+    service = get_rewrite_service()
+    # Start the rewrite first so the LLM call overlaps with pipeline loading
+    service.rewrite_async(query)
+    manager = get_pipeline_manager()
+    manager.warm_up()
+    rewritten_query, source = service.rewrite_with_fallback(query, timeout=get_rewrite_timeout())
+
+    seed = params.get("seed")
+    if seed is None:
+        seed = default_seed(rewritten_query)
+    job = GenerationJob(
+        rewritten_query,
+        **{name: value for name, value in params.items() if name != "seed"},
+        seed=seed,
+        metadata={"query": query, "rewrite_source": source}
+    )
+    cache_key = generation_key(
+        manager.model_id, job.prompt, job.seed, job.num_inference_steps,
+        job.guidance_scale, job.height, job.width
+    )
+    job.metadata["cache_key"] = cache_key
+
+    worker = get_generation_worker()
+    cached = get_image_store().find_by_cache_key(cache_key)
+    if cached is not None:
+        return worker.add_completed(job, cached)
+    return worker.submit_job(job)
 
 if __name__ == "__main__":
     user_query = "a beautifull flower garden, bee, birds and so on"
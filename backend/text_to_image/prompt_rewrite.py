@@ -0,0 +1,207 @@
+"""
+Cached, asynchronous prompt rewriting for text-to-image.
+
+A raw user query is rewritten by an LLM into a keyword-style image prompt.
+Results are cached in memory (LRU) and on disk (SQLite), keyed by the
+normalized query and the rewrite parameters, so repeat generations and
+"Re-Generate" never call the LLM again. Rewrites run in a thread pool;
+`rewrite_with_fallback` waits up to a timeout and otherwise returns the
+raw query, letting the rewrite overlap with pipeline warm-up.
+
+    PROMPT_REWRITE_CACHE_PATH   SQLite file (default <IMAGE_OUTPUT_DIR>/prompt_rewrite_cache.sqlite3)
+    PROMPT_REWRITE_TIMEOUT      seconds to wait before using the raw query (default 10)
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+from langchain.messages import HumanMessage
+
+from backend.basic_chat.chat_model import get_chat_model
+from backend.metrics import instrument
+from backend.text_to_image.image_store import get_output_root
+
+load_dotenv()
+
+REWRITE_PARAMS = {
+    "provider": "groq",
+    "model_name": "llama-3.1-8b-instant",
+    "temperature": 0.6,
+    # Bump when the instruction below changes, so old rewrites are not reused
+    "prompt_version": 1,
+}
+
+REWRITE_PROMPT = """
+            You are a professional prompt engineer for text-to-image models.
+            Rewrite the user query into a concise, keyword-focused image-generation prompt.
+            Use short, clear phrases separated by commas.
+            Include only essential visual keywords such as subject, action, setting, lighting, style, and realism.
+            Avoid storytelling, explanations, or unnecessary adjectives.
+            Limit the output to 20–25 words (maximum 70 tokens).
+            Output ONLY the rewritten prompt.
+
+            User query: "{query}"
+        """
+
+
+@instrument("image.query_rewrite", payload=len)
+def query_rewrite(query: str) -> str:
+    """
+    Takes a raw user query and rewrites it into a detailed prompt suitable
+    for generating a realistic image from a text-to-image model.
+    Always calls the LLM; use get_rewrite_service() for the cached version.
+    """
+    llm = get_chat_model(
+        provider=REWRITE_PARAMS["provider"],
+        api_key=os.getenv("GROQ_API_KEY", ""),
+        model_name=REWRITE_PARAMS["model_name"],
+        temperature=REWRITE_PARAMS["temperature"],
+    )
+    response = llm.invoke([HumanMessage(content=REWRITE_PROMPT.format(query=query))])
+    return response.content.strip()
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+def rewrite_key(query: str, params: Dict = REWRITE_PARAMS) -> str:
+    payload = json.dumps([normalize_query(query), sorted(params.items())])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class RewriteCache:
+    """
+    In-memory LRU in front of a SQLite table shared by all processes.
+    """
+
+    def __init__(self, path: str, max_memory_entries: int = 1024):
+        self.max_memory_entries = max_memory_entries
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rewrites (key TEXT PRIMARY KEY, query TEXT, rewritten TEXT, created_at REAL)"
+        )
+        self._conn.commit()
+
+    def _remember(self, key: str, rewritten: str) -> None:
+        self._memory[key] = rewritten
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+            row = self._conn.execute("SELECT rewritten FROM rewrites WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._remember(key, row[0])
+            return row[0]
+
+    def set(self, key: str, query: str, rewritten: str) -> None:
+        with self._lock:
+            self._remember(key, rewritten)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO rewrites VALUES (?, ?, ?, ?)",
+                (key, query, rewritten, time.time())
+            )
+            self._conn.commit()
+
+
+class RewriteService:
+    def __init__(self, cache: RewriteCache, max_workers: int = 4):
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prompt-rewrite")
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "llm_calls": 0, "fallbacks": 0}
+
+    def _rewrite(self, key: str, query: str) -> str:
+        try:
+            self.stats["llm_calls"] += 1
+            rewritten = query_rewrite(query)
+            if rewritten:
+                self.cache.set(key, query, rewritten)
+            return rewritten or query
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _start(self, key: str, query: str) -> Future:
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._executor.submit(self._rewrite, key, query)
+                self._in_flight[key] = future
+            return future
+
+    def rewrite_async(self, query: str) -> Future:
+        """
+        Start (or join) the rewrite of `query`; cached results resolve immediately.
+        """
+        key = rewrite_key(query)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            future = Future()
+            future.set_result(cached)
+            return future
+        return self._start(key, query)
+
+    def rewrite(self, query: str) -> str:
+        return self.rewrite_async(query).result()
+
+    def rewrite_with_fallback(self, query: str, timeout: Optional[float] = None) -> Tuple[str, str]:
+        """
+        Return (prompt, source) where source is "cache"/"llm", or "raw" when
+        the rewrite failed or took longer than `timeout` seconds. A rewrite
+        that times out keeps running and is cached for the next request.
+        """
+        key = rewrite_key(query)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached, "cache"
+        try:
+            return self._start(key, query).result(timeout=timeout), "llm"
+        except TimeoutError:
+            self.stats["fallbacks"] += 1
+            return query, "raw"
+        except Exception as exc:
+            print(f"Prompt rewrite failed, using the raw query: {exc}")
+            self.stats["fallbacks"] += 1
+            return query, "raw"
+
+
+_rewrite_service: Optional[RewriteService] = None
+_rewrite_service_lock = threading.Lock()
+
+
+def get_rewrite_service() -> RewriteService:
+    global _rewrite_service
+    with _rewrite_service_lock:
+        if _rewrite_service is None:
+            path = os.getenv(
+                "PROMPT_REWRITE_CACHE_PATH",
+                os.path.join(get_output_root(), "prompt_rewrite_cache.sqlite3")
+            )
+            _rewrite_service = RewriteService(RewriteCache(path))
+        return _rewrite_service
+
+
+def get_rewrite_timeout() -> float:
+    return float(os.getenv("PROMPT_REWRITE_TIMEOUT", "10"))
@@ -0,0 +1,65 @@
+"""
+Cost of opening a chat and of its first turn, full history vs. window.
+
+For conversations of 50 to 5,000 messages, times loading the whole
+history (get_conversation_history) against the windowed load the chat
+page uses (the newest CHAT_HISTORY_WINDOW messages), and the context
+preparation of the first turn on that window (fill_context_window plus
+build_context). With the window, both stay flat as the chat grows on a
+real mongod; mongomock has no indexes and scans every message, so use
+--uri for meaningful numbers.
+
+    python -m benchmarks.chat_window
+    python -m benchmarks.chat_window --uri mongodb://localhost:27017
+"""
+import argparse
+import random
+import time
+
+from backend.basic_chat.basic_chat_pipeline import ChatPipeline, HISTORY_WINDOW_SIZE
+from benchmarks.fake_chat_model import FakeChatModel
+from benchmarks.history_writes import get_database, reset, USER_NAME
+from benchmarks.suite import FakeModelPipeline, seed_conversation
+
+SIZES = [50, 500, 5_000]
+
+
+def timed(function, repeats: int) -> tuple:
+    # (mean seconds per call, last result)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = function()
+    return (time.perf_counter() - start) / repeats, result
+
+
+def first_turn(pipeline: ChatPipeline, conversation_id: str):
+    messages, first_seq = pipeline.load_window(USER_NAME, conversation_id)
+    first_seq = pipeline.fill_context_window(USER_NAME, conversation_id, messages, first_seq)
+    return pipeline.build_context(conversation_id, messages, first_seq)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--uri", default="", help="MongoDB URI (mongomock if empty)")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    db = get_database(args.uri)
+    pipeline = FakeModelPipeline(db, FakeChatModel(model_name="llama-3.1-8b-instant"), use_response_cache=False)
+
+    print(f"window: {HISTORY_WINDOW_SIZE} messages")
+    print(f"{'messages':>8} | {'full load ms':>12} {'window ms':>9} {'first turn ms':>13} {'context msgs':>12}")
+    for size in SIZES:
+        reset(db)
+        conversation_id = seed_conversation(db, USER_NAME, size, random.Random(size))
+        full_s, _ = timed(lambda: pipeline.load_history(USER_NAME, conversation_id), args.repeats)
+        window_s, _ = timed(lambda: pipeline.load_window(USER_NAME, conversation_id), args.repeats)
+        turn_s, context = timed(lambda: first_turn(pipeline, conversation_id), args.repeats)
+        print(
+            f"{size:>8} | {full_s * 1000:>12.2f} {window_s * 1000:>9.2f} "
+            f"{turn_s * 1000:>13.2f} {len(context):>12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
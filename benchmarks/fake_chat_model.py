@@ -0,0 +1,85 @@
+"""
+Offline stand-in for the LangChain chat models returned by get_chat_model.
+
+It needs no network or API key and supports invoke/stream and their async
+versions, with optional delays and injected failures to mimic a remote
+provider. Benchmarks inject it through FakeModelPipeline (see suite.py).
+"""
+import asyncio
+import random
+import time
+from typing import AsyncIterator, Iterator, List, Optional
+
+from langchain.messages import AIMessage, AIMessageChunk
+
+
+class FakeChatModel:
+    def __init__(
+        self,
+        model_name: str = "fake-echo",
+        response: Optional[str] = None,
+        first_token_delay: float = 0.0,
+        token_delay: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        """
+        response: fixed reply; by default the last message is echoed back.
+        first_token_delay / token_delay: seconds to sleep before the first
+        token and between tokens.
+        failure_rate: probability that a call raises RuntimeError.
+        """
+        self.model_name = model_name
+        self.response = response
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    def _start_call(self) -> None:
+        self.calls += 1
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            raise RuntimeError(f"{self.model_name}: injected failure")
+
+    def _reply(self, messages: List) -> str:
+        if self.response is not None:
+            return self.response
+        last = messages[-1] if messages else None
+        content = getattr(last, "content", "") if last is not None else ""
+        return f"Echo: {content}"
+
+    def _tokens(self, text: str) -> List[str]:
+        words = text.split(" ")
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+    def _total_delay(self, reply: str) -> float:
+        return self.first_token_delay + self.token_delay * len(self._tokens(reply))
+
+    def invoke(self, messages: List, **kwargs) -> AIMessage:
+        self._start_call()
+        reply = self._reply(messages)
+        time.sleep(self._total_delay(reply))
+        return AIMessage(content=reply)
+
+    def stream(self, messages: List, **kwargs) -> Iterator[AIMessageChunk]:
+        self._start_call()
+        time.sleep(self.first_token_delay)
+        for i, token in enumerate(self._tokens(self._reply(messages))):
+            if i and self.token_delay:
+                time.sleep(self.token_delay)
+            yield AIMessageChunk(content=token)
+
+    async def ainvoke(self, messages: List, **kwargs) -> AIMessage:
+        self._start_call()
+        reply = self._reply(messages)
+        await asyncio.sleep(self._total_delay(reply))
+        return AIMessage(content=reply)
+
+    async def astream(self, messages: List, **kwargs) -> AsyncIterator[AIMessageChunk]:
+        self._start_call()
+        await asyncio.sleep(self.first_token_delay)
+        for i, token in enumerate(self._tokens(self._reply(messages))):
+            if i and self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            yield AIMessageChunk(content=token)
@@ -0,0 +1,54 @@
+"""
+Cost of opening one chat as the number of conversations per user grows.
+
+    python -m benchmarks.history_reads
+    python -m benchmarks.history_reads --uri mongodb://localhost:27017
+"""
+import argparse
+import time
+
+from langchain.messages import HumanMessage, AIMessage
+
+from backend.basic_chat.history_management import (
+    create_user,
+    create_new_chat,
+    append_messages_to_conversation,
+    get_conversation_history,
+)
+from benchmarks.history_writes import get_database, reset, USER_NAME
+
+CONVERSATION_COUNTS = [5, 50, 500, 5_000]
+MESSAGES_PER_CHAT = 20
+
+
+def seed_user(db, conversations: int) -> str:
+    create_user(USER_NAME, db)
+    turn = [HumanMessage(content="How are you?"), AIMessage(content="Fine, thanks. " * 10)]
+    conversation_id = ""
+    for _ in range(conversations):
+        conversation_id = create_new_chat(USER_NAME, db, title="bench")
+        for start_seq in range(1, MESSAGES_PER_CHAT, 2):
+            append_messages_to_conversation(USER_NAME, conversation_id, turn, start_seq, db)
+    return conversation_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--uri", default="", help="MongoDB URI (mongomock if empty)")
+    parser.add_argument("--reads", type=int, default=50)
+    args = parser.parse_args()
+
+    db = get_database(args.uri)
+    print(f"{'conversations':>13} | {'ms/open':>8}")
+    for count in CONVERSATION_COUNTS:
+        conversation_id = seed_user(db, count)
+        start = time.perf_counter()
+        for _ in range(args.reads):
+            get_conversation_history(USER_NAME, conversation_id, db)
+        elapsed = (time.perf_counter() - start) / args.reads
+        print(f"{count:>13} | {elapsed * 1000:>8.2f}")
+        reset(db)
+
+
+if __name__ == "__main__":
+    main()
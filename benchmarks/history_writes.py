@@ -0,0 +1,126 @@
+"""
+Per-turn write cost of conversation persistence.
+
+Compares the full-list rewrite (save_message_to_conversation) against the
+append-only path (append_messages_to_conversation) while a conversation
+grows from 10 to 10,000 messages.
+
+Bytes per turn are exact on any backend. Timings need a real mongod:
+mongomock has no indexes and scans the collection on every write, so its
+append times grow with the conversation. Use --uri for meaningful numbers:
+
+    python -m benchmarks.history_writes
+    python -m benchmarks.history_writes --uri mongodb://localhost:27017
+"""
+import argparse
+import time
+
+import bson
+from langchain.messages import SystemMessage, HumanMessage, AIMessage
+
+from backend.basic_chat.history_management import (
+    ensure_indexes,
+    _message_documents,
+    create_user,
+    create_new_chat,
+    save_message_to_conversation,
+    append_messages_to_conversation,
+)
+
+SIZES = [10, 100, 1_000, 10_000]
+USER_NAME = "bench_user"
+
+
+def get_database(uri: str = ""):
+    if uri:
+        from pymongo import MongoClient
+        client = MongoClient(uri)
+    else:
+        import mongomock
+        client = mongomock.MongoClient()
+    client.drop_database("ai_khichuri_bench")
+    db = client["ai_khichuri_bench"]
+    ensure_indexes(db)
+    return db
+
+
+def reset(db):
+    for name in db.list_collection_names():
+        db[name].delete_many({})
+
+
+def build_history(size: int) -> list:
+    messages = [SystemMessage(content="You are a helpful assistant.")]
+    for i in range(1, size):
+        if i % 2:
+            messages.append(HumanMessage(content=f"Question number {i}, please answer briefly."))
+        else:
+            messages.append(AIMessage(content=f"Answer number {i}. " + "lorem ipsum " * 20))
+    return messages
+
+
+def seed_conversation(db, size: int) -> tuple:
+    create_user(USER_NAME, db)
+    conversation_id = create_new_chat(USER_NAME, db, title=f"bench {size}")
+    messages = build_history(size)
+    save_message_to_conversation(USER_NAME, conversation_id, messages, db)
+    return conversation_id, messages
+
+
+def payload_bytes(documents: list) -> int:
+    return sum(len(bson.encode(doc)) for doc in documents)
+
+
+def bench_size(db, size: int, turns: int) -> dict:
+    turn = [HumanMessage(content="One more question?"), AIMessage(content="One more answer.")]
+
+    # Full rewrite: the whole list is sent on every turn
+    conversation_id, messages = seed_conversation(db, size)
+    rewrite_bytes = rewrite_time = 0.0
+    for _ in range(turns):
+        messages.extend(turn)
+        rewrite_bytes += payload_bytes(_message_documents(conversation_id, messages, 0))
+        start = time.perf_counter()
+        save_message_to_conversation(USER_NAME, conversation_id, messages, db)
+        rewrite_time += time.perf_counter() - start
+    reset(db)
+
+    # Append-only: only the new turn is pushed
+    conversation_id, messages = seed_conversation(db, size)
+    append_bytes = append_time = 0.0
+    for _ in range(turns):
+        start_seq = len(messages)
+        messages.extend(turn)
+        append_bytes += payload_bytes(_message_documents(conversation_id, turn, start_seq))
+        start = time.perf_counter()
+        append_messages_to_conversation(USER_NAME, conversation_id, turn, start_seq, db)
+        append_time += time.perf_counter() - start
+    reset(db)
+
+    return {
+        "messages": size,
+        "rewrite_bytes": rewrite_bytes / turns,
+        "rewrite_ms": rewrite_time / turns * 1000,
+        "append_bytes": append_bytes / turns,
+        "append_ms": append_time / turns * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--uri", default="", help="MongoDB URI (mongomock if empty)")
+    parser.add_argument("--turns", type=int, default=20)
+    args = parser.parse_args()
+
+    db = get_database(args.uri)
+    print(f"{'messages':>9} | {'rewrite B/turn':>15} {'ms/turn':>9} | {'append B/turn':>14} {'ms/turn':>9}")
+    for size in SIZES:
+        row = bench_size(db, size, args.turns)
+        print(
+            f"{row['messages']:>9} | {row['rewrite_bytes']:>15.0f} {row['rewrite_ms']:>9.2f}"
+            f" | {row['append_bytes']:>14.0f} {row['append_ms']:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Images per minute of the queued generation worker at batch sizes 1/2/4/8.
+
+Uses a tiny random-weight pipeline on CPU, so it measures the queueing
+and batching overhead rather than Stable Diffusion itself.
+
+    python -m benchmarks.image_batching
+"""
+import argparse
+import time
+
+import torch
+
+from backend.text_to_image.generation_queue import ImageGenerationWorker
+from benchmarks.stubs import TinyDiffusionPipeline
+
+BATCH_SIZES = [1, 2, 4, 8]
+
+
+def run(pipeline, max_batch_size: int, images: int, steps: int, size: int) -> dict:
+    worker = ImageGenerationWorker(lambda: pipeline, max_batch_size=max_batch_size, max_wait=0.05)
+    start = time.perf_counter()
+    jobs = [
+        worker.submit(f"a red fox in the snow {i}", num_inference_steps=steps, height=size, width=size, seed=i)
+        for i in range(images)
+    ]
+    for job in jobs:
+        job.wait()
+    elapsed = time.perf_counter() - start
+    worker.stop()
+    metrics = worker.metrics()
+    return {
+        "images_per_min": images / elapsed * 60,
+        "avg_batch_size": metrics["avg_batch_size"],
+        "failed": metrics["failed"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", type=int, default=32)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--threads", type=int, default=0, help="torch CPU threads (0 = default)")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    pipeline = TinyDiffusionPipeline()
+    # Warm up kernels before timing
+    pipeline("warm up", num_inference_steps=1, height=args.size, width=args.size)
+
+    print(f"{'batch':>5} | {'images/min':>10} {'avg batch':>9}")
+    for batch_size in BATCH_SIZES:
+        row = run(pipeline, batch_size, args.images, args.steps, args.size)
+        print(f"{batch_size:>5} | {row['images_per_min']:>10.1f} {row['avg_batch_size']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
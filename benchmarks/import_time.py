@@ -0,0 +1,105 @@
+"""
+Cold-start import time of the app, from `python -X importtime`.
+
+Each path is imported in a fresh interpreter; the report sums the
+self time per top-level package and lists the slowest modules by
+cumulative time. With --max-seconds, exits with status 1 when the
+chat-only path imports slower than that, so it can guard startup time
+in CI.
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --path chat --max-seconds 3
+"""
+import argparse
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List
+
+# What the app imports for each page, on top of app.py itself
+PATHS = {
+    "app": ["app"],
+    "chat": ["app", "backend.basic_chat.chat_app"],
+    "image": ["app", "backend.text_to_image.generate_image_app"],
+    "pdf": ["app", "backend.pdf_to_text.pdf_services_app"],
+}
+
+
+def profile_imports(modules: List[str]) -> List[Dict]:
+    """
+    Import `modules` in a new interpreter and return the -X importtime rows
+    ({"module", "self_us", "cumulative_us", "depth"}) in import order.
+    """
+    code = "; ".join(f"import {module}" for module in modules)
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {modules} failed:\n{completed.stderr[-2000:]}")
+
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append({
+            "module": name.strip(),
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+            # importtime indents nested imports by two spaces per level
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+        })
+    return rows
+
+
+def summarize(rows: List[Dict], top: int = 15) -> Dict:
+    per_package = defaultdict(int)
+    for row in rows:
+        per_package[row["module"].split(".")[0]] += row["self_us"]
+    return {
+        "total_s": sum(row["self_us"] for row in rows) / 1e6,
+        "modules": len(rows),
+        "packages": sorted(per_package.items(), key=lambda item: -item[1])[:top],
+        "slowest": sorted(rows, key=lambda row: -row["cumulative_us"])[:top],
+    }
+
+
+def print_report(name: str, summary: Dict) -> None:
+    print(f"\n== {name}: {summary['total_s']:.2f}s, {summary['modules']} modules")
+    print(f"{'package':<32} {'self s':>8}")
+    for package, self_us in summary["packages"]:
+        print(f"{package:<32} {self_us / 1e6:>8.3f}")
+    print(f"\n{'module (cumulative)':<48} {'s':>8}")
+    for row in summary["slowest"]:
+        print(f"{row['module'][:48]:<48} {row['cumulative_us'] / 1e6:>8.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--path", choices=list(PATHS), action="append", help="Default: all paths")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-seconds", type=float, default=0.0,
+                        help="Fail when the chat path takes longer (0 = no cap)")
+    args = parser.parse_args()
+
+    names = args.path or list(PATHS)
+    if args.max_seconds and "chat" not in names:
+        names.append("chat")
+
+    results = {}
+    for name in names:
+        results[name] = summarize(profile_imports(PATHS[name]), args.top)
+        print_report(name, results[name])
+
+    if args.max_seconds:
+        total = results["chat"]["total_s"]
+        if total > args.max_seconds:
+            print(f"\n❌ Chat-only cold start imports take {total:.2f}s (cap {args.max_seconds:.2f}s)")
+            sys.exit(1)
+        print(f"\n✅ Chat-only cold start imports take {total:.2f}s (cap {args.max_seconds:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
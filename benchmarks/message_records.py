@@ -0,0 +1,102 @@
+"""
+CPU cost of loading and saving a 10,000-message conversation, LangChain
+messages vs. MessageRecords.
+
+    load      stored documents -> LangChain messages (convert_dict_to_conversation)
+              vs. -> MessageRecords (records_from_documents)
+    save      messages -> documents (convert_conversation_to_dict), from
+              LangChain messages vs. from MessageRecords
+    boundary  records of the model context -> LangChain, first turn vs. a
+              later turn (memoized per message id)
+
+No database is involved: this is the per-message object work that every
+chat load and save pays on top of the queries. Peak memory is measured
+with tracemalloc.
+
+    python -m benchmarks.message_records --messages 10000
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from backend.basic_chat.history_management import (
+    convert_conversation_to_dict,
+    convert_dict_to_conversation,
+)
+from backend.basic_chat.message_record import (
+    clear_langchain_cache,
+    records_from_documents,
+    to_langchain_messages,
+)
+from benchmarks.suite import random_text
+
+CONVERSATION_ID = "bench"
+CONTEXT_MESSAGES = 100
+
+
+def build_documents(size: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    documents = [{"seq": 0, "role": "system", "content": "You are a helpful assistant."}]
+    for seq in range(1, size):
+        if seq % 2:
+            documents.append({"seq": seq, "role": "user", "content": random_text(rng, 5, 40)})
+        else:
+            documents.append({"seq": seq, "role": "assistant", "content": random_text(rng, 40, 200)})
+    return documents
+
+
+def timed(function, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory(function) -> int:
+    tracemalloc.start()
+    result = function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    documents = build_documents(args.messages)
+    langchain_messages = convert_dict_to_conversation(documents)
+    records = records_from_documents(documents, CONVERSATION_ID)
+    context = [records[0]] + records[-CONTEXT_MESSAGES:]
+
+    def first_turn():
+        clear_langchain_cache()
+        to_langchain_messages(context)
+
+    rows = [
+        ("load", "LangChain", timed(lambda: convert_dict_to_conversation(documents), args.repeats),
+         peak_memory(lambda: convert_dict_to_conversation(documents))),
+        ("load", "records", timed(lambda: records_from_documents(documents, CONVERSATION_ID), args.repeats),
+         peak_memory(lambda: records_from_documents(documents, CONVERSATION_ID))),
+        ("save", "LangChain", timed(lambda: convert_conversation_to_dict(langchain_messages), args.repeats), None),
+        ("save", "records", timed(lambda: convert_conversation_to_dict(records), args.repeats), None),
+        ("boundary", "first turn", timed(first_turn, args.repeats), None),
+    ]
+    first_turn()
+    rows.append(("boundary", "memoized", timed(lambda: to_langchain_messages(context), args.repeats), None))
+
+    print(f"{args.messages} messages, model context of {len(context)}")
+    print(f"{'step':<9} {'variant':<11} | {'ms':>8} {'peak MB':>8}")
+    for step, variant, seconds, peak in rows:
+        peak_text = f"{peak / 1e6:>8.1f}" if peak is not None else f"{'':>8}"
+        print(f"{step:<9} {variant:<11} | {seconds * 1000:>8.2f} {peak_text}")
+
+
+if __name__ == "__main__":
+    main()
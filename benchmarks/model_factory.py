@@ -0,0 +1,101 @@
+"""
+Per-message overhead of building chat model clients.
+
+Starts a local OpenAI-compatible stub server, points the Groq client at it
+and compares building a new ChatGroq per message ("before") with the
+memoized get_chat_model registry ("after"). No network access needed.
+
+    python -m benchmarks.model_factory
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain.messages import HumanMessage
+
+from backend.basic_chat.chat_model import get_chat_model, clear_chat_model_cache
+
+COMPLETION = {
+    "id": "chatcmpl-stub",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "stub",
+    "choices": [
+        {"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}
+    ],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        StubHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps(COMPLETION).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(messages: int, memoized: bool) -> dict:
+    clear_chat_model_cache()
+    StubHandler.connections = 0
+    conversation = [HumanMessage(content="Hello!")]
+    setup_time = invoke_time = 0.0
+
+    for _ in range(messages):
+        if not memoized:
+            clear_chat_model_cache()
+        start = time.perf_counter()
+        model = get_chat_model("groq", "stub-key", "llama-3.1-8b-instant", 0.3)
+        built = time.perf_counter()
+        model.invoke(conversation)
+        invoke_time += time.perf_counter() - built
+        setup_time += built - start
+
+    return {
+        "setup_ms": setup_time / messages * 1000,
+        "invoke_ms": invoke_time / messages * 1000,
+        "connections": StubHandler.connections,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=100)
+    args = parser.parse_args()
+
+    server = start_stub_server()
+    os.environ["GROQ_API_BASE"] = f"http://127.0.0.1:{server.server_port}"
+
+    print(f"{'':>8} | {'setup ms/msg':>12} {'invoke ms/msg':>13} {'connections':>11}")
+    for label, memoized in (("before", False), ("after", True)):
+        row = run(args.messages, memoized)
+        print(f"{label:>8} | {row['setup_ms']:>12.2f} {row['invoke_ms']:>13.2f} {row['connections']:>11}")
+
+    clear_chat_model_cache()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
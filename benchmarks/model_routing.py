@@ -0,0 +1,62 @@
+"""
+Latency and success rate of the routing modes with fake providers.
+
+One fast but flaky provider, one slow but reliable one and one with a long
+tail; no network needed.
+
+    python -m benchmarks.model_routing
+"""
+import argparse
+import statistics
+import time
+
+from langchain.messages import HumanMessage
+
+from backend.basic_chat import model_router
+from backend.basic_chat.model_router import ModelRouter
+from benchmarks.fake_chat_model import FakeChatModel
+
+
+def build_candidates(seed: int) -> list:
+    return [
+        ("fake:flaky", FakeChatModel("flaky", response="ok", first_token_delay=0.05, failure_rate=0.3, seed=seed)),
+        ("fake:slow", FakeChatModel("slow", response="ok", first_token_delay=0.4, seed=seed)),
+        ("fake:tail", FakeChatModel("tail", response="ok", first_token_delay=1.5, seed=seed)),
+    ]
+
+
+def run(mode: str, requests: int, seed: int) -> dict:
+    model_router._health.clear()
+    router = ModelRouter(build_candidates(seed), mode=mode, timeout=1.0, hedge_delay=0.1)
+    messages = [HumanMessage(content="Hello!")]
+    latencies = []
+    failures = 0
+    for _ in range(requests):
+        start = time.perf_counter()
+        try:
+            router.invoke(messages)
+            latencies.append(time.perf_counter() - start)
+        except RuntimeError:
+            failures += 1
+    return {
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "max_ms": max(latencies) * 1000 if latencies else 0.0,
+        "success_rate": len(latencies) / requests,
+        "failures": failures,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{'mode':>8} | {'p50 ms':>8} {'max ms':>8} {'success':>8}")
+    for mode in ("fallback", "hedged", "race"):
+        row = run(mode, args.requests, args.seed)
+        print(f"{mode:>8} | {row['p50_ms']:>8.1f} {row['max_ms']:>8.1f} {row['success_rate']:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
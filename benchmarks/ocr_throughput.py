@@ -0,0 +1,100 @@
+"""
+OCR pages/sec versus worker count on synthetic scanned pages.
+
+Renders text pages with Pillow (slightly rotated, with speckle noise, like
+a scan), then runs OcrPool over them with 1, 2, 4, ... workers up to the
+available cores. The OCR result cache is disabled so every page is
+recognized. --preprocess-only skips tesseract and times only the
+preprocessing (grayscale, deskew, binarization).
+
+    python -m benchmarks.ocr_throughput --pages 16
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# Disable the result cache before the pool workers start
+os.environ["OCR_CACHE_DIR"] = ""
+
+from backend.pdf_to_text.ocr import OcrPool, available_cores, load_image, preprocess  # noqa: E402
+
+WORDS = (
+    "the quick brown fox jumps over lazy dog invoice total amount due payment "
+    "account number date reference customer address page report summary table"
+).split()
+
+
+def render_page(path: str, seed: int, width: int = 1654, height: int = 2339) -> None:
+    # A4 at 200 DPI
+    rng = random.Random(seed)
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    try:
+        font = ImageFont.truetype("DejaVuSans.ttf", 28)
+    except OSError:
+        font = ImageFont.load_default()
+    for y in range(120, height - 120, 48):
+        draw.text((120, y), " ".join(rng.choice(WORDS) for _ in range(10)), fill=0, font=font)
+    image = image.rotate(rng.uniform(-3, 3), fillcolor=255)
+
+    pixels = np.asarray(image).copy()
+    noise = np.random.default_rng(seed).random(pixels.shape) < 0.002
+    pixels[noise] = 255 - pixels[noise]
+    Image.fromarray(pixels).save(path)
+
+
+def _preprocess_file(path: str) -> int:
+    return int(preprocess(load_image(path)).mean())
+
+
+def run(paths, workers: int, preprocess_only: bool) -> dict:
+    start = time.perf_counter()
+    if preprocess_only:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(_preprocess_file, paths))
+        failed = 0
+    else:
+        stats = {}
+        with OcrPool(workers=workers) as pool:
+            for _ in pool.ocr_images(paths, stats):
+                pass
+        failed = stats["failed"]
+    elapsed = time.perf_counter() - start
+    return {"pages_per_sec": len(paths) / elapsed, "elapsed_s": elapsed, "failed": failed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=16)
+    parser.add_argument("--preprocess-only", action="store_true", help="Skip tesseract")
+    args = parser.parse_args()
+
+    cores = available_cores()
+    worker_counts = sorted({1, cores} | {n for n in (2, 4, 8, 16) if n < cores})
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = []
+        for i in range(args.pages):
+            path = os.path.join(tmp_dir, f"page_{i}.png")
+            render_page(path, seed=i)
+            paths.append(path)
+
+        print(f"{'workers':>7} | {'pages/sec':>9} {'elapsed s':>9} {'failed':>6}")
+        baseline = None
+        for workers in worker_counts:
+            row = run(paths, workers, args.preprocess_only)
+            baseline = baseline or row["pages_per_sec"]
+            print(
+                f"{workers:>7} | {row['pages_per_sec']:>9.2f} {row['elapsed_s']:>9.1f} {row['failed']:>6}"
+                f"   x{row['pages_per_sec'] / baseline:.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Local stand-ins used by the benchmarks, so they run without network access.
+"""
+import hashlib
+
+import torch
+from PIL import Image
+
+
+class _PipelineOutput:
+    def __init__(self, images):
+        self.images = images
+
+
+class TinyDiffusionPipeline(torch.nn.Module):
+    """
+    Random-weight, diffusers-shaped text-to-image pipeline.
+
+    Prompts are hashed into token embeddings, latents are denoised by a
+    small conv net for `num_inference_steps` steps and decoded to RGB, all
+    batched like StableDiffusionPipeline. Weights are random, so images are
+    noise, but the compute scales with batch size, steps and resolution.
+    """
+
+    def __init__(self, hidden: int = 64, seed: int = 0):
+        super().__init__()
+        torch.manual_seed(seed)
+        self.embedding = torch.nn.Embedding(4096, hidden)
+        self.cond = torch.nn.Linear(hidden, 4)
+        self.unet = torch.nn.Sequential(
+            torch.nn.Conv2d(4, hidden, 3, padding=1),
+            torch.nn.SiLU(),
+            torch.nn.Conv2d(hidden, hidden, 3, padding=1),
+            torch.nn.SiLU(),
+            torch.nn.Conv2d(hidden, 4, 3, padding=1),
+        )
+        self.vae = torch.nn.Sequential(
+            torch.nn.Upsample(scale_factor=8, mode="nearest"),
+            torch.nn.Conv2d(4, 3, 3, padding=1),
+            torch.nn.Tanh(),
+        )
+        self.eval()
+
+    @property
+    def device(self):
+        return next(self.parameters()).device
+
+    def _encode(self, prompts):
+        token_ids = [
+            [int(hashlib.md5(word.encode()).hexdigest(), 16) % 4096 for word in prompt.split()] or [0]
+            for prompt in prompts
+        ]
+        return torch.stack([self.embedding(torch.tensor(ids)).mean(0) for ids in token_ids])
+
+    @torch.no_grad()
+    def __call__(self, prompt, num_inference_steps=30, height=512, width=512,
+                 guidance_scale=7.5, generator=None, **kwargs):
+        prompts = [prompt] if isinstance(prompt, str) else list(prompt)
+        generators = generator if isinstance(generator, list) else [generator] * len(prompts)
+        latents = torch.stack([
+            torch.randn((4, height // 8, width // 8), generator=g) for g in generators
+        ])
+        cond = self.cond(self._encode(prompts))[:, :, None, None]
+        for _ in range(num_inference_steps):
+            latents = latents - 0.1 * self.unet(latents + cond)
+        pixels = ((self.vae(latents) + 1) * 127.5).clamp(0, 255).to(torch.uint8)
+        images = [Image.fromarray(p.permute(1, 2, 0).numpy()) for p in pixels]
+        return _PipelineOutput(images)
@@ -0,0 +1,371 @@
+"""
+Reproducible multi-user workloads with JSON results for regression comparison.
+
+Nothing needs the network or a GPU:
+
+    MongoDB    mongomock (default) or a local mongod with --uri
+    LLM        FakeChatModel with --first-token-ms, --token-ms, --reply-tokens
+    Diffusion  TinyDiffusionPipeline (random weights, CPU)
+
+Workloads (all by default, or pick some with --workload):
+
+    chat      --users users chat at the same time through ChatPipeline: half
+              continue a stored conversation of --history messages, half
+              start a new one (context building, streaming, persistence)
+    history   --users users concurrently list their chats, open a
+              conversation of --history messages and append a turn
+    image     --users users each submit prompts to the generation worker
+              and wait for their image (needs torch)
+
+Workloads, prompts and seeds are fixed by --seed, so two runs on the same
+machine do the same work. Each workload reports throughput and latency
+percentiles plus the per-operation breakdown of backend.metrics.
+
+    python -m benchmarks.suite --output baseline.json
+    python -m benchmarks.suite --output current.json --compare baseline.json
+
+With --compare, metrics that got worse by more than --tolerance (default
+20%) are listed and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from langchain.messages import HumanMessage, AIMessage
+
+from backend.basic_chat.basic_chat_pipeline import ChatPipeline, percentile, run_batch
+from backend.basic_chat.history_management import (
+    create_user,
+    create_new_chat,
+    append_messages_to_conversation,
+    get_chat_titles_page,
+    get_conversation_history,
+)
+from backend.metrics import reset as reset_metrics, snapshot
+from benchmarks.fake_chat_model import FakeChatModel
+from benchmarks.history_writes import get_database, reset
+
+WORKLOADS = ["chat", "history", "image"]
+
+WORDS = (
+    "please explain how the index works and why the query is slow when the "
+    "collection grows compare both options with an example in python and "
+    "summarize the trade offs for a small team running on one server"
+).split()
+
+
+def random_text(rng: random.Random, low: int, high: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def latency_summary(latencies: List[float]) -> Dict:
+    return {
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "p99_s": percentile(latencies, 99),
+    }
+
+
+def seed_conversation(db, user_name: str, messages: int, rng: random.Random) -> str:
+    """
+    Store a conversation of `messages` messages (system prompt included).
+    """
+    create_user(user_name, db)
+    conversation_id = create_new_chat(user_name, db, title="benchmark")
+    turns = []
+    for i in range(1, messages):
+        if i % 2:
+            turns.append(HumanMessage(content=random_text(rng, 5, 40)))
+        else:
+            turns.append(AIMessage(content=random_text(rng, 40, 200)))
+    append_messages_to_conversation(user_name, conversation_id, turns, 1, db)
+    return conversation_id
+
+
+# -------------------------------
+# Workloads
+# -------------------------------
+class FakeModelPipeline(ChatPipeline):
+    """
+    ChatPipeline answering with one shared FakeChatModel instead of a
+    provider client.
+    """
+
+    def __init__(self, db, model: FakeChatModel, **kwargs):
+        super().__init__(db, provider="fake", model_name=model.model_name, api_key="", **kwargs)
+        self.model = model
+
+    def get_base_model(self):
+        return self.model
+
+
+def run_chat(db, args, rng: random.Random) -> Dict:
+    model = FakeChatModel(
+        model_name="llama-3.1-8b-instant",
+        response=" ".join(["token"] * args.reply_tokens),
+        first_token_delay=args.first_token_ms / 1000,
+        token_delay=args.token_ms / 1000,
+    )
+    pipeline = FakeModelPipeline(db, model, use_response_cache=args.response_cache)
+
+    requests = []
+    for u in range(args.users):
+        user_name = f"chat_user_{u}"
+        request = {"user_name": user_name}
+        if u % 2 == 0:
+            request["conversation_id"] = seed_conversation(db, user_name, args.history, rng)
+        for _ in range(args.turns):
+            requests.append(dict(request, message=random_text(rng, 5, 40), line=len(requests) + 1))
+
+    outcome = run_batch(pipeline, requests, concurrency=args.users)
+    report = outcome["report"]
+    ttft = [r["time_to_first_token"] for r in outcome["results"] if "error" not in r]
+    return {
+        "turns": report["requests"],
+        "failed": report["failed"],
+        "elapsed_s": report["elapsed_s"],
+        "turns_per_sec": report["throughput_rps"],
+        **latency_summary([r["latency_s"] for r in outcome["results"] if "error" not in r]),
+        "p50_first_token_s": percentile(ttft, 50),
+        "p95_first_token_s": percentile(ttft, 95),
+    }
+
+
+def _history_user(db, user_name: str, conversation_id: str, turns: int, seed: int) -> Dict[str, List[float]]:
+    rng = random.Random(seed)
+    timings = {"list": [], "open": [], "append": []}
+    for _ in range(turns):
+        start = time.perf_counter()
+        get_chat_titles_page(user_name, db)
+        timings["list"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        messages = get_conversation_history(user_name, conversation_id, db)
+        timings["open"].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        append_messages_to_conversation(
+            user_name,
+            conversation_id,
+            [HumanMessage(content=random_text(rng, 5, 40)), AIMessage(content=random_text(rng, 40, 200))],
+            len(messages),
+            db
+        )
+        timings["append"].append(time.perf_counter() - start)
+    return timings
+
+
+def run_history(db, args, rng: random.Random) -> Dict:
+    users = []
+    for u in range(args.users):
+        user_name = f"history_user_{u}"
+        conversation_id = seed_conversation(db, user_name, args.history, rng)
+        # Other chats in the sidebar
+        for _ in range(args.chats_per_user - 1):
+            create_new_chat(user_name, db, title="older chat")
+        users.append((user_name, conversation_id, rng.randrange(2**32)))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as executor:
+        per_user = list(executor.map(
+            lambda user: _history_user(db, user[0], user[1], args.turns, user[2]),
+            users
+        ))
+    elapsed = time.perf_counter() - start
+
+    result = {"turns": args.users * args.turns, "elapsed_s": elapsed}
+    result["turns_per_sec"] = result["turns"] / elapsed if elapsed else 0.0
+    for name in ("list", "open", "append"):
+        latencies = [value for timings in per_user for value in timings[name]]
+        result[f"p50_{name}_s"] = percentile(latencies, 50)
+        result[f"p95_{name}_s"] = percentile(latencies, 95)
+    return result
+
+
+def run_image(db, args, rng: random.Random) -> Dict:
+    try:
+        import torch
+    except ImportError:
+        return {"skipped": "torch is not installed"}
+    from backend.text_to_image.generation_queue import ImageGenerationWorker
+    from benchmarks.stubs import TinyDiffusionPipeline
+
+    torch.manual_seed(args.seed)
+    pipeline = TinyDiffusionPipeline(seed=args.seed)
+    # Warm up kernels before timing
+    pipeline("warm up", num_inference_steps=1, height=args.image_size, width=args.image_size)
+    worker = ImageGenerationWorker(lambda: pipeline, max_batch_size=args.image_batch_size)
+
+    prompts = [
+        [random_text(rng, 4, 12) for _ in range(args.images_per_user)]
+        for _ in range(args.users)
+    ]
+
+    def user_session(user_prompts: List[str]) -> List[float]:
+        # One image at a time, like a user waiting on the page
+        latencies = []
+        for i, prompt in enumerate(user_prompts):
+            start = time.perf_counter()
+            job = worker.submit(
+                prompt,
+                num_inference_steps=args.image_steps,
+                height=args.image_size,
+                width=args.image_size,
+                seed=i
+            )
+            job.wait()
+            if job.status == "done":
+                latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as executor:
+        latencies = [value for user in executor.map(user_session, prompts) for value in user]
+    elapsed = time.perf_counter() - start
+    metrics = worker.metrics()
+    worker.stop()
+
+    images = args.users * args.images_per_user
+    return {
+        "images": images,
+        "failed": images - len(latencies),
+        "elapsed_s": elapsed,
+        "images_per_min": len(latencies) / elapsed * 60 if elapsed else 0.0,
+        "avg_batch_size": metrics["avg_batch_size"],
+        **latency_summary(latencies),
+    }
+
+
+RUNNERS = {"chat": run_chat, "history": run_history, "image": run_image}
+
+
+# -------------------------------
+# Results
+# -------------------------------
+def environment() -> Dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run_suite(args) -> Dict:
+    db = get_database(args.uri)
+    results = {"environment": environment(), "config": vars(args).copy(), "workloads": {}}
+    for name in args.workload or WORKLOADS:
+        reset(db)
+        reset_metrics()
+        summary = RUNNERS[name](db, args, random.Random(args.seed))
+        results["workloads"][name] = {"summary": summary, "operations": snapshot()}
+    return results
+
+
+def higher_is_better(metric: str) -> bool:
+    return metric.endswith(("_per_sec", "_per_min", "avg_batch_size"))
+
+
+def compare(baseline: Dict, current: Dict, tolerance: float) -> List[Dict]:
+    """
+    One row per summary metric present in both runs; `regressed` is True
+    when it got worse by more than `tolerance` (a fraction).
+    """
+    rows = []
+    for workload, result in current["workloads"].items():
+        old_summary = baseline.get("workloads", {}).get(workload, {}).get("summary", {})
+        for metric, value in result["summary"].items():
+            old = old_summary.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                continue
+            if metric in ("turns", "images"):
+                continue
+            change = (value - old) / old if old else (0.0 if value == old else float("inf"))
+            worse = -change if higher_is_better(metric) else change
+            rows.append({
+                "workload": workload,
+                "metric": metric,
+                "baseline": old,
+                "current": value,
+                "change": change,
+                "regressed": worse > tolerance,
+            })
+    return rows
+
+
+def print_summary(results: Dict) -> None:
+    for name, result in results["workloads"].items():
+        print(f"\n== {name}")
+        for metric, value in result["summary"].items():
+            print(f"{metric:<22} {value:>12.4f}" if isinstance(value, float) else f"{metric:<22} {value:>12}")
+
+
+def print_comparison(rows: List[Dict]) -> None:
+    print(f"\n{'workload':<8} {'metric':<22} {'baseline':>10} {'current':>10} {'change':>8}")
+    for row in rows:
+        flag = "  ❌" if row["regressed"] else ""
+        print(
+            f"{row['workload']:<8} {row['metric']:<22} {row['baseline']:>10.4f} "
+            f"{row['current']:>10.4f} {row['change']:>+8.1%}{flag}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workload", choices=WORKLOADS, action="append", help="Default: all workloads")
+    parser.add_argument("--uri", default="", help="MongoDB URI (mongomock if empty)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--users", type=int, default=8, help="Concurrent users per workload")
+    parser.add_argument("--turns", type=int, default=10, help="Chat turns per user")
+    parser.add_argument("--history", type=int, default=200, help="Messages in a stored conversation")
+    parser.add_argument("--chats-per-user", type=int, default=20)
+    parser.add_argument("--first-token-ms", type=float, default=200.0)
+    parser.add_argument("--token-ms", type=float, default=5.0)
+    parser.add_argument("--reply-tokens", type=int, default=100)
+    parser.add_argument("--response-cache", action="store_true", help="Keep the chat response cache on")
+    parser.add_argument("--images-per-user", type=int, default=2)
+    parser.add_argument("--image-steps", type=int, default=10)
+    parser.add_argument("--image-size", type=int, default=256)
+    parser.add_argument("--image-batch-size", type=int, default=4)
+    parser.add_argument("--output", default="", help="Write the results to this JSON file")
+    parser.add_argument("--compare", default="", help="Baseline JSON file from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before failing")
+    args = parser.parse_args()
+
+    results = run_suite(args)
+    print_summary(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✅ Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        rows = compare(baseline, results, args.tolerance)
+        print_comparison(rows)
+        regressions = [row for row in rows if row["regressed"]]
+        if regressions:
+            print(f"\n❌ {len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+        print(f"\n✅ No metric regressed by more than {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()